@@ -0,0 +1,270 @@
+""" Pyragit benchmarks
+
+Generates a synthetic bare repository and measures the hot paths of the
+app: traversal, last commit lookups, markup rendering, blob serving and
+complete WSGI requests. The results are written as JSON, two result files
+can be compared.
+
+    python benchmarks/run.py --commits 1000 --output new.json
+    python benchmarks/run.py --compare old.json new.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+import pygit2
+import webtest
+from pyramid.scripting import prepare
+
+import pyragit
+from pyragit.views import blob
+
+CODE_BLOCK = """
+```python
+def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+```
+"""
+
+SIGNATURE = pygit2.Signature("Benchmark", "benchmark@example.com", 0, 0)
+
+
+def markdown_text(rnd, size):
+    """a markdown document of roughly size characters"""
+    parts = [f"Document {rnd.randrange(10**6)}\n=================\n"]
+    while sum(len(part) for part in parts) < size:
+        words = (f"word{rnd.randrange(1000)}" for _ in range(60))
+        parts.append(" ".join(words) + "\n")
+        if rnd.random() < 0.3:
+            parts.append(CODE_BLOCK)
+    return "\n".join(parts)
+
+
+def folder_paths(depth, folders_per_level=2):
+    """all folder paths of a tree with a given depth"""
+    paths = [""]
+    current = [""]
+    for level in range(depth):
+        current = [
+            f"{parent}folder-{level}-{i}/"
+            for parent in current
+            for i in range(folders_per_level)
+        ]
+        paths.extend(current)
+    return paths
+
+
+def write_tree(repo, files):
+    """write the nested trees for a dictionary mapping paths to blob ids"""
+    nested = {}
+    for path, oid in files.items():
+        *folders, name = path.split("/")
+        node = nested
+        for folder in folders:
+            node = node.setdefault(folder, {})
+        node[name] = oid
+
+    def build(node):
+        builder = repo.TreeBuilder()
+        for name, value in node.items():
+            if isinstance(value, dict):
+                builder.insert(name, build(value), pygit2.GIT_FILEMODE_TREE)
+            else:
+                builder.insert(name, value, pygit2.GIT_FILEMODE_BLOB)
+        return builder.write()
+
+    return build(nested)
+
+
+def generate_repository(path, commits, depth, files, markdown_size, seed=0):
+    """create a bare repository with a synthetic history
+
+    Every folder contains an index document, some markdown documents and an
+    image. Each commit changes one of the files.
+    """
+    rnd = random.Random(seed)
+    repo = pygit2.init_repository(path, bare=True)
+    tree_files = {}
+    for folder in folder_paths(depth):
+        tree_files[f"{folder}index.md"] = None
+        tree_files[f"{folder}image.png"] = None
+        for i in range(files):
+            tree_files[f"{folder}document-{i}.md"] = None
+    image = repo.create_blob(bytes(rnd.randrange(256) for _ in range(65536)))
+    for name in tree_files:
+        if name.endswith(".png"):
+            tree_files[name] = image
+        else:
+            text = markdown_text(rnd, markdown_size)
+            tree_files[name] = repo.create_blob(text.encode("utf-8"))
+
+    names = sorted(tree_files)
+    markdown_names = [name for name in names if name.endswith(".md")]
+    parents = []
+    for i in range(commits):
+        if i > 0:
+            name = rnd.choice(markdown_names)
+            text = markdown_text(rnd, markdown_size)
+            tree_files[name] = repo.create_blob(text.encode("utf-8"))
+        tree = write_tree(repo, tree_files)
+        signature = pygit2.Signature(SIGNATURE.name, SIGNATURE.email, i, 0)
+        commit = repo.create_commit(
+            "refs/heads/master", signature, signature, f"{i}", tree, parents
+        )
+        parents = [commit]
+    return repo
+
+
+def measure(func, setup=None, repeat=20):
+    """time a function, setup is called before each run and not measured"""
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument)
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(repo_path, deep_path, repeat):
+    """run all benchmarks against an app serving a repository"""
+    results = {}
+    # "plain" runs without history index and without keeping rendered
+    # documents, "cached" uses the default settings
+    configurations = {
+        "plain": {
+            "pyragit.history_index": "false",
+            "pyragit.render_cache.size": "0",
+        },
+        "cached": {},
+    }
+    for label, extra in configurations.items():
+        settings = {"pyragit.repository_path": repo_path, **extra}
+        app = pyragit.main({}, **settings)
+        registry = app.registry
+
+        def new_root():
+            env = prepare(registry=registry)
+            env["closer"]()
+            return env["root"]
+
+        def traverse(root):
+            resource = root
+            for name in deep_path.split("/"):
+                resource = resource[name]
+            return resource
+
+        def deep_resource():
+            return traverse(new_root())
+
+        def image_resource():
+            folder = traverse(new_root()).__parent__
+            return folder["image.png"]
+
+        def serve_blob(resource):
+            response = blob(resource, resource.request)
+            b"".join(response.app_iter)
+
+        results[f"{label}.traversal"] = measure(traverse, new_root, repeat)
+        results[f"{label}.last_commit"] = measure(
+            lambda r: r.last_commit, deep_resource, repeat
+        )
+        results[f"{label}.render"] = measure(
+            lambda r: r.render(), deep_resource, repeat
+        )
+        results[f"{label}.blob"] = measure(serve_blob, image_resource, repeat)
+
+        testapp = webtest.TestApp(app)
+        results[f"{label}.wsgi_markup"] = measure(
+            lambda _: testapp.get(f"/{deep_path}"), repeat=repeat
+        )
+        folder_path = deep_path.rpartition("/")[0]
+        results[f"{label}.wsgi_folder"] = measure(
+            lambda _: testapp.get(f"/{folder_path}/"), repeat=repeat
+        )
+        results[f"{label}.wsgi_blob"] = measure(
+            lambda _: testapp.get(f"/{folder_path}/image.png"), repeat=repeat
+        )
+    return results
+
+
+def compare(old_path, new_path):
+    """print the median timings of two result files side by side"""
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old = json.load(old_file)["results"]
+        new = json.load(new_file)["results"]
+    print(f"{'benchmark':<24} {'old':>10} {'new':>10} {'ratio':>8}")
+    for name in sorted(set(old) & set(new)):
+        old_median = old[name]["median"] * 1000
+        new_median = new[name]["median"] * 1000
+        ratio = new_median / old_median if old_median else float("nan")
+        print(
+            f"{name:<24} {old_median:>8.2f}ms {new_median:>8.2f}ms "
+            f"{ratio:>8.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--markdown-size", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    parameters = {
+        "commits": args.commits,
+        "depth": args.depth,
+        "files": args.files,
+        "markdown_size": args.markdown_size,
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        repo_path = os.path.join(tmpdir, "benchmark.git")
+        start = time.perf_counter()
+        generate_repository(repo_path, **parameters)
+        generation = time.perf_counter() - start
+        deepest = folder_paths(args.depth)[-1]
+        deep_path = f"{deepest}document-0.md"
+        results = run_benchmarks(repo_path, deep_path, args.repeat)
+
+    report = {
+        "pyragit": pyragit.__version__,
+        "python": platform.python_version(),
+        "pygit2": pygit2.__version__,
+        "parameters": parameters,
+        "generation": generation,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
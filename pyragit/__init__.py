@@ -16,6 +16,13 @@ def main(global_config, **settings):
     config.include("pyramid_jinja2")
     config.include("pyragit.resources")
     config.include("pyragit.markup")
+    config.include("pyragit.search")
+    config.include("pyragit.sitemap")
+    config.include("pyragit.warmer")
+    config.include("pyragit.pagecache")
+    config.include("pyragit.compression")
+    config.include("pyragit.fastpath")
+    config.include("pyragit.metrics")
     config.add_static_view("static", "static", cache_max_age=3600)
     config.scan()
 
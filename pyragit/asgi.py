@@ -0,0 +1,306 @@
+""" Pyragit: serving the application with an ASGI server
+
+Pyramid and pygit2 are synchronous. In ASGI mode each request is handled
+in a thread pool of limited size, the response body is also produced in
+the pool. Pages found in the page cache are answered directly on the
+event loop, so cheap requests don't queue up behind expensive ones.
+
+If more requests are pending than allowed, new requests are rejected with
+"503 Service Unavailable". Requests not started in time get a "504
+Gateway Timeout", the thread itself can not be interrupted and finishes
+its work in the background. It counts as pending until it is done. Once
+started, a response is streamed without a time limit.
+
+The event loop does not look up HEAD in the repository. It uses the HEAD
+seen by the last request handled in the pool, for at most head_max_age
+seconds. Until then, a page of the previous HEAD might be served after a
+push.
+
+An application for an ASGI server like uvicorn is created with:
+
+    from pyragit.asgi import from_config
+    app = from_config("production.ini")
+
+"""
+
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pyramid.paster import get_appsettings
+from pyramid.request import Request, apply_request_extensions
+
+
+def build_environ(scope, body):
+    """create a WSGI environment for an ASGI http scope"""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        start = len(root_path)
+        path = path[start:]
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+def encode_headers(headers):
+    """convert a list of WSGI headers to ASGI headers"""
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+async def read_body(receive):
+    """read the complete body of a request"""
+    parts = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        parts.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(parts)
+
+
+async def send_error(send, status, reason, headers=()):
+    """send a short plain text error response"""
+    body = f"{status} {reason}".encode("utf-8")
+    headers = [
+        ("Content-Type", "text/plain; charset=utf-8"),
+        ("Content-Length", str(len(body))),
+        *headers,
+    ]
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": encode_headers(headers),
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsgiApp:
+    """runs the pyragit WSGI application for an ASGI server
+
+    workers is the number of threads handling requests, max_pending the
+    number of requests that may be handled or waiting for a thread and
+    timeout the number of seconds until a response must be started.
+    head_max_age is the number of seconds the HEAD of the last request is
+    used to serve cached pages on the event loop.
+    """
+
+    def __init__(
+        self, wsgi_app, workers=8, max_pending=64, timeout=30, head_max_age=1
+    ):
+        self.wsgi_app = wsgi_app
+        self.registry = getattr(wsgi_app, "registry", None)
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="pyragit-asgi"
+        )
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.head_max_age = head_max_age
+        self.pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported scope type {scope['type']}")
+
+        environ = build_environ(scope, await read_body(receive))
+        response = self.cached_response(environ)
+        if response is not None:
+            await self.send_cached(send, response, environ)
+            return
+
+        if self.pending >= self.max_pending:
+            headers = [("Retry-After", "1")]
+            await send_error(send, 503, "Service Unavailable", headers)
+            return
+        self.pending += 1
+        state = {"future": None, "app_iter": None, "iterator": None}
+        try:
+            try:
+                status, headers, chunk = await asyncio.wait_for(
+                    self.start(environ, state), self.timeout
+                )
+            except asyncio.TimeoutError:
+                await send_error(send, 504, "Gateway Timeout")
+                return
+            await self.stream(send, state, status, headers, chunk)
+        finally:
+            future = state["future"]
+            if future is None or future.done():
+                self.pending -= 1
+                close = getattr(state["app_iter"], "close", None)
+                if close is not None:
+                    self.executor.submit(close)
+            else:
+                # the thread can not be stopped, the body is closed and the
+                # request is pending until it is done
+                loop = asyncio.get_running_loop()
+                future.add_done_callback(lambda f: self.finished(loop, state))
+
+    def finished(self, loop, state):
+        """the thread of an abandoned request is done, called by the thread"""
+        try:
+            close = getattr(state["app_iter"], "close", None)
+            if close is not None:
+                close()
+        finally:
+            try:
+                loop.call_soon_threadsafe(self.decrement_pending)
+            except RuntimeError:
+                # the event loop is already closed
+                pass
+
+    def decrement_pending(self):
+        self.pending -= 1
+
+    async def lifespan(self, receive, send):
+        """handle the startup and shutdown messages of the server"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def cached_response(self, environ):
+        """the response for a page in the page cache or None
+
+        This is called on the event loop, only cheap lookups are done. The
+        repository is not accessed.
+        """
+        page_cache = getattr(self.registry, "page_cache", None)
+        if page_cache is None:
+            return None
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return None
+        # the environment is copied, the prefix of a site might be popped
+        request = Request(dict(environ))
+        # no root resource is created, it would read the repository
+        request.registry = self.registry
+        apply_request_extensions(request)
+        site_name = ""
+        hosting = getattr(self.registry, "hosting", None)
+        if hosting is not None:
+            site = hosting.find(request)
+            if site is None:
+                return None
+            site_name = site.name
+        page = page_cache.get_recent(
+            request.path, site_name, self.head_max_age
+        )
+        return None if page is None else page.response(request)
+
+    async def send_cached(self, send, response, environ):
+        """send a response, that was created on the event loop"""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": encode_headers(response.headerlist),
+            }
+        )
+        body = b"" if environ["REQUEST_METHOD"] == "HEAD" else response.body
+        await send({"type": "http.response.body", "body": body})
+
+    def run(self, state, func, *args):
+        """run a function in the thread pool
+
+        The future of the running call is kept, the body must not be closed
+        and the request is pending until it is done.
+        """
+        future = state["future"] = self.executor.submit(func, *args)
+        return asyncio.wrap_future(future)
+
+    async def start(self, environ, state):
+        """run the WSGI application until the response is started
+
+        returns the status, the headers and the first chunk of the body
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split()[0])
+            started["headers"] = headers
+
+        def call_application():
+            app_iter = self.wsgi_app(environ, start_response)
+            state["app_iter"] = app_iter
+            iterator = state["iterator"] = iter(app_iter)
+            # start_response might be called on the first iteration
+            return next(iterator, None)
+
+        chunk = await self.run(state, call_application)
+        return started["status"], started["headers"], chunk
+
+    async def stream(self, send, state, status, headers, chunk):
+        """send the response, the body is produced in the thread pool"""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": encode_headers(headers),
+            }
+        )
+        while chunk is not None:
+            if chunk:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": bytes(chunk),
+                        "more_body": True,
+                    }
+                )
+            chunk = await self.run(state, next, state["iterator"], None)
+        await send({"type": "http.response.body", "body": b""})
+
+
+def main(global_config, **settings):
+    """This function returns the Pyramid application for an ASGI server."""
+    from . import main as wsgi_main
+
+    return AsgiApp(
+        wsgi_main(global_config, **settings),
+        workers=int(settings.get("pyragit.asgi.workers", 8)),
+        max_pending=int(settings.get("pyragit.asgi.max_pending", 64)),
+        timeout=float(settings.get("pyragit.asgi.timeout", 30)),
+        head_max_age=float(settings.get("pyragit.asgi.head_max_age", 1)),
+    )
+
+
+def from_config(config_uri):
+    """create the ASGI application from an ini file"""
+    return main({}, **get_appsettings(config_uri))
@@ -0,0 +1,240 @@
+""" Pyragit: caches for data derived from immutable git objects """
+
+import os
+import heapq
+import hashlib
+import tempfile
+import itertools
+import threading
+import collections
+
+_MISSING = object()
+
+
+class LRUCache:
+    """a thread safe cache, discarding the least recently used items
+
+    maxsize is the maximum number of items kept in the cache
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """get an item from the cache"""
+        with self._lock:
+            value = self._items.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """store an item in the cache"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """remove all items from the cache"""
+        with self._lock:
+            self._items.clear()
+
+
+class BlobCache:
+    """a thread safe cache for the data of git blobs with a byte budget
+
+    Items are evicted by their "greedy dual size frequency": the priority of
+    an item is the number of its hits divided by its size, plus an inflation
+    value that is raised to the priority of each evicted item. Small and
+    frequently used items stay in the cache, large ones are evicted first
+    and items that are not used anymore age out. Items larger than
+    max_item_size are not cached at all.
+
+    max_size is the maximum number of bytes of all cached items
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024, max_item_size=1024 * 1024):
+        self.max_size = max_size
+        self.max_item_size = min(max_item_size, max_size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._inflation = 0.0
+        # key -> [value, frequency, priority]
+        self._items = {}
+        # (priority, insertion count, key), outdated entries are skipped
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _prioritize(self, key, item):
+        """calculate the priority of an item and add it to the heap"""
+        value, frequency, _ = item
+        item[2] = self._inflation + frequency / max(1, len(value))
+        heapq.heappush(self._heap, (item[2], next(self._counter), key))
+        if len(self._heap) > 4 * len(self._items) + 64:
+            # remove the outdated entries
+            self._heap = [
+                (item[2], next(self._counter), key)
+                for key, item in self._items.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        """remove the item with the lowest priority"""
+        while True:
+            priority, _, key = heapq.heappop(self._heap)
+            item = self._items.get(key)
+            if item is not None and item[2] == priority:
+                break
+        del self._items[key]
+        self.size -= len(item[0])
+        self._inflation = priority
+        self.evictions += 1
+
+    def get(self, key, default=None):
+        """get an item from the cache"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            item[1] += 1
+            self._prioritize(key, item)
+            return item[0]
+
+    def set(self, key, value):
+        """store an item in the cache, if it is not too large
+
+        returns True if the item was stored
+        """
+        if len(value) > self.max_item_size:
+            return False
+        with self._lock:
+            if key in self._items:
+                # the data of a git object never changes
+                return True
+            item = self._items[key] = [value, 1, 0.0]
+            self.size += len(value)
+            self._prioritize(key, item)
+            while self.size > self.max_size:
+                self._evict()
+        return True
+
+    def clear(self):
+        """remove all items from the cache"""
+        with self._lock:
+            self._items.clear()
+            self._heap.clear()
+            self.size = 0
+            self._inflation = 0.0
+
+
+class DiskCache:
+    """a simple cache storing text in files of a directory
+
+    The keys are hashed to get the file names, so any string can be used.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, key, default=None):
+        """get an item from the cache"""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as cached:
+                return cached.read()
+        except FileNotFoundError:
+            return default
+
+    def set(self, key, value):
+        """store an item in the cache"""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # write to a temporary file first, other processes must never read
+        # a partially written file
+        handle, tmp_path = tempfile.mkstemp(dir=folder)
+        with os.fdopen(handle, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(value)
+        os.replace(tmp_path, path)
+
+
+class RenderCache:
+    """cache for rendered markup with an in memory and an optional disk tier
+
+    Since git object ids change with their content, the cache never needs to
+    be invalidated as long as the key includes the object id and the
+    identity of the renderer.
+    """
+
+    def __init__(self, maxsize=256, directory=None):
+        self.memory = LRUCache(maxsize)
+        self.disk = DiskCache(directory) if directory else None
+
+    def get(self, key, default=None):
+        """get an item from the memory or disk tier"""
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key, _MISSING)
+            if value is not _MISSING:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value):
+        """store an item in all tiers"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def get_or_render(self, key, render_func):
+        """get an item from the cache or render and store it"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = render_func()
+            self.set(key, value)
+        return value
+
+    def render(self, oid, renderer, get_text):
+        """render the markup of a git blob, using the cache if possible
+
+        The output is only cached, if the renderer provides a cache key to
+        identify itself and its version. get_text is only called, if the
+        markup must be rendered.
+        """
+        cache_key = getattr(renderer, "cache_key", None)
+        if cache_key is None:
+            return renderer(get_text())
+        key = f"{oid.hex}:{cache_key}"
+        return self.get_or_render(key, lambda: renderer(get_text()))
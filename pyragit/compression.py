@@ -0,0 +1,181 @@
+""" Pyragit: compression of response bodies """
+
+import gzip
+import zlib
+
+from pyramid.tweens import MAIN
+from pyramid.settings import asbool
+
+from .cache import LRUCache
+from .ranges import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# the encodings in order of preference
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+# content types that benefit from compression
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# smaller bodies are not worth the effort
+MIN_SIZE = 512
+
+# larger compressed bodies are not kept in the cache
+MAX_CACHED_SIZE = 1024 * 1024
+
+
+def compress(data, encoding):
+    """compress data with a content encoding"""
+    if encoding == "gzip":
+        # a fixed mtime makes the output reproducible
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data)
+    return data
+
+
+def compress_all(data):
+    """a dictionary with the data in all available content encodings"""
+    variants = {encoding: compress(data, encoding) for encoding in ENCODINGS}
+    variants["identity"] = data
+    return variants
+
+
+def negotiate(request, offers=ENCODINGS):
+    """choose the best content encoding accepted by the client
+
+    returns "identity" if no compression should be used
+    """
+    if "Accept-Encoding" not in request.headers:
+        return "identity"
+    acceptable = request.accept_encoding.acceptable_offers(offers)
+    return acceptable[0][0] if acceptable else "identity"
+
+
+def compress_stream(chunks, encoding):
+    """compress an iterable of byte strings on the fly
+
+    The compressor is flushed after each chunk, so the client receives the
+    data while it is produced.
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    else:
+        compressor = brotli.Compressor()
+        compress, flush = compressor.process, compressor.flush
+        finish = compressor.finish
+    for chunk in chunks:
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+def cache_stream(chunks, cache, key, response):
+    """pass on the chunks and cache them, if the stream was completed
+
+    A response might be marked as "no-store" while the stream is produced,
+    like for a document that could not be rendered. It is not cached then.
+    """
+    parts = []
+    size = 0
+    for chunk in chunks:
+        yield chunk
+        if parts is not None:
+            parts.append(chunk)
+            size += len(chunk)
+            if size > MAX_CACHED_SIZE:
+                parts = None
+    if parts is not None and not response.cache_control.no_store:
+        cache.set(key, b"".join(parts))
+
+
+def is_compressible(response):
+    """only complete, uncompressed responses of text content are compressed"""
+    if response.status_code != 200 or response.content_encoding:
+        return False
+    content_length = response.content_length
+    if content_length is not None and content_length < MIN_SIZE:
+        return False
+    content_type = response.content_type or ""
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compression_tween_factory(handler, registry):
+    """tween compressing the responses, if the client accepts it
+
+    The compressed bodies are cached by the url and the entity tag, which
+    contains the object ids of the git objects. Each version of a page or
+    file is therefore compressed only once. The url is part of the key, the
+    same commit might be shown with other links, like for "/@<commit>/" or
+    another hosted site. Streamed responses stay streamed.
+    """
+    cache = registry.compression_cache
+
+    def compression_tween(request):
+        response = handler(request)
+        if not is_compressible(response):
+            return response
+        response.vary = tuple(response.vary or ()) + ("Accept-Encoding",)
+        encoding = negotiate(request)
+        if encoding == "identity":
+            return response
+
+        etag = response.etag
+        key = f"{request.path_url}:{etag}:{encoding}" if etag else None
+        body = cache.get(key) if key else None
+        if body is not None:
+            response.body = body
+        elif isinstance(response.app_iter, (list, tuple)):
+            response.body = compress(response.body, encoding)
+            if key and len(response.body) <= MAX_CACHED_SIZE:
+                cache.set(key, response.body)
+        else:
+            streamed = response.app_iter
+            app_iter = compress_stream(streamed, encoding)
+            if key:
+                app_iter = cache_stream(app_iter, cache, key, response)
+            # the streamed body might hold resources, like a repository
+            close = getattr(streamed, "close", None)
+            callbacks = () if close is None else (close,)
+            response.app_iter = ClosingIterator(app_iter, *callbacks)
+            response.content_length = None
+        response.content_encoding = encoding
+        if etag:
+            # the compressed body is a different representation
+            response.headers["ETag"] = f'W/"{etag}"'
+        return response
+
+    return compression_tween
+
+
+def includeme(config):
+    """
+    enables the compression of responses, if not disabled in the settings
+
+    Activate this setup using ``config.include('pyragit.compression')``.
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("pyragit.compression", True)):
+        return
+    size = int(settings.get("pyragit.compression.cache_size", 256))
+    config.registry.compression_cache = LRUCache(size)
+    # cached pages are already compressed by the page cache
+    config.add_tween(
+        "pyragit.compression.compression_tween_factory",
+        over=("pyragit.pagecache.page_cache_tween_factory", MAIN),
+    )
@@ -0,0 +1,254 @@
+""" Pyragit: export a branch, tag or commit as a static site
+
+    pyragit-export production.ini /srv/www/docs --ref v2.1 --incremental
+
+Every folder and markup page is rendered with the templates of the web
+application, raw files are copied as they are. The pages are rendered in a
+pool of processes, each one with its own application and repository handle.
+
+With --incremental, only the files of folders and documents whose git object
+ids changed since the last export are written again. The ids are stored in
+a manifest in the output directory.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pygit2
+from pyramid.paster import get_appsettings
+from pyramid.request import Request
+from pyramid.exceptions import ConfigurationError
+
+from . import __version__
+from .snapshot import Snapshot
+
+MANIFEST = ".pyragit-export.json"
+
+# features of the web application, that are not used for an export
+EXPORT_SETTINGS = {
+    "pyragit.page_cache": "false",
+    "pyragit.warmer": "false",
+    "pyragit.metrics": "false",
+    "pyragit.search.index_path": "",
+    # the pages are already rendered in a pool of processes
+    "pyragit.renderers.workers": "0",
+}
+
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), "static")
+
+# the application of a worker process, set by init_worker()
+_worker = {}
+
+
+class ExportError(Exception):
+    """a branch, tag or commit can not be exported"""
+
+
+def export_entries(node, parent=None):
+    """the files to export for a snapshot node and its children
+
+    yields (url, file path, key) tuples, the file path is relative to the
+    output directory. The key changes if the file must be written again: a
+    page shows the listing of its folder, therefore the id of the folder is
+    part of the key of a markup page.
+    """
+    if node.is_tree:
+        url = f"/{node.path}/" if node.path else "/"
+        path = os.path.join(node.path, "index.html")
+        yield url, path, f"tree:{node.oid.hex}"
+        for child in node.children.values():
+            yield from export_entries(child, node)
+    elif node.renderer is not None:
+        path = os.path.join(node.path, "index.html")
+        key = f"page:{parent.oid.hex}:{node.oid.hex}"
+        yield f"/{node.path}/", path, key
+    else:
+        yield f"/{node.path}", node.path, f"blob:{node.oid.hex}"
+
+
+def find_conflicts(entries):
+    """the urls of the entries written to the same file
+
+    A raw file "index.html" is written to the same file as the page of its
+    folder. returns a list of tuples with the urls of the conflicting
+    entries.
+    """
+    urls = {}
+    for url, path, key in entries:
+        urls.setdefault(path, []).append(url)
+    return [tuple(found) for found in urls.values() if len(found) > 1]
+
+
+def load_manifest(output):
+    """the keys of the last export or an empty dictionary
+
+    An export of another pyragit version is not reused, the templates or
+    renderers might have changed.
+    """
+    try:
+        with open(os.path.join(output, MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("version") != __version__:
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(output, commit_id, files):
+    """write the keys of the exported files to the output directory"""
+    manifest = {"version": __version__, "commit": commit_id, "files": files}
+    with open(os.path.join(output, MANIFEST), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def remove_file(output, path):
+    """remove an exported file and the folders left empty"""
+    full_path = os.path.join(output, path)
+    try:
+        os.remove(full_path)
+    except FileNotFoundError:
+        pass
+    folder = os.path.dirname(full_path)
+    while folder != output.rstrip(os.sep):
+        try:
+            os.rmdir(folder)
+        except OSError:
+            break
+        folder = os.path.dirname(folder)
+
+
+def init_worker(settings, commit_id, base_url, output):
+    """create the application in a worker process"""
+    from . import main
+
+    _worker["app"] = main({}, **settings)
+    _worker["commit_id"] = pygit2.Oid(hex=commit_id)
+    _worker["base_url"] = base_url
+    _worker["output"] = output
+
+
+def export_file(entry):
+    """render a page or copy a raw file into the output directory"""
+    url, path, key = entry
+    app = _worker["app"]
+    if key.startswith("blob:"):
+        oid = pygit2.Oid(hex=key[5:])
+        with app.registry.repository_pool.repository() as repository:
+            body = repository[oid].data
+    else:
+        request = Request.blank(url, base_url=_worker["base_url"])
+        request.environ["pyragit.revision_id"] = _worker["commit_id"]
+        response = request.get_response(app)
+        if response.status_code != 200:
+            raise RuntimeError(f"Rendering {url} failed: {response.status}")
+        body = response.body
+    full_path = os.path.join(_worker["output"], path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as exported:
+        exported.write(body)
+    return path
+
+
+def export(
+    settings,
+    output,
+    ref="HEAD",
+    base_url="http://localhost",
+    workers=None,
+    incremental=False,
+):
+    """export a branch, tag or commit into a directory
+
+    returns the number of written and removed files. An ExportError is
+    raised, if two files would be written to the same path.
+    """
+    from . import main
+
+    if settings.get("pyragit.repositories", None):
+        raise ConfigurationError("Only a single repository can be exported")
+    settings = {**settings, **EXPORT_SETTINGS}
+    app = main({}, **settings)
+    registry = app.registry
+    with registry.repository_pool.repository() as repository:
+        commit = repository.revparse_single(ref).peel(pygit2.Commit)
+        snapshot = Snapshot(
+            repository, commit.id, registry.get_markup_renderer
+        )
+    entries = list(export_entries(snapshot.root))
+    conflicts = find_conflicts(entries)
+    if conflicts:
+        found = ", ".join(" and ".join(urls) for urls in conflicts)
+        raise ExportError(f"Files would overwrite each other: {found}")
+
+    os.makedirs(output, exist_ok=True)
+    previous = load_manifest(output) if incremental else {}
+    files = {path: key for url, path, key in entries}
+    pending = [
+        (url, path, key)
+        for url, path, key in entries
+        if previous.get(path) != key
+    ]
+    removed = [path for path in previous if path not in files]
+    for path in removed:
+        remove_file(output, path)
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(pending) // (workers * 4))
+    initargs = (settings, commit.hex, base_url, output)
+    with ProcessPoolExecutor(workers, None, init_worker, initargs) as pool:
+        for _ in pool.map(export_file, pending, chunksize=chunksize):
+            pass
+
+    shutil.copytree(
+        STATIC_FOLDER, os.path.join(output, "static"), dirs_exist_ok=True
+    )
+    save_manifest(output, commit.hex, files)
+    return len(pending), len(removed)
+
+
+def main(argv=None):
+    """command line interface for a static export
+
+    The exit code is 1 if the export failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config_uri", help="ini file of the application")
+    parser.add_argument("output", help="directory to write the files to")
+    parser.add_argument("--ref", default="HEAD", help="branch, tag or commit")
+    parser.add_argument(
+        "--base-url",
+        default="http://localhost",
+        help="url the exported site is served from",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only write files that changed since the last export",
+    )
+    args = parser.parse_args(argv)
+
+    settings = get_appsettings(args.config_uri)
+    try:
+        written, removed = export(
+            settings,
+            args.output,
+            ref=args.ref,
+            base_url=args.base_url,
+            workers=args.workers,
+            incremental=args.incremental,
+        )
+    except ExportError as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(f"{written} files written, {removed} files removed")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
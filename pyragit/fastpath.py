@@ -0,0 +1,83 @@
+""" Pyragit: fast path for raw file downloads """
+
+from pyramid.tweens import INGRESS
+from pyramid.settings import asbool
+
+from .views import serve_blob, commit_time
+from .resources import load_buffer
+
+
+def find_blob(request):
+    """the snapshot node of a raw file for the request path or None
+
+    Only files of the HEAD commit are looked up, with a history index for
+    their last modification time. Everything else is left to traversal.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    path = request.path_info.strip("/")
+    if not path or path.startswith("@"):
+        return None
+    snapshots = getattr(request, "tree_snapshots", None)
+    history_index = getattr(request, "history_index", None)
+    if snapshots is None or history_index is None:
+        return None
+    repository = request.repository
+    snapshot = snapshots.get(
+        repository, repository.head.target, request.get_markup_renderer
+    )
+    try:
+        node = snapshot.find(path)
+    except KeyError:
+        return None
+    if node.is_tree or node.renderer is not None:
+        return None
+    return node
+
+
+def blob_tween_factory(handler, registry):
+    """tween serving raw files without traversal and resource objects
+
+    The path is looked up in the tree snapshot of HEAD, that is built once
+    per commit. Conditional and range requests are handled like in the
+    blob view.
+    """
+
+    def blob_tween(request):
+        node = find_blob(request)
+        if node is None:
+            return handler(request)
+        repository = request.repository
+        last_commit = request.history_index.last_commit(repository, node.path)
+        if last_commit is None:
+            return handler(request)
+        return serve_blob(
+            request,
+            node.name,
+            node.oid,
+            lambda: load_buffer(request, node.oid),
+            commit_time(last_commit),
+        )
+
+    return blob_tween
+
+
+def includeme(config):
+    """
+    enables the fast path for raw files, if not disabled in the settings
+
+    Activate this setup using ``config.include('pyragit.fastpath')``.
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("pyragit.blob_fast_path", True)):
+        return
+    # responses of the fast path must still be compressed
+    config.add_tween(
+        "pyragit.fastpath.blob_tween_factory",
+        under=(
+            "pyragit.compression.compression_tween_factory",
+            "pyragit.pagecache.page_cache_tween_factory",
+            "pyragit.hosting.hosting_tween_factory",
+            INGRESS,
+        ),
+    )
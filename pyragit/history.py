@@ -0,0 +1,306 @@
+""" Pyragit: index of the commits that changed a path """
+
+import os
+import html
+import pickle
+import tempfile
+import itertools
+import threading
+
+import pygit2
+
+from .cache import LRUCache
+
+# the format of a stored history index
+STORAGE_VERSION = 1
+
+
+def diff_paths(diff):
+    """the paths of a diff, including all their parent folders"""
+    paths = set()
+    for delta in diff.deltas:
+        path = delta.new_file.path or delta.old_file.path
+        while path and path not in paths:
+            paths.add(path)
+            path, _, _ = path.rpartition("/")
+    return paths
+
+
+def changed_paths(commit):
+    """the paths changed by a commit, including all their parent folders
+
+    The tree of the commit is compared to the tree of its first parent, or
+    to an empty tree for a root commit.
+    """
+    if commit.parents:
+        return diff_paths(commit.parents[0].tree.diff_to_tree(commit.tree))
+    return diff_paths(commit.tree.diff_to_tree(swap=True))
+
+
+def touched_paths(commit, changed):
+    """the paths a commit changed compared to all of its parents
+
+    changed are the paths changed compared to the first parent. A merge
+    only touches the paths that differ from every parent, the changes
+    taken from a merged branch belong to the commits of that branch.
+    """
+    touched = set(changed)
+    for parent in commit.parents[1:]:
+        touched &= diff_paths(parent.tree.diff_to_tree(commit.tree))
+    return touched
+
+
+def walk_last_commits(repository, paths, head=None):
+    """find the last commits that changed some paths in one walk
+
+    paths is a dictionary, mapping the paths to their current object ids.
+    Returns a dictionary, mapping the paths to their last commits. The walk
+    starts at head, or HEAD if not given, and stops as soon as the last
+    commit of every path is known.
+
+    adapted from
+    https://stackoverflow.com/questions/13293052/pygit2-blob-history
+    """
+    head = head or repository.head.target
+    pending = dict(paths)
+    last_commits = dict.fromkeys(paths)
+    previous = None
+    for commit in repository.walk(head, pygit2.GIT_SORT_TIME):
+        for path, last_oid in list(pending.items()):
+            # get the object id of the path if it exists or None
+            oid = commit.tree[path].oid if path in commit.tree else None
+            # the path changed in the previous, more recent commit
+            if oid != last_oid:
+                last_commits[path] = previous
+                del pending[path]
+        if not pending:
+            break
+        previous = commit
+    else:
+        # never changed, therefore present in the first commit ever made
+        for path in pending:
+            last_commits[path] = previous
+    return last_commits
+
+
+def first_parent_chain(repository, target, stop=None):
+    """the commits from target following the first parents
+
+    The chain ends at the root commit or before the commit with the id stop.
+    Returns the list of commits, most recent first, and if stop was reached.
+    """
+    commits = []
+    commit = repository[target]
+    while commit.id != stop:
+        commits.append(commit)
+        if not commit.parents:
+            return commits, False
+        commit = commit.parents[0]
+    return commits, True
+
+
+class HistoryIndex:
+    """maps each path in a repository to the commits that changed it
+
+    The last commit of a path is found by a single pass over the first
+    parents of HEAD, diffing the trees of adjacent commits. Changes merged
+    from another branch are attributed to the merge commit, changes
+    discarded by a merge are not taken into account.
+
+    The log of a path lists the commits of all merged branches that changed
+    it, with their own authors. A merge is only listed for the paths that
+    differ from all of its parents, like after resolving a conflict.
+
+    If HEAD moves forward, only the new commits are processed. If HEAD is
+    moved to an unrelated commit, like after a force push, the index is
+    rebuilt. The lists of the log are shared between updates, only the
+    lists of changed paths are copied.
+
+    If a path is given, the index is stored in this file after each update
+    and loaded again on start.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.head = None
+        self._last_changed = {}
+        self._log = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def load(self):
+        """load the index stored in the file, if it exists"""
+        try:
+            with open(self.path, "rb") as stored:
+                data = pickle.load(stored)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        if data.get("version") != STORAGE_VERSION:
+            return
+        self._last_changed = {
+            path: pygit2.Oid(raw=raw)
+            for path, raw in data["last_changed"].items()
+        }
+        self._log = {
+            path: [pygit2.Oid(raw=raw) for raw in raws]
+            for path, raws in data["log"].items()
+        }
+        self.head = pygit2.Oid(raw=data["head"])
+
+    def save(self):
+        """store the index in the file, replacing it atomically"""
+        data = {
+            "version": STORAGE_VERSION,
+            "head": self.head.raw,
+            "last_changed": {
+                path: oid.raw for path, oid in self._last_changed.items()
+            },
+            "log": {
+                path: [oid.raw for oid in oids]
+                for path, oids in self._log.items()
+            },
+        }
+        folder = os.path.dirname(os.path.abspath(self.path))
+        handle, tmp_path = tempfile.mkstemp(dir=folder)
+        with os.fdopen(handle, "wb") as tmp_file:
+            pickle.dump(data, tmp_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def update(self, repository, target=None):
+        """bring the index up to date with HEAD or another commit id"""
+        target = target or repository.head.target
+        if target == self.head:
+            return
+        with self._lock:
+            # another thread might have done the work already
+            if target == self.head:
+                return
+            # a stored index might belong to another repository
+            head = self.head
+            if head is not None and head not in repository:
+                head = None
+            sort_order = pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE
+            walker = repository.walk(target, sort_order)
+            log = {}
+            if head is not None and repository.descendant_of(target, head):
+                walker.hide(head)
+                log.update(self._log)
+            changed = {}
+            copied = set()
+            for commit in walker:
+                changed[commit.id] = changed_paths(commit)
+                touched = touched_paths(commit, changed[commit.id])
+                # the root folder is changed by every commit
+                for path in touched | {""}:
+                    if path not in copied:
+                        log[path] = list(log.get(path, ()))
+                        copied.add(path)
+                    log[path].append(commit.id)
+
+            commits, reached = first_parent_chain(repository, target, head)
+            last_changed = dict(self._last_changed) if reached else {}
+            for commit in reversed(commits):
+                paths = changed.get(commit.id, None)
+                if paths is None:
+                    paths = changed_paths(commit)
+                for path in paths | {""}:
+                    last_changed[path] = commit.id
+            # swap the complete index, concurrent lookups never see a
+            # partially updated one
+            self._last_changed, self._log = last_changed, log
+            self.head = target
+            if self.path is not None:
+                self.save()
+
+    def last_commit(self, repository, path, target=None):
+        """the last commit that changed a path or None
+
+        path is the path inside the repository without leading or trailing
+        slashes. The index is updated to HEAD, or to another commit id if
+        given.
+        """
+        self.update(repository, target)
+        oid = self._last_changed.get(path)
+        return None if oid is None else repository[oid]
+
+    def log(self, repository, path, start=0, stop=None, target=None):
+        """the ids of the commits that changed a path, most recent first
+
+        returns a (ids, total number of commits) tuple, the ids are sliced
+        by start and stop. The index is updated to HEAD, or to another
+        commit id if given.
+        """
+        self.update(repository, target)
+        ids = self._log.get(path, [])
+        selected = itertools.islice(reversed(ids), start, stop)
+        return list(selected), len(ids)
+
+
+class HistoryIndexCache:
+    """keeps the history indexes of the most recently viewed revisions
+
+    The revisions are identified by their commit id, an index of a commit
+    never changes once it is built. The indexes are kept in memory only.
+    """
+
+    def __init__(self, maxsize=8):
+        self.indexes = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, commit_id):
+        """get the history index for a commit id, it is built on first use"""
+        with self._lock:
+            history_index = self.indexes.get(commit_id)
+            if history_index is None:
+                history_index = HistoryIndex()
+                self.indexes.set(commit_id, history_index)
+        return history_index
+
+
+def path_diff(repository, old_commit, new_commit, path):
+    """the changes of a path between two commits as a patch text
+
+    path is a file or a folder, an empty path is the root folder. If the
+    old commit is None, the complete content of the path is added.
+    """
+
+    def lookup(commit):
+        if commit is None:
+            return None
+        if not path:
+            return commit.tree
+        return commit.tree[path] if path in commit.tree else None
+
+    old, new = lookup(old_commit), lookup(new_commit)
+    is_tree = isinstance(old or new, pygit2.Tree)
+    if not is_tree:
+        patch = pygit2.Patch.create_from(
+            old, new, old_as_path=path, new_as_path=path
+        )
+        return patch.text if patch is not None else ""
+    if old is None:
+        diff = new.diff_to_tree(swap=True)
+    elif new is None:
+        diff = old.diff_to_tree()
+    else:
+        diff = old.diff_to_tree(new)
+    return diff.patch or ""
+
+
+def format_diff(patch):
+    """html markup for a patch text, each line in a span with a css class"""
+    lines = []
+    for line in patch.splitlines():
+        if line.startswith(("diff ", "index ", "--- ", "+++ ")):
+            css_class = "pyragit-diff-file"
+        elif line.startswith("@@"):
+            css_class = "pyragit-diff-hunk"
+        elif line.startswith("+"):
+            css_class = "pyragit-diff-added"
+        elif line.startswith("-"):
+            css_class = "pyragit-diff-removed"
+        else:
+            css_class = "pyragit-diff-context"
+        lines.append(f'<span class="{css_class}">{html.escape(line)}</span>')
+    return '<pre class="pyragit-diff">' + "\n".join(lines) + "</pre>"
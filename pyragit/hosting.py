@@ -0,0 +1,188 @@
+""" Pyragit: hosting multiple repositories in one application """
+
+import threading
+import collections
+
+from pyramid.tweens import MAIN, INGRESS
+from pyramid.settings import asbool
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPNotFound
+
+from .history import HistoryIndex, HistoryIndexCache
+from .sitemap import SiteMapCache
+from .snapshot import SnapshotCache
+from .repository import RepositoryPool, request_repository
+
+
+def parse_mount(mount):
+    """split a mount point into a host name and the path segments
+
+    "docs.example.com" is mounted on a host, "/docs" on a path prefix and
+    "example.com/docs" on a path prefix of a host.
+    """
+    host, _, prefix = mount.strip().partition("/")
+    segments = tuple(name for name in prefix.split("/") if name)
+    return host.lower(), segments
+
+
+def parse_repositories(value):
+    """parse the "mount = path" lines of the repositories setting"""
+    repositories = {}
+    for line in value.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        mount, separator, path = line.partition("=")
+        if not separator or not path.strip():
+            raise ConfigurationError(f"Invalid repository setting: {line}")
+        repositories[parse_mount(mount)] = path.strip()
+    return repositories
+
+
+class Site:
+    """a hosted repository with its own handles and caches
+
+    The handles and the caches are only filled on the first request, a
+    site that is evicted starts with empty caches again.
+    """
+
+    def __init__(self, name, path, pool_size=4, history_index=True):
+        self.name = name
+        self.repository_pool = RepositoryPool(path, pool_size)
+        self.use_history_index = history_index
+        self.history_index = None
+        self.tree_snapshots = None
+        self.revision_snapshots = None
+        self.site_maps = None
+        self.history_indexes = None
+        self.evict()
+
+    def evict(self):
+        """release the idle handles and the cached data"""
+        self.repository_pool.clear()
+        self.history_index = HistoryIndex() if self.use_history_index else None
+        self.tree_snapshots = SnapshotCache()
+        self.revision_snapshots = SnapshotCache()
+        self.site_maps = SiteMapCache()
+        self.history_indexes = HistoryIndexCache()
+
+
+class Hosting:
+    """the hosted repositories, mounted on host names or path prefixes
+
+    Only the max_active most recently used sites keep their handles and
+    caches, the least recently used site is evicted if another one becomes
+    active.
+    """
+
+    def __init__(self, max_active=8):
+        self.max_active = max_active
+        self.sites = {}
+        self.evictions = 0
+        self._active = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, mount, site):
+        """mount a site on a (host, segments) tuple"""
+        self.sites[mount] = site
+
+    def match(self, host, segments):
+        """the most specific mount for a host and the path segments
+
+        returns a (site, number of prefix segments) tuple or (None, 0)
+        """
+        for mount_host in (host, ""):
+            for length in range(len(segments), -1, -1):
+                site = self.sites.get((mount_host, tuple(segments[:length])))
+                if site is not None:
+                    return site, length
+        return None, 0
+
+    def find(self, request):
+        """find the site of a request, the prefix is moved to the script name
+
+        returns None if no site is mounted for the request
+        """
+        segments = [name for name in request.path_info.split("/") if name]
+        site, length = self.match(request.domain.lower(), segments)
+        if site is None:
+            return None
+        for _ in range(length):
+            request.path_info_pop()
+        self.activate(site)
+        return site
+
+    def activate(self, site):
+        """mark a site as recently used and evict the least recently used"""
+        with self._lock:
+            self._active[site.name] = site
+            self._active.move_to_end(site.name)
+            while len(self._active) > self.max_active:
+                _, evicted = self._active.popitem(last=False)
+                evicted.evict()
+                self.evictions += 1
+
+
+def hosting_tween_factory(handler, registry):
+    """tween selecting the hosted repository of a request"""
+    hosting = registry.hosting
+
+    def hosting_tween(request):
+        site = hosting.find(request)
+        if site is None:
+            return HTTPNotFound()
+        request.site = site
+        return handler(request)
+
+    return hosting_tween
+
+
+def includeme(config):
+    """
+    serves the repositories configured in "pyragit.repositories"
+
+    Activate this setup using ``config.include('pyragit.hosting')``.
+    """
+    settings = config.get_settings()
+    repositories = parse_repositories(settings["pyragit.repositories"])
+    if not repositories:
+        raise ConfigurationError("No repositories configured")
+
+    if settings.get("pyragit.history_index.path", None):
+        raise ConfigurationError(
+            "A stored history index only supports a single repository"
+        )
+    pool_size = int(settings.get("pyragit.repository_pool_size", 4))
+    use_history = asbool(settings.get("pyragit.history_index", True))
+    max_active = int(settings.get("pyragit.repositories.max_active", 8))
+    hosting = Hosting(max_active)
+    for (host, segments), path in repositories.items():
+        name = "/".join((host,) + segments)
+        site = Site(name, path, pool_size, use_history)
+        hosting.add((host, segments), site)
+    config.registry.hosting = hosting
+
+    config.add_request_method(
+        lambda r: request_repository(r, r.site.repository_pool),
+        "repository",
+        reify=True,
+    )
+    config.add_request_method(
+        lambda r: r.site.history_index, "history_index", reify=True
+    )
+    config.add_request_method(
+        lambda r: r.site.tree_snapshots, "tree_snapshots", reify=True
+    )
+    config.add_request_method(
+        lambda r: r.site.revision_snapshots, "revision_snapshots", reify=True
+    )
+    config.add_request_method(
+        lambda r: r.site.history_indexes, "history_indexes", reify=True
+    )
+
+    # the site must be known before the page cache is looked up
+    config.add_tween(
+        "pyragit.hosting.hosting_tween_factory",
+        under=INGRESS,
+        over=("pyragit.pagecache.page_cache_tween_factory", MAIN),
+    )
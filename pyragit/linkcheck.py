@@ -0,0 +1,209 @@
+""" Pyragit: check the links of a branch, tag or commit
+
+    pyragit-linkcheck production.ini --ref main --cache linkcheck.json
+
+Every markup document is rendered with the configured renderers in a pool
+of processes, the links and images are resolved against the git tree
+without any http requests. Broken links and raw files that are not
+referenced by any document are reported.
+
+With --cache, the links found in a document are stored by its blob id. A
+check after a push only renders the documents that changed.
+"""
+
+import os
+import sys
+import json
+import argparse
+import posixpath
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import pygit2
+from pyramid.paster import get_appsettings
+from pyramid.exceptions import ConfigurationError
+
+from . import __version__
+from .export import EXPORT_SETTINGS
+from .markup import RenderError
+from .sitemap import parse_page, link_target
+from .snapshot import Snapshot
+
+Report = collections.namedtuple(
+    "Report", ["broken", "unreferenced", "failed", "rendered"]
+)
+
+# the application of a worker process, set by init_worker()
+_worker = {}
+
+
+def load_cache(path):
+    """the links of the documents of the last check or an empty dictionary
+
+    The links found by another pyragit version are not reused, the
+    renderers might have changed.
+    """
+    try:
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if cache.get("version") != __version__:
+        return {}
+    return cache.get("documents", {})
+
+
+def save_cache(path, documents):
+    """write the links of the documents to the cache file"""
+    cache = {"version": __version__, "documents": documents}
+    with open(path, "w") as cache_file:
+        json.dump(cache, cache_file, indent=1, sort_keys=True)
+
+
+def init_worker(settings):
+    """create the application in a worker process"""
+    from . import main
+
+    _worker["app"] = main({}, **settings)
+
+
+def extract_links(entry):
+    """render a document and return its links, or None if rendering failed"""
+    path, oid_hex = entry
+    registry = _worker["app"].registry
+    renderer = registry.get_markup_renderer(posixpath.basename(path))
+    oid = pygit2.Oid(hex=oid_hex)
+    with registry.repository_pool.repository() as repository:
+        text = repository[oid].data.decode("utf-8", errors="replace")
+    try:
+        rendered = registry.render_cache.render(oid, renderer, lambda: text)
+    except RenderError:
+        return None
+    _, links = parse_page(rendered)
+    return list(links)
+
+
+def find_problems(snapshot, links):
+    """the broken links and the unreferenced raw files of a snapshot
+
+    links maps the paths of the documents to the links found in them.
+    returns a list of (path, link) tuples and a list of paths
+    """
+    referenced = set()
+    broken = []
+    for path, hrefs in sorted(links.items()):
+        folder_path = posixpath.dirname(path)
+        for href in hrefs:
+            target = link_target(folder_path, href)
+            if target is None:
+                continue
+            try:
+                snapshot.find(target)
+            except KeyError:
+                broken.append((path, href))
+            else:
+                referenced.add(target)
+    # markup documents are always reachable by the folder listings
+    unreferenced = [
+        node.path
+        for node in snapshot.walk()
+        if not node.is_tree
+        and node.renderer is None
+        and node.path not in referenced
+    ]
+    return broken, sorted(unreferenced)
+
+
+def check(settings, ref="HEAD", workers=None, cache_path=None):
+    """check the links of all documents of a branch, tag or commit
+
+    returns a Report with the broken links, the unreferenced files, the
+    documents that could not be rendered and the number of rendered ones
+    """
+    from . import main
+
+    if settings.get("pyragit.repositories", None):
+        raise ConfigurationError("Only a single repository can be checked")
+    settings = {**settings, **EXPORT_SETTINGS}
+    app = main({}, **settings)
+    registry = app.registry
+    with registry.repository_pool.repository() as repository:
+        commit = repository.revparse_single(ref).peel(pygit2.Commit)
+        snapshot = Snapshot(
+            repository, commit.id, registry.get_markup_renderer
+        )
+
+    cached = load_cache(cache_path) if cache_path else {}
+    keys = {}
+    links = {}
+    pending = []
+    for node in snapshot.walk():
+        if node.is_tree or node.renderer is None:
+            continue
+        # only the links of renderers with a cache key can be reused
+        cache_key = getattr(node.renderer, "cache_key", None)
+        if cache_key is not None:
+            keys[node.path] = f"{node.oid.hex}:{cache_key}"
+        if keys.get(node.path) in cached:
+            links[node.path] = cached[keys[node.path]]
+        else:
+            pending.append((node.path, node.oid.hex))
+
+    failed = []
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(pending) // (workers * 4))
+        initargs = (settings,)
+        with ProcessPoolExecutor(workers, None, init_worker, initargs) as pool:
+            results = pool.map(extract_links, pending, chunksize=chunksize)
+            for (path, _), hrefs in zip(pending, results):
+                if hrefs is None:
+                    failed.append(path)
+                else:
+                    links[path] = hrefs
+
+    if cache_path:
+        documents = {
+            keys[path]: hrefs for path, hrefs in links.items() if path in keys
+        }
+        save_cache(cache_path, documents)
+    broken, unreferenced = find_problems(snapshot, links)
+    return Report(broken, unreferenced, sorted(failed), len(pending))
+
+
+def main(argv=None):
+    """command line interface for the link checker
+
+    The exit code is 1 if broken links were found.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config_uri", help="ini file of the application")
+    parser.add_argument("--ref", default="HEAD", help="branch, tag or commit")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help="file to store the links of the documents for the next check",
+    )
+    args = parser.parse_args(argv)
+
+    settings = get_appsettings(args.config_uri)
+    report = check(
+        settings, ref=args.ref, workers=args.workers, cache_path=args.cache
+    )
+    for path, href in report.broken:
+        print(f"broken link in {path}: {href}")
+    for path in report.failed:
+        print(f"could not render {path}")
+    for path in report.unreferenced:
+        print(f"unreferenced file: {path}")
+    print(
+        f"{report.rendered} documents rendered, "
+        f"{len(report.broken)} broken links, "
+        f"{len(report.unreferenced)} unreferenced files"
+    )
+    return 1 if report.broken else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
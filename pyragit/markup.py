@@ -1,16 +1,110 @@
-""" setup of the markup renderers """
+""" setup of the markup renderers
+
+Other packages can add renderers with an entry point in the group
+"pyragit.renderers", named after the file extension:
+
+    [project.entry-points."pyragit.renderers"]
+    ".rst" = "pyragit_rst:render_rst"
+
+A renderer is called with the text of a document and returns html. It may
+have a "cache_key" attribute identifying the renderer and its version for
+the render cache, and a "cost" attribute. Expensive renderers are run in a
+pool of processes, they must be picklable, like functions of a module.
+"""
+
+import hashlib
+import threading
+import multiprocessing
+import importlib.metadata
+from concurrent.futures import TimeoutError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import mistune
-from mistune_contrib import highlight
 
+from . import __version__
+from .cache import LRUCache, RenderCache
+
+ENTRY_POINT_GROUP = "pyragit.renderers"
+
+# the cost of a renderer
+CHEAP = "cheap"
+EXPENSIVE = "expensive"
+
+
+class RenderError(Exception):
+    """a document could not be rendered"""
+
+
+class HighlightRenderer(mistune.HTMLRenderer):
+    """Markdown renderer with syntax highlighting
+
+    pygments is only imported when the first code block is highlighted. The
+    lexers are created once per language and the highlighted code blocks
+    are cached, the same snippets are often found on many pages.
+    """
+
+    options = {"inlinestyles": False, "linenos": False}
+
+    def __init__(self, *args, cache_size=512, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.highlighted = LRUCache(cache_size)
+        self._lexers = {}
+        self._formatter = None
+
+    def block_code(self, text, info=None):
+        # the info string of a fenced code block might contain more than
+        # the language
+        lang = info.split()[0] if info and info.strip() else None
+        if not lang:
+            return f"<pre><code>{mistune.escape(text.strip())}</code></pre>\n"
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        key = f"{lang}:{digest}"
+        code = self.highlighted.get(key)
+        if code is None:
+            code = self.highlight(text, lang)
+            self.highlighted.set(key, code)
+        return code
 
-class HighlightRenderer(highlight.HighlightMixin, mistune.HTMLRenderer):
-    """Markdown renderer with syntax highlighting"""
+    def get_lexer(self, lang):
+        """the pygments lexer for a language or None, if it is unknown"""
+        try:
+            return self._lexers[lang]
+        except KeyError:
+            pass
+        from pygments.util import ClassNotFound
+        from pygments.lexers import get_lexer_by_name
 
-    options = {}
+        try:
+            lexer = get_lexer_by_name(lang, stripall=True)
+        except ClassNotFound:
+            lexer = None
+        self._lexers[lang] = lexer
+        return lexer
 
-    def block_code(self, text, lang=None):
-        return super().block_code(text, lang)
+    @property
+    def formatter(self):
+        """the pygments html formatter, created on first use"""
+        if self._formatter is None:
+            from pygments.formatters import HtmlFormatter
+
+            self._formatter = HtmlFormatter(
+                noclasses=self.options["inlinestyles"],
+                linenos=self.options["linenos"],
+            )
+        return self._formatter
+
+    def highlight(self, text, lang):
+        """highlight a code block with pygments"""
+        lexer = self.get_lexer(lang)
+        if lexer is None:
+            lang, text = mistune.escape(lang), mistune.escape(text)
+            return f'<pre class="{lang}"><code>{text}</code></pre>\n'
+        from pygments import highlight
+
+        code = highlight(text, lexer, self.formatter)
+        if self.options["linenos"]:
+            return f'<div class="highlight-wrapper">{code}</div>\n'
+        return code
 
 
 def render_text(content):
@@ -18,23 +112,181 @@ def render_text(content):
     return "<br>".join(content.splitlines())
 
 
+# identifies the renderer and its version in the render cache
+render_text.cache_key = "text:1"
+
+
+class RenderPool:
+    """a pool of processes for expensive renderers
+
+    The processes are started on first use. If a process dies, for example
+    when it runs out of memory, a new pool is created.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """schedule a function call in a worker process"""
+        with self._lock:
+            if self._executor is None:
+                # forking a process with running threads is not safe
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=context
+                )
+            return self._executor.submit(func, *args)
+
+    def reset(self):
+        """shut down the processes, a new pool is created on next use"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def terminate(self):
+        """stop the running processes, a new pool is created on next use
+
+        Renderers running for other documents fail with a RenderError.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # the executor can not interrupt a running call
+        for process in list(executor._processes.values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PooledRenderer:
+    """runs a renderer in a pool of processes
+
+    Documents larger than max_size characters are not rendered and a
+    RenderError is raised, if the result is not available after timeout
+    seconds. The processes of the pool are terminated then, a stuck
+    renderer would block a worker otherwise.
+    """
+
+    def __init__(self, renderer, pool, timeout=30, max_size=5 * 1024 * 1024):
+        self.renderer = renderer
+        self.pool = pool
+        self.timeout = timeout
+        self.max_size = max_size
+        self.cache_key = getattr(renderer, "cache_key", None)
+        self.cost = EXPENSIVE
+
+    def __call__(self, text):
+        if len(text) > self.max_size:
+            raise RenderError("The document is too large to be rendered.")
+        future = self.pool.submit(self.renderer, text)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if not future.cancel():
+                self.pool.terminate()
+            raise RenderError("Rendering the document took too long.")
+        except BrokenProcessPool:
+            self.pool.reset()
+            raise RenderError("Rendering the document failed.")
+
+
+class RendererRegistry:
+    """the markup renderers by file extension
+
+    Expensive renderers are wrapped in a PooledRenderer, unless no pool is
+    given.
+    """
+
+    def __init__(self, pool=None, timeout=30, max_size=5 * 1024 * 1024):
+        self.pool = pool
+        self.timeout = timeout
+        self.max_size = max_size
+        self.renderers = {}
+
+    def add(self, extension, renderer, cost=None):
+        """register a renderer for a file extension like ".md"
+
+        The cost defaults to the "cost" attribute of the renderer or CHEAP.
+        """
+        cost = cost or getattr(renderer, "cost", CHEAP)
+        if cost == EXPENSIVE and self.pool is not None:
+            renderer = PooledRenderer(
+                renderer, self.pool, self.timeout, self.max_size
+            )
+        self.renderers["." + extension.lstrip(".")] = renderer
+
+    def load_entry_points(self):
+        """add the renderers of the installed packages"""
+        entry_points = importlib.metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+        else:  # pragma: no cover
+            entry_points = entry_points.get(ENTRY_POINT_GROUP, ())
+        for entry_point in entry_points:
+            self.add(entry_point.name, entry_point.load())
+
+    def get(self, filename):
+        """the renderer for a file name or None"""
+        name, dot, ext = filename.rpartition(".")
+        return self.renderers.get(dot + ext, None)
+
+
+def markdown_cache_key():
+    """the cache key of the markdown renderer
+
+    The output depends on the versions of pyragit, with the highlighting
+    renderer, mistune and pygments. The version of pygments is looked up
+    without importing it.
+    """
+    pygments_version = importlib.metadata.version("pygments")
+    return f"markdown:{__version__}:{mistune.__version__}:{pygments_version}"
+
+
 def includeme(config):
     """
     configures the rendering engines and attaches them to the request
 
     Activate this setup using ``config.include('pyragit.markdown')``.
     """
-    md_renderer = HighlightRenderer()
+    settings = config.get_settings()
+    md_renderer = HighlightRenderer(
+        cache_size=int(settings.get("pyragit.highlight_cache.size", 512))
+    )
     render_markdown = mistune.Markdown(renderer=md_renderer)
+    render_markdown.cache_key = markdown_cache_key()
 
-    renderer_dict = {".md": render_markdown, ".txt": render_text}
-
-    def get_markup_renderer(filename):
-        name, dot, ext = filename.rpartition(".")
-        complete_extension = dot + ext
-        return renderer_dict.get(complete_extension, None)
+    # expensive renderers run in a pool of processes, if workers are set
+    workers = int(settings.get("pyragit.renderers.workers", 2))
+    renderers = RendererRegistry(
+        pool=RenderPool(workers) if workers > 0 else None,
+        timeout=float(settings.get("pyragit.renderers.timeout", 30)),
+        max_size=int(settings.get("pyragit.renderers.max_size", 5242880)),
+    )
+    renderers.add(".md", render_markdown)
+    renderers.add(".txt", render_text)
+    renderers.load_entry_points()
+    config.registry.renderers = renderers
+    config.add_directive(
+        "add_markup_renderer",
+        lambda config, *args, **kwargs: renderers.add(*args, **kwargs),
+    )
 
+    get_markup_renderer = renderers.get
+    config.registry.get_markup_renderer = get_markup_renderer
     config.add_request_method(
         lambda request, filename: get_markup_renderer(filename),
         "get_markup_renderer",
     )
+
+    # rendered markup is cached by the object id of the git blob
+    render_cache = RenderCache(
+        maxsize=int(settings.get("pyragit.render_cache.size", 256)),
+        directory=settings.get("pyragit.render_cache.directory", None),
+    )
+    config.registry.render_cache = render_cache
+    config.add_request_method(
+        lambda r: render_cache, "render_cache", reify=True
+    )
@@ -0,0 +1,201 @@
+""" Pyragit: request timings and metrics """
+
+import time
+import bisect
+import threading
+import contextlib
+import collections
+
+from pyramid.events import BeforeRender, ContextFound, BeforeTraversal
+from pyramid.tweens import INGRESS
+from pyramid.response import Response
+from pyramid.settings import asbool
+
+# histogram buckets for durations in seconds and response sizes in bytes
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+@contextlib.contextmanager
+def timed(request, phase):
+    """context manager, adding the time spent in a phase to the request
+
+    Nothing is recorded if the metrics are not enabled.
+    """
+    timings = getattr(request, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        timings[phase] = timings.get(phase, 0) + duration
+
+
+class Histogram:
+    """a histogram with fixed buckets, like a prometheus histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """the lines of the prometheus text format"""
+        cumulative = 0
+        for bucket, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            bucket_labels = f'{labels},le="{bucket}"'.lstrip(",")
+            yield f"{name}_bucket{{{bucket_labels}}} {cumulative}"
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Metrics:
+    """collects the timings of the requests in a process"""
+
+    def __init__(self):
+        self.phases = collections.defaultdict(lambda: Histogram(TIME_BUCKETS))
+        self.sizes = Histogram(SIZE_BUCKETS)
+        self.status_codes = collections.Counter()
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def observe(self, timings, response):
+        """record the timings and the response of a request"""
+        with self._lock:
+            for phase, duration in timings.items():
+                self.phases[phase].observe(duration)
+            if response.content_length is not None:
+                self.sizes.observe(response.content_length)
+            self.status_codes[response.status_code] += 1
+
+    def render(self):
+        """the metrics in the prometheus text format"""
+        lines = [
+            "# HELP pyragit_phase_seconds Time spent in a phase of a request",
+            "# TYPE pyragit_phase_seconds histogram",
+        ]
+        with self._lock:
+            for phase, histogram in sorted(self.phases.items()):
+                labels = f'phase="{phase}"'
+                lines.extend(histogram.lines("pyragit_phase_seconds", labels))
+            lines.append("# HELP pyragit_response_bytes Size of the responses")
+            lines.append("# TYPE pyragit_response_bytes histogram")
+            lines.extend(self.sizes.lines("pyragit_response_bytes", ""))
+            lines.append("# HELP pyragit_requests_total Handled requests")
+            lines.append("# TYPE pyragit_requests_total counter")
+            for status, count in sorted(self.status_codes.items()):
+                line = f'pyragit_requests_total{{status="{status}"}} {count}'
+                lines.append(line)
+        lines.append("# HELP pyragit_cache_requests_total Cache lookups")
+        lines.append("# TYPE pyragit_cache_requests_total counter")
+        for name, cache in sorted(self.caches.items()):
+            for result, count in (("hit", cache.hits), ("miss", cache.misses)):
+                labels = f'cache="{name}",result="{result}"'
+                line = f"pyragit_cache_requests_total{{{labels}}} {count}"
+                lines.append(line)
+        return "\n".join(lines) + "\n"
+
+
+def server_timing(timings):
+    """the value of a "Server-Timing" header, durations in milliseconds"""
+    return ", ".join(
+        f"{phase};dur={duration * 1000:.2f}"
+        for phase, duration in timings.items()
+    )
+
+
+def metrics_tween_factory(handler, registry):
+    """tween recording the timings of each request"""
+    metrics = registry.metrics
+
+    def metrics_tween(request):
+        start = time.perf_counter()
+        response = handler(request)
+        end = time.perf_counter()
+        timings = request.timings
+        template_start = getattr(request, "template_start", None)
+        if template_start is not None:
+            # markup is rendered from within the template
+            template = end - template_start - timings.get("render", 0)
+            timings["template"] = max(template, 0)
+        timings["total"] = end - start
+        metrics.observe(timings, response)
+        response.headers["Server-Timing"] = server_timing(timings)
+        return response
+
+    return metrics_tween
+
+
+def start_traversal(event):
+    event.request.traversal_start = time.perf_counter()
+
+
+def end_traversal(event):
+    request = event.request
+    start = getattr(request, "traversal_start", None)
+    if start is not None:
+        request.timings["traversal"] = time.perf_counter() - start
+
+
+def start_template(event):
+    request = event.get("request", None)
+    if request is not None and hasattr(request, "timings"):
+        request.template_start = time.perf_counter()
+
+
+def metrics_view(request):
+    """the metrics of the process in the prometheus text format"""
+    return Response(
+        text=request.registry.metrics.render(),
+        content_type="text/plain",
+        charset="utf-8",
+    )
+
+
+def includeme(config):
+    """
+    enables request timings and the /metrics endpoint, if configured
+
+    Activate this setup using ``config.include('pyragit.metrics')``, after
+    the other pyragit setups are included.
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("pyragit.metrics", False)):
+        return
+
+    registry = config.registry
+    metrics = registry.metrics = Metrics()
+    render_cache = getattr(registry, "render_cache", None)
+    if render_cache is not None:
+        metrics.caches["render"] = render_cache.memory
+    blob_cache = getattr(registry, "blob_cache", None)
+    if blob_cache is not None:
+        metrics.caches["blob"] = blob_cache
+    tree_snapshots = getattr(registry, "tree_snapshots", None)
+    if tree_snapshots is not None:
+        metrics.caches["snapshot"] = tree_snapshots.snapshots
+    compression_cache = getattr(registry, "compression_cache", None)
+    if compression_cache is not None:
+        metrics.caches["compression"] = compression_cache
+    page_cache = getattr(registry, "page_cache", None)
+    if page_cache is not None and hasattr(page_cache.backend, "hits"):
+        metrics.caches["page"] = page_cache.backend
+
+    config.add_request_method(lambda r: {}, "timings", reify=True)
+    config.add_subscriber(start_traversal, BeforeTraversal)
+    config.add_subscriber(end_traversal, ContextFound)
+    config.add_subscriber(start_template, BeforeRender)
+    config.add_tween("pyragit.metrics.metrics_tween_factory", under=INGRESS)
+    config.add_view(
+        metrics_view, context="pyragit.resources.Root", name="metrics"
+    )
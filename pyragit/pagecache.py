@@ -0,0 +1,296 @@
+""" Pyragit: cache for complete rendered pages """
+
+import os
+import time
+import pickle
+import shutil
+import hashlib
+import tempfile
+
+from pyramid.path import DottedNameResolver
+from pyramid.settings import asbool
+
+from .cache import LRUCache
+from .views import IMMUTABLE, not_modified
+from .resources import Folder, Markup
+from .compression import negotiate, compress_all
+
+
+class CachedPage:
+    """a rendered page with the body in all available content encodings"""
+
+    __slots__ = (
+        "content_type",
+        "etag",
+        "last_modified",
+        "bodies",
+        "cache_control",
+    )
+
+    def __init__(
+        self, content_type, etag, last_modified, bodies, cache_control=None
+    ):
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.bodies = bodies
+        self.cache_control = cache_control
+
+    @property
+    def immutable(self):
+        """the page belongs to a commit addressed by its full id"""
+        return self.cache_control == IMMUTABLE
+
+    @classmethod
+    def from_response(cls, response):
+        """create a cached page from a rendered response"""
+        return cls(
+            response.headers["Content-Type"],
+            response.etag,
+            response.last_modified,
+            compress_all(response.body),
+            response.headers.get("Cache-Control", None),
+        )
+
+    def response(self, request):
+        """create a response for a request, choosing the content encoding
+
+        Like for the compression tween, the entity tag of a compressed body
+        is weak, it is a different representation of the page.
+        """
+        if self.cache_control is not None:
+            request.response.headers["Cache-Control"] = self.cache_control
+        encoding = negotiate(request)
+        response = not_modified(request, self.etag, self.last_modified)
+        if response is None:
+            response = request.response
+            response.headers["Content-Type"] = self.content_type
+            response.body = self.bodies[encoding]
+            if encoding != "identity":
+                response.content_encoding = encoding
+        if encoding != "identity" and self.etag:
+            response.headers["ETag"] = f'W/"{self.etag}"'
+        response.vary = ("Accept-Encoding",)
+        return response
+
+
+class FilePageStore:
+    """a page cache backend storing the pages as files in a directory
+
+    Pages older than max_age seconds are treated as missing and removed
+    from the directory, the expired files are looked for at most every
+    quarter of max_age while storing pages. A max_age of None keeps the
+    pages until the store is cleared.
+    """
+
+    def __init__(self, directory, max_age=None):
+        self.directory = directory
+        self.max_age = max_age
+        self.purged = time.time()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def _expired(self, modified, now):
+        return self.max_age is not None and now - modified > self.max_age
+
+    def get(self, key, default=None):
+        """get a page from the store"""
+        try:
+            with open(self._path(key), "rb") as cached:
+                modified = os.fstat(cached.fileno()).st_mtime
+                if self._expired(modified, time.time()):
+                    return default
+                return pickle.load(cached)
+        except FileNotFoundError:
+            return default
+
+    def set(self, key, value):
+        """store a page"""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=folder)
+        with os.fdopen(handle, "wb") as tmp_file:
+            pickle.dump(value, tmp_file)
+        os.replace(tmp_path, path)
+        if self.max_age is not None:
+            if time.time() - self.purged >= self.max_age / 4:
+                self.purge()
+
+    def purge(self):
+        """remove the pages older than max_age from the store"""
+        now = self.purged = time.time()
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                try:
+                    if self._expired(entry.stat().st_mtime, now):
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        """remove all pages from the store"""
+        for entry in os.scandir(self.directory):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class PageCache:
+    """caches complete responses by HEAD commit and request path
+
+    Since the HEAD commit is part of the key, a push invalidates all pages.
+    The backend is cleared as soon as a new HEAD is seen. If multiple
+    repositories are hosted, the HEAD of each site is tracked by its name
+    and the backend is not cleared, a push would drop the pages of all
+    sites. The pages of an old HEAD are then only removed by the backend
+    itself: the memory backend drops the least recently used pages, the
+    file backend the pages older than "pyragit.page_cache.max_age".
+
+    Immutable pages of a commit addressed by its full id are kept in a
+    separate memory cache, that is not cleared if HEAD moves.
+    """
+
+    def __init__(self, backend, pinned_size=512):
+        self.backend = backend
+        self.pinned = LRUCache(pinned_size)
+        self.heads = {}
+        # the time HEAD of a site was last looked up by a request
+        self.checked = {}
+
+    def key(self, head, path, site=""):
+        return f"{site}:{head.hex}:{path}"
+
+    def get(self, head, path, site=""):
+        """get the cached page for a request path or None"""
+        self.checked[site] = time.monotonic()
+        page = self.pinned.get(f"{site}:{path}")
+        if page is not None:
+            return page
+        if head != self.heads.get(site, None):
+            # only the pages of this site would be removed
+            if set(self.heads) <= {site}:
+                self.backend.clear()
+            self.heads[site] = head
+            return None
+        return self.backend.get(self.key(head, path, site))
+
+    def get_recent(self, path, site="", max_age=1.0):
+        """get a page without looking up HEAD in the repository or None
+
+        The HEAD of the last request is used, if it was looked up less than
+        max_age seconds ago. Only memory backends are asked, other backends
+        might block.
+        """
+        page = self.pinned.get(f"{site}:{path}")
+        if page is not None:
+            return page
+        head = self.heads.get(site, None)
+        checked = self.checked.get(site, None)
+        if head is None or checked is None:
+            return None
+        if time.monotonic() - checked > max_age:
+            return None
+        if not isinstance(self.backend, LRUCache):
+            return None
+        return self.backend.get(self.key(head, path, site))
+
+    def set(self, head, path, page, site=""):
+        """store a page for a request path"""
+        if page.immutable:
+            self.pinned.set(f"{site}:{path}", page)
+        else:
+            self.backend.set(self.key(head, path, site), page)
+
+
+def is_cacheable(request, response):
+    """only successfully rendered folder and markup pages are cached
+
+    Views like "@history" are not cached, their output depends on the
+    query string, that is not part of the cache key. Pages of a branch or
+    tag other than HEAD, like "/@v2.1/docs/", are not cached either, the
+    reference might move without HEAD changing.
+    """
+    if request.method != "GET" or response.status_code != 200:
+        return False
+    if getattr(request, "view_name", ""):
+        return False
+    if response.cache_control.no_store:
+        return False
+    context = getattr(request, "context", None)
+    if not isinstance(context, (Folder, Markup)):
+        return False
+    revision = context.revision
+    return revision.__parent__ is None or revision.immutable
+
+
+def page_key(request):
+    """the HEAD commit, the path and the site name of a page request"""
+    head = request.repository.head.target
+    site = getattr(request, "site", None)
+    return head, request.path, site.name if site else ""
+
+
+def page_cache_tween_factory(handler, registry):
+    """tween serving rendered pages from the page cache"""
+    page_cache = registry.page_cache
+
+    def page_cache_tween(request):
+        if request.method not in ("GET", "HEAD"):
+            return handler(request)
+        head, path, site = page_key(request)
+        page = page_cache.get(head, path, site)
+        if page is not None:
+            return page.response(request)
+
+        response = handler(request)
+        if not is_cacheable(request, response):
+            return response
+        page = CachedPage.from_response(response)
+        # a streamed document is rendered while the body is read
+        if response.cache_control.no_store:
+            return response
+        page_cache.set(head, path, page, site)
+        return page.response(request)
+
+    return page_cache_tween
+
+
+def backend_from_settings(settings):
+    """create the page cache backend configured in the settings
+
+    The backend is either "memory", "file" or the dotted name of a callable
+    that gets the settings and returns an object with the methods get(),
+    set() and clear()
+    """
+    backend = settings.get("pyragit.page_cache.backend", "memory")
+    if backend == "memory":
+        size = int(settings.get("pyragit.page_cache.size", 512))
+        return LRUCache(size)
+    if backend == "file":
+        max_age = settings.get("pyragit.page_cache.max_age", 86400)
+        return FilePageStore(
+            settings["pyragit.page_cache.directory"],
+            int(max_age) if max_age else None,
+        )
+    factory = DottedNameResolver().resolve(backend)
+    return factory(settings)
+
+
+def includeme(config):
+    """
+    enables the page cache if configured in the settings
+
+    Activate this setup using ``config.include('pyragit.pagecache')``.
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("pyragit.page_cache", False)):
+        return
+    pinned_size = int(settings.get("pyragit.page_cache.pinned_size", 512))
+    config.registry.page_cache = PageCache(
+        backend_from_settings(settings), pinned_size
+    )
+    config.add_tween("pyragit.pagecache.page_cache_tween_factory")
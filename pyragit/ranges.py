@@ -0,0 +1,107 @@
+""" Pyragit: HTTP range requests and streaming of binary data """
+
+import secrets
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """parse a "Range" header into a list of (start, stop) tuples
+
+    The stop values are exclusive, like in python slices. Returns None if
+    the header could not be parsed and should be ignored. An empty list is
+    returned if none of the requested ranges can be satisfied.
+    """
+    unit, _, range_set = header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+    ranges = []
+    for range_spec in range_set.split(","):
+        first, dash, last = range_spec.strip().partition("-")
+        if not dash or not (first or last):
+            return None
+        if not all(value.isdigit() for value in (first, last) if value):
+            return None
+        if first:
+            start = int(first)
+            stop = int(last) + 1 if last else size
+            if last and stop <= start:
+                return None
+        else:
+            # suffix range: the last n bytes
+            start, stop = max(size - int(last), 0), size
+        if start < size and stop > start:
+            ranges.append((start, min(stop, size)))
+    return ranges
+
+
+def iter_chunks(buffer, start, stop, chunk_size=CHUNK_SIZE):
+    """yields the data of a buffer in chunks
+
+    buffer should be a memoryview, so slicing does not copy the data and
+    only one chunk at a time is materialized as bytes.
+    """
+    for position in range(start, stop, chunk_size):
+        end = min(position + chunk_size, stop)
+        yield bytes(buffer[position:end])
+
+
+class MultipartByteranges:
+    """the body of a "multipart/byteranges" response
+
+    The content length is known before the body is iterated.
+    """
+
+    def __init__(self, buffer, ranges, content_type):
+        self.buffer = buffer
+        self.ranges = ranges
+        self.boundary = secrets.token_hex(16)
+        self.content_type = f"multipart/byteranges; boundary={self.boundary}"
+        size = len(buffer)
+        self._heads = [
+            (
+                f"--{self.boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode("ascii")
+            for start, stop in ranges
+        ]
+        self._tail = f"--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_length(self):
+        """the length of the complete body in bytes"""
+        data_length = sum(stop - start + 2 for start, stop in self.ranges)
+        head_length = sum(len(head) for head in self._heads)
+        return data_length + head_length + len(self._tail)
+
+    def __iter__(self):
+        for head, (start, stop) in zip(self._heads, self.ranges):
+            yield head
+            yield from iter_chunks(self.buffer, start, stop)
+            yield b"\r\n"
+        yield self._tail
+
+
+class ClosingIterator:
+    """an app_iter calling functions when it is closed
+
+    The WSGI server only closes the outermost app_iter, wrapped iterators
+    and the resources used to produce them must be closed by the wrapper.
+    """
+
+    def __init__(self, app_iter, *callbacks):
+        self.app_iter = app_iter
+        self.callbacks = callbacks
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            close = getattr(self.app_iter, "close", None)
+            if close is not None:
+                close()
+        finally:
+            for callback in self.callbacks:
+                callback()
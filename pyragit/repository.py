@@ -0,0 +1,113 @@
+""" Pyragit: shared repository handles """
+
+import queue
+import contextlib
+
+import pygit2
+from pyramid.exceptions import ConfigurationError
+
+from .ranges import ClosingIterator
+from .metrics import timed
+
+OPEN_FLAGS = (
+    pygit2.GIT_REPOSITORY_OPEN_BARE | pygit2.GIT_REPOSITORY_OPEN_NO_DOTGIT
+)
+
+
+class RepositoryPool:
+    """a pool of pygit2 repository handles, reused across requests
+
+    Reusing the handles keeps the object cache and the memory mapped pack
+    files of libgit2 warm. A handle is only used by one thread at a time. If
+    all handles are in use, a new one is opened and the pool keeps up to
+    size idle handles.
+    """
+
+    def __init__(self, path, size=4):
+        self.path = pygit2.discover_repository(path)
+        if self.path is None:
+            raise ConfigurationError(f"No git repository found at {path}")
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def open(self):
+        """open a new repository handle"""
+        return pygit2.Repository(self.path, OPEN_FLAGS)
+
+    def acquire(self):
+        """get an idle handle from the pool or open a new one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.open()
+
+    def release(self, repository):
+        """return a handle to the pool"""
+        if self._idle.qsize() < self.size:
+            self._idle.put_nowait(repository)
+
+    def clear(self):
+        """drop the idle handles, to free the memory of their caches"""
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+    @contextlib.contextmanager
+    def repository(self):
+        """context manager for using a handle outside of a request"""
+        repository = self.acquire()
+        try:
+            yield repository
+        finally:
+            self.release(repository)
+
+
+class Lease:
+    """a handle of the pool, used by a request
+
+    The handle is returned to the pool when the request is finished. If the
+    body of the response is produced after that, like for a streamed
+    template, the release is deferred until the body is closed.
+    """
+
+    def __init__(self, pool, repository):
+        self.pool = pool
+        self.repository = repository
+        self.deferred = False
+        self.released = False
+
+    def finished(self, request):
+        """finished callback of the request"""
+        if not self.deferred:
+            self.release()
+
+    def release(self):
+        """return the handle to the pool, only once"""
+        if not self.released:
+            self.released = True
+            self.pool.release(self.repository)
+
+
+def request_repository(request, pool):
+    """get a handle from the pool, returned when the request is finished"""
+    with timed(request, "repository"):
+        repository = pool.acquire()
+    lease = Lease(pool, repository)
+    request.environ["pyragit.repository_lease"] = lease
+    request.add_finished_callback(lease.finished)
+    return repository
+
+
+def hold_repository(request, app_iter):
+    """keep the handle of a request until the app_iter is closed
+
+    Use this for response bodies using the repository while they are
+    iterated, after the request is finished.
+    """
+    lease = request.environ.get("pyragit.repository_lease", None)
+    if lease is None or lease.released:
+        return app_iter
+    lease.deferred = True
+    return ClosingIterator(app_iter, lease.release)
@@ -1,77 +1,111 @@
 """ Pyragit: Pyramid Traversal Resources """
 
-
-import functools
+import html
 from datetime import datetime
 
 import pygit2
+from pyramid.settings import asbool
+from pyramid.decorator import reify
 from pyramid.exceptions import ConfigurationError
 
+from .cache import BlobCache
+from .markup import RenderError
+from .history import HistoryIndex, HistoryIndexCache, walk_last_commits
+from .metrics import timed
+from .snapshot import Snapshot, SnapshotCache
+from .repository import RepositoryPool, request_repository
+
+# view names, that are not looked up as revisions
+RESERVED_NAMES = {"@history", "@diff", "@backlinks"}
+
+
+def load_object(request, oid):
+    """load a git object, an object is only loaded once per request
+
+    The objects are kept in a dictionary attached to the request, so nothing
+    is retained after the request is finished.
+    """
+    git_objects = getattr(request, "git_objects", None)
+    if git_objects is None:
+        return request.repository[oid]
+    git_object = git_objects.get(oid, None)
+    if git_object is None:
+        git_object = git_objects[oid] = request.repository[oid]
+    return git_object
+
+
+def load_buffer(request, oid):
+    """a read only memoryview of the data of a git blob
+
+    Small blobs are kept in the blob cache shared between requests, larger
+    ones are loaded for this request only, without copying their data.
+    """
+    blob_cache = getattr(request, "blob_cache", None)
+    data = None if blob_cache is None else blob_cache.get(oid)
+    if data is None:
+        blob = load_object(request, oid)
+        if blob_cache is None or blob.size > blob_cache.max_item_size:
+            return memoryview(blob)
+        data = blob.data
+        blob_cache.set(oid, data)
+    return memoryview(data)
+
 
 class BaseResource:
-    """base class for all resources"""
+    """base class for all resources
+
+    The resources are thin wrappers around the nodes of a tree snapshot
+    """
 
-    def __init__(self, tree_entry, parent):
-        self.__name__ = tree_entry.name
+    def __init__(self, node, parent):
+        self.__name__ = node.name
         self.__parent__ = parent
-        self.pygit2_tree_entry = tree_entry
+        self.node = node
         self.request = parent.request
+        self.revision = parent.revision
 
-    @property
-    @functools.lru_cache(maxsize=128)
+    @reify
+    def pygit2_tree_entry(self):
+        """the tree entry of the resource in the pygit2 tree of the parent"""
+        return self.__parent__.pygit2_object[self.__name__]
+
+    @reify
     def pygit2_object(self):
         """lazy loading of the pygit2 object"""
-        oid = self.pygit2_tree_entry.oid
-        return self.request.repository[oid]
+        return load_object(self.request, self.oid)
+
+    @property
+    def oid(self):
+        """the git object id of the resource"""
+        return self.node.oid
 
     @property
     def type(self):
         """returns the type of the resource, either 'tree' or 'blob'"""
-        # Root has no tree entry, but is a Folder
-        if self.__name__ is None:
-            return "tree"
-        elif self.pygit2_tree_entry.type == pygit2.GIT_OBJ_TREE:
-            return "tree"
-        else:
-            return "blob"
+        return "tree" if self.node.is_tree else "blob"
 
     @property
-    @functools.lru_cache(maxsize=128)
+    def git_path(self):
+        """the path of the resource inside the git repository"""
+        return self.node.path
+
+    @reify
     def last_commit(self):
         """get the last commit of the resource
 
-        from https://stackoverflow.com/questions/13293052/pygit2-blob-history
+        If a history index is available, this is a simple lookup. Otherwise
+        the history is walked.
         """
-        # get the relative path inside the git repo and
-        # remove trailing and leading slashes if present
-        git_path = self.request.resource_path(self)
-        git_path = git_path[1:]
-        if git_path.endswith("/"):
-            git_path = git_path[:-1]
-
-        # the latest git object id to compare earlier commits to
-        last_oid = self.pygit2_tree_entry.oid
-        last_commit = None
         repo = self.request.repository
-        # walk through every commit, starting at the latests
-        for commit in repo.walk(repo.head.target, pygit2.GIT_SORT_TIME):
-            # get the object id of the git path if it exists or None
-            if git_path in commit.tree:
-                oid = commit.tree[git_path].oid
-            else:
-                oid = None
-            # has the object id changed to the commit before?
-            # will be False on the latest commit since the current object id
-            # was stored before
-            if oid != last_oid:
-                return last_commit
-
-            # the current commit object is now the last commit object
-            last_commit = commit
-
-        # looped through all commits, never changed, therefore it was present
-        # in the first commit ever made
-        return last_commit
+        history_index = self.revision.history_index
+        with timed(self.request, "last_commit"):
+            if history_index is not None:
+                return history_index.last_commit(
+                    repo, self.git_path, self.revision.revision_id
+                )
+            paths = {self.git_path: self.oid}
+            commit_id = self.revision.commit_id
+            return walk_last_commits(repo, paths, commit_id)[self.git_path]
 
     @property
     def author(self):
@@ -82,85 +116,181 @@ class BaseResource:
         return datetime.fromtimestamp(float(self.last_commit.author.time))
 
 
+def resource_for(node, parent):
+    """create the resource for a snapshot node"""
+    if node.is_tree:
+        return Folder(node, parent)
+    if node.renderer is None:
+        return File(node, parent)
+    return Markup(node, parent)
+
+
 class Folder(BaseResource):
     """Resource representing a git tree (like a folder in a file system)"""
 
-    @property
-    @functools.lru_cache(maxsize=128)
+    @reify
     def index(self):
         """get the markup index file of the folder or None"""
-        blobs = (
-            e for e in self.pygit2_object if e.type == pygit2.GIT_OBJ_BLOB
-        )
-        index_files = (e for e in blobs if e.name.lower().startswith("index."))
-        for entry in index_files:
-            renderer = self.request.get_markup_renderer(entry.name)
-            if renderer:
-                return Markup(entry, self, renderer)
-        return None
+        if self.node.index is None:
+            return None
+        return Markup(self.node.index, self)
 
     def __getitem__(self, key):
-        """Dict like access to child resources"""
+        """Dict like access to child resources
 
-        # hidden files (starting with a dot) are forbidden to access
-        if key.startswith("."):
-            raise KeyError
+        hidden files (starting with a dot) and non file entries, like git
+        notes, are not part of the snapshot and raise a KeyError
+        """
+        return resource_for(self.node.children[key], self)
 
-        tree_entry = self.pygit2_object[key]
-        if tree_entry.type == pygit2.GIT_OBJ_TREE:
-            return Folder(tree_entry, self)
+    def __iter__(self):
+        """iterate over renderable child resources
 
-        if tree_entry.type != pygit2.GIT_OBJ_BLOB:
-            # non file entry, might be a git note object
-            # or something else
-            raise KeyError
+        first the folders, then the markup files except the index file, each
+        ordered by lower case name
+        """
+        for node in self.node.listing:
+            yield resource_for(node, self)
 
-        renderer = self.request.get_markup_renderer(key)
-        if renderer is None:
-            return File(tree_entry, self)
-        else:
-            return Markup(tree_entry, self, renderer)
+    def listing(self):
+        """the child resources with their last commits looked up in a batch
 
-    def __iter__(self):
-        """iterate over renderable child resources"""
-        # exclude hidden files and order by lowre case name
-        allowed = (e for e in self.pygit2_object if not e.name.startswith("."))
-        ordered = sorted(allowed, key=lambda e: e.name.lower())
-        # first list the folders
-        trees = (e for e in ordered if e.type == pygit2.GIT_OBJ_TREE)
-        for entry in trees:
-            yield Folder(entry, self)
-        # then list the markup files
-        blobs = (e for e in ordered if e.type == pygit2.GIT_OBJ_BLOB)
-        # except the index file used
-        index_name = self.index.__name__ if self.index else None
-        non_index = (e for e in blobs if e.name != index_name)
-        for entry in non_index:
-            renderer = self.request.get_markup_renderer(entry.name)
-            if renderer:
-                yield Markup(entry, self, renderer)
+        Without a history index, the last commits of all child resources are
+        found in one walk over the history instead of one walk per child.
+        """
+        children = list(self)
+        if self.revision.history_index is None:
+            paths = {child.git_path: child.oid for child in children}
+            repo = self.request.repository
+            commit_id = self.revision.commit_id
+            last_commits = walk_last_commits(repo, paths, commit_id)
+            for child in children:
+                child.last_commit = last_commits[child.git_path]
+        return children
 
 
 class Root(Folder):
-    """the root resource for traversal"""
+    """the root resource for traversal, showing the HEAD commit
+
+    Other branches, tags or commits are available as "@" followed by the
+    name of the reference or the commit id, like "/@v2.1/docs/".
+    """
+
+    # only pages of a commit addressed by its full id never change
+    immutable = False
+    # the request attribute of the shared snapshot cache
+    snapshot_cache = "tree_snapshots"
 
     def __init__(self, request):
         self.__name__ = None
         self.__parent__ = None
         self.request = request
+        self.revision = self
+        self.node = self.snapshot.root
+
+    def __getitem__(self, key):
+        """Dict like access to child resources and other revisions
+
+        Files and folders starting with "@" take precedence over references
+        with the same name.
+        """
+        if not key.startswith("@"):
+            return super().__getitem__(key)
+        if key in RESERVED_NAMES:
+            raise KeyError(key)
+        if key in self.node.children:
+            return super().__getitem__(key)
+        ref = key[1:]
+        try:
+            git_object = self.request.repository.revparse_single(ref)
+            commit = git_object.peel(pygit2.Commit)
+        except (KeyError, ValueError, pygit2.GitError):
+            raise KeyError(key)
+        return Revision(key, self, commit.id, immutable=commit.hex == ref)
+
+    @reify
+    def revision_id(self):
+        """the id of the commit to show
+
+        This is HEAD, unless another commit is set in the request environment
+        as "pyragit.revision_id", like it is done for a static export.
+        """
+        head = self.request.repository.head.target
+        return self.request.environ.get("pyragit.revision_id", head)
+
+    @reify
+    def history_index(self):
+        """the shared history index of HEAD
+
+        Another commit set in the request environment uses the index of
+        this commit from the history index cache, like for a static export
+        of a tag.
+        """
+        if self.revision_id != self.request.repository.head.target:
+            history_indexes = getattr(self.request, "history_indexes", None)
+            if history_indexes is None:
+                return None
+            return history_indexes.get(self.revision_id)
+        return getattr(self.request, "history_index", None)
+
+    @reify
+    def snapshot(self):
+        """the tree snapshot of the commit
+
+        If no shared snapshot cache is available, the snapshot is built for
+        this resource only.
+        """
+        repo = self.request.repository
+        get_markup_renderer = self.request.get_markup_renderer
+        commit_id = self.revision_id
+        snapshots = getattr(self.request, self.snapshot_cache, None)
+        if snapshots is None:
+            return Snapshot(repo, commit_id, get_markup_renderer)
+        return snapshots.get(repo, commit_id, get_markup_renderer)
 
     @property
+    def commit_id(self):
+        """the id of the commit the snapshot was built from"""
+        return self.snapshot.commit_id
+
+    @reify
     def pygit2_object(self):
         """lazy loading of the pygit2 object not required on root resource"""
         return self.last_commit.tree
 
-    @property
+    @reify
     def last_commit(self):
         """get the last commit of the resource
 
         On the root resource, this is only a simple lookup
         """
-        return self.request.repository.head.peel()
+        return load_object(self.request, self.commit_id)
+
+
+class Revision(Root):
+    """the root resource for a branch, tag or commit other than HEAD
+
+    The last commits of the resources are looked up by walking the history,
+    the shared history index only covers HEAD. The snapshots are kept in
+    a separate cache, visiting old revisions does not evict the snapshot of
+    HEAD.
+    """
+
+    history_index = None
+    snapshot_cache = "revision_snapshots"
+
+    def __init__(self, name, parent, commit_id, immutable=False):
+        self.__name__ = name
+        self.__parent__ = parent
+        self.request = parent.request
+        self.revision = self
+        self.revision_id = commit_id
+        self.immutable = immutable
+        self.node = self.snapshot.root
+
+    def __getitem__(self, key):
+        """revisions can not be nested"""
+        return Folder.__getitem__(self, key)
 
 
 class File(BaseResource):
@@ -169,29 +299,63 @@ class File(BaseResource):
     @property
     def data(self):
         """the binary data of the file"""
-        return self.pygit2_object.data
+        return self.buffer.tobytes()
 
     @property
     def size(self):
         """the size of the binary data of the file"""
-        return self.pygit2_object.size
+        return self.buffer.nbytes
+
+    @reify
+    def buffer(self):
+        """a read only memoryview of the data, avoiding a copy"""
+        return load_buffer(self.request, self.oid)
 
 
 class Markup(BaseResource):
     """Resource for a markup file that could be rendered"""
 
-    def __init__(self, tree_entry, parent, rendering_func):
-        super().__init__(tree_entry, parent)
-        self.renderer = rendering_func
+    def __init__(self, node, parent):
+        super().__init__(node, parent)
+        self.renderer = node.renderer
+
+    @reify
+    def buffer(self):
+        """a read only memoryview of the markup source"""
+        return load_buffer(self.request, self.oid)
+
+    @property
+    def size(self):
+        """the size of the markup source"""
+        return self.buffer.nbytes
 
     @property
     def text(self):
         """access the text content of the file"""
-        return self.pygit2_object.data.decode("utf-8")
+        return str(self.buffer, "utf-8")
 
     def render(self):
-        """returned the rendered representation of the markup file"""
-        return self.renderer(self.text)
+        """returned the rendered representation of the markup file
+
+        If the renderer provides a cache key, the output is cached by the
+        object id of the git blob. If the document could not be rendered,
+        an error message is returned and the response must not be stored.
+        """
+        render_cache = getattr(self.request, "render_cache", None)
+        with timed(self.request, "render"):
+            try:
+                if render_cache is None:
+                    return self.renderer(self.text)
+                return render_cache.render(
+                    self.oid, self.renderer, lambda: self.text
+                )
+            except RenderError as error:
+                response = self.request.response
+                response.etag = None
+                response.last_modified = None
+                response.headers["Cache-Control"] = "no-store"
+                message = html.escape(str(error))
+                return f'<p class="pyragit-render-error">{message}</p>'
 
 
 def includeme(config):
@@ -203,20 +367,70 @@ def includeme(config):
     """
     settings = config.get_settings()
 
+    # git objects loaded during a request
+    config.add_request_method(lambda r: {}, "git_objects", reify=True)
+
+    # set the root factory for traverssal
+    config.set_root_factory(Root)
+
+    # small blobs are shared between requests and hosted repositories,
+    # their object ids only depend on the content
+    blob_cache_size = int(settings.get("pyragit.blob_cache.size", 67108864))
+    if blob_cache_size > 0:
+        blob_cache = BlobCache(
+            blob_cache_size,
+            int(settings.get("pyragit.blob_cache.max_item_size", 1048576)),
+        )
+        config.registry.blob_cache = blob_cache
+        config.add_request_method(
+            lambda r: blob_cache, "blob_cache", reify=True
+        )
+
+    if settings.get("pyragit.repositories", None):
+        config.include("pyragit.hosting")
+        return
+
     repo_path = settings.get("pyragit.repository_path", None)
     if repo_path is None:
         raise ConfigurationError("Repository Path not set")
 
-    # make request.repository available for use in Pyramid
+    # make request.repository available for use in Pyramid, the handles
+    # are shared between requests
+    pool_size = int(settings.get("pyragit.repository_pool_size", 4))
+    repository_pool = RepositoryPool(repo_path, pool_size)
+    config.registry.repository_pool = repository_pool
     config.add_request_method(
-        lambda r: pygit2.Repository(
-            pygit2.discover_repository(repo_path),
-            pygit2.GIT_REPOSITORY_OPEN_BARE
-            | pygit2.GIT_REPOSITORY_OPEN_NO_DOTGIT,
-        ),
+        lambda r: request_repository(r, repository_pool),
         "repository",
         reify=True,
     )
 
-    # set the root factory for traverssal
-    config.set_root_factory(Root)
+    # a shared index of the last commit changing a path
+    if asbool(settings.get("pyragit.history_index", True)):
+        history_index = HistoryIndex(
+            settings.get("pyragit.history_index.path", None) or None
+        )
+        config.registry.history_index = history_index
+        config.add_request_method(
+            lambda r: history_index, "history_index", reify=True
+        )
+
+    # the history indexes of other revisions, for the "@history" views
+    history_indexes = HistoryIndexCache()
+    config.registry.history_indexes = history_indexes
+    config.add_request_method(
+        lambda r: history_indexes, "history_indexes", reify=True
+    )
+
+    # snapshots of the navigable tree, shared between requests
+    snapshot_cache = SnapshotCache()
+    config.registry.tree_snapshots = snapshot_cache
+    config.add_request_method(
+        lambda r: snapshot_cache, "tree_snapshots", reify=True
+    )
+    # other revisions do not evict the snapshot of HEAD
+    revision_snapshots = SnapshotCache()
+    config.registry.revision_snapshots = revision_snapshots
+    config.add_request_method(
+        lambda r: revision_snapshots, "revision_snapshots", reify=True
+    )
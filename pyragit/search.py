@@ -0,0 +1,191 @@
+""" Pyragit: full text search over the markup documents """
+
+import html
+import sqlite3
+import threading
+import contextlib
+
+import pygit2
+from pyramid.exceptions import ConfigurationError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, oid TEXT);
+CREATE INDEX IF NOT EXISTS paths_oid ON paths (oid);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents
+    USING fts5(oid UNINDEXED, title, body);
+"""
+
+# markers for highlighted terms in snippets, replaced after escaping
+MARK_START, MARK_END = "\x02", "\x03"
+
+
+def get_title(text):
+    """the first non empty line of a document, without markdown heading"""
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").strip()
+        if line:
+            return line
+    return ""
+
+
+def fts_query(query):
+    """turn user input into a fts5 query, matching all words"""
+    words = (word.replace('"', '""') for word in query.split())
+    return " ".join(f'"{word}"' for word in words)
+
+
+def format_snippet(snippet):
+    """escape a snippet and highlight the matched terms"""
+    escaped = html.escape(snippet)
+    return escaped.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+class SearchIndex:
+    """an inverted index of the markup documents stored in sqlite
+
+    Documents are stored by their blob id, so unchanged files are never
+    indexed twice. When HEAD moves, only the paths changed between the old
+    and the new tree are updated.
+    """
+
+    def __init__(self, path, get_markup_renderer):
+        self.path = path
+        self.get_markup_renderer = get_markup_renderer
+        self.head = None
+        self._lock = threading.Lock()
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'head'"
+            ).fetchone()
+            if row is not None:
+                self.head = pygit2.Oid(hex=row[0])
+
+    @contextlib.contextmanager
+    def connect(self):
+        """a connection to the database, committed if no error occurs"""
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def is_searchable(self, path):
+        """only accessible markup documents are indexed"""
+        names = path.split("/")
+        if any(name.startswith(".") for name in names):
+            return False
+        return self.get_markup_renderer(names[-1]) is not None
+
+    def update(self, repository, target=None):
+        """bring the index up to date with HEAD or another commit id"""
+        target = target or repository.head.target
+        if target == self.head:
+            return
+        with self._lock, self.connect() as connection:
+            if target == self.head:
+                return
+            new_tree = repository[target].peel(pygit2.Tree)
+            if self.head is None:
+                diff = new_tree.diff_to_tree(swap=True)
+            else:
+                old_tree = repository[self.head].peel(pygit2.Tree)
+                diff = old_tree.diff_to_tree(new_tree)
+            for delta in diff.deltas:
+                if delta.status != pygit2.GIT_DELTA_ADDED:
+                    connection.execute(
+                        "DELETE FROM paths WHERE path = ?",
+                        (delta.old_file.path,),
+                    )
+                if delta.status == pygit2.GIT_DELTA_DELETED:
+                    continue
+                path, oid = delta.new_file.path, delta.new_file.id.hex
+                if self.is_searchable(path):
+                    connection.execute(
+                        "INSERT OR REPLACE INTO paths VALUES (?, ?)",
+                        (path, oid),
+                    )
+                    self._add_document(connection, repository, oid)
+            # remove documents that are not used by any path
+            connection.execute(
+                "DELETE FROM documents WHERE oid NOT IN "
+                "(SELECT oid FROM paths)"
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('head', ?)",
+                (target.hex,),
+            )
+        self.head = target
+
+    def _add_document(self, connection, repository, oid):
+        """tokenize a document, if not already in the index"""
+        known = connection.execute(
+            "SELECT 1 FROM documents WHERE oid = ?", (oid,)
+        ).fetchone()
+        if known:
+            return
+        text = repository[oid].data.decode("utf-8", errors="replace")
+        connection.execute(
+            "INSERT INTO documents VALUES (?, ?, ?)",
+            (oid, get_title(text), text),
+        )
+
+    def search(self, query, limit=20):
+        """the best matching documents as (path, title, snippet) tuples"""
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT paths.path, documents.title, "
+            "snippet(documents, 2, ?, ?, '…', 16) "
+            "FROM documents JOIN paths ON paths.oid = documents.oid "
+            "WHERE documents MATCH ? "
+            "ORDER BY bm25(documents, 0.0, 10.0, 1.0) LIMIT ?"
+        )
+        with self.connect() as connection:
+            rows = connection.execute(
+                sql, (MARK_START, MARK_END, match, limit)
+            ).fetchall()
+        return [
+            (path, title, format_snippet(snippet))
+            for path, title, snippet in rows
+        ]
+
+
+def search_view(context, request):
+    """full text search over the markup documents"""
+    query = request.params.get("q", "").strip()
+    results = []
+    if query:
+        search_index = request.registry.search_index
+        search_index.update(request.repository)
+        results = search_index.search(query)
+    return {"query": query, "results": results}
+
+
+def includeme(config):
+    """
+    enables the full text search if an index path is configured
+
+    Activate this setup using ``config.include('pyragit.search')``, after the
+    markup setup is included.
+    """
+    settings = config.get_settings()
+    index_path = settings.get("pyragit.search.index_path", None)
+    if not index_path:
+        return
+    if getattr(config.registry, "hosting", None) is not None:
+        raise ConfigurationError(
+            "The full text search only supports a single repository"
+        )
+    config.registry.search_index = SearchIndex(
+        index_path, config.registry.get_markup_renderer
+    )
+    config.add_view(
+        search_view,
+        context="pyragit.resources.Root",
+        name="search",
+        renderer="pyragit:templates/search.jinja2",
+    )
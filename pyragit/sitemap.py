@@ -0,0 +1,355 @@
+""" Pyragit: site map, navigation tree and backlinks of a commit
+
+The titles and links of all markup pages are collected once per commit from
+the rendered documents and kept in memory. They are available as
+"/sitemap.xml", as a compact navigation tree at "/nav.json" and as the
+backlinks of a page at "/path/@backlinks".
+
+The title and the links of a document are cached by its blob id, after a
+push only the changed documents are parsed again.
+"""
+
+import json
+import hashlib
+import posixpath
+import threading
+import html.parser
+from urllib.parse import quote, unquote, urljoin, urlsplit
+from xml.sax.saxutils import escape
+
+from .cache import LRUCache
+from .views import commit_time, not_modified
+from .markup import RenderError
+from .repository import hold_repository
+
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# paths served by the application, that are not part of the git tree
+APP_PATHS = {"static", "search", "metrics", "sitemap.xml", "nav.json"}
+
+
+class LinkParser(html.parser.HTMLParser):
+    """collects the first heading and the link targets of rendered markup"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.links = []
+        self._heading = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href"):
+            self.links.append(attrs["href"])
+        elif tag == "img" and attrs.get("src"):
+            self.links.append(attrs["src"])
+        elif tag in HEADINGS and self.title is None:
+            self._heading = []
+
+    def handle_endtag(self, tag):
+        if tag in HEADINGS and self._heading is not None:
+            self.title = "".join(self._heading).strip()
+            self._heading = None
+
+    def handle_data(self, data):
+        if self._heading is not None:
+            self._heading.append(data)
+
+
+def parse_page(rendered):
+    """the title and the link targets of a rendered page"""
+    parser = LinkParser()
+    parser.feed(rendered)
+    parser.close()
+    return parser.title, tuple(parser.links)
+
+
+def link_target(folder_path, href):
+    """the git path a link on a page in a folder points to
+
+    Pages are shown with their folder as base url. Returns None for links
+    to other sites, to anchors on the same page and to views or other
+    revisions, like "@history".
+    """
+    parts = urlsplit(href)
+    if parts.scheme or parts.netloc or not parts.path:
+        return None
+    base = f"/{folder_path}/" if folder_path else "/"
+    path = posixpath.normpath(urljoin(base, unquote(parts.path)))
+    names = [name for name in path.split("/") if name]
+    if names and names[0] in APP_PATHS:
+        return None
+    if any(name.startswith("@") for name in names):
+        return None
+    return "/".join(names)
+
+
+def render_page(repository, node, render_cache=None):
+    """render a markup document, using the render cache if available"""
+
+    def get_text():
+        return repository[node.oid].data.decode("utf-8", errors="replace")
+
+    if render_cache is None:
+        return node.renderer(get_text())
+    return render_cache.render(node.oid, node.renderer, get_text)
+
+
+class Page:
+    """the title and the links of a markup page
+
+    links contains the paths of the existing nodes the page links to,
+    broken the links that can not be resolved.
+    """
+
+    __slots__ = ("path", "title", "links", "broken")
+
+    def __init__(self, path, title, links, broken):
+        self.path = path
+        self.title = title
+        self.links = links
+        self.broken = broken
+
+
+class SiteMap:
+    """the pages, their titles and links of a tree snapshot"""
+
+    def __init__(self, snapshot, pages):
+        self.snapshot = snapshot
+        self.commit_id = snapshot.commit_id
+        self.pages = pages
+        self.backlinks = {}
+        for path, page in pages.items():
+            for target in page.links:
+                self.backlinks.setdefault(target, []).append(path)
+        tree = self.nav_entry(snapshot.root)
+        self.nav_json = json.dumps(tree, separators=(",", ":"))
+
+    def title(self, node):
+        """the title of a page, or of the index page of a folder"""
+        if node.is_tree:
+            node = node.index
+        page = self.pages.get(node.path) if node is not None else None
+        return page.title if page is not None else None
+
+    def nav_entry(self, node):
+        """the entry of a node in the navigation tree"""
+        entry = {"name": node.name, "path": node.path}
+        title = self.title(node)
+        if title:
+            entry["title"] = title
+        if node.is_tree:
+            entry["children"] = [
+                self.nav_entry(child) for child in node.listing
+            ]
+        return entry
+
+    def urls(self, base_url, lastmod=None):
+        """generate the <url> elements of a sitemap, one per page
+
+        lastmod is an optional function returning the date of the last
+        change of a path.
+        """
+        for node in self.snapshot.walk():
+            if not node.is_tree and node.renderer is None:
+                continue
+            path = quote(f"{node.path}/") if node.path else ""
+            element = f"<url><loc>{escape(base_url + path)}</loc>"
+            date = lastmod(node.path) if lastmod is not None else None
+            if date is not None:
+                element += f"<lastmod>{date}</lastmod>"
+            yield element + "</url>\n"
+
+    def sitemap_xml(self, base_url, lastmod=None):
+        """generate the sitemap in chunks"""
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        yield from self.urls(base_url, lastmod)
+        yield "</urlset>\n"
+
+
+def build_site_map(repository, snapshot, render_cache=None, parsed=None):
+    """render all pages of a snapshot and collect their titles and links
+
+    parsed is an optional cache of the titles and link targets by blob id
+    and renderer.
+    """
+    pages = {}
+    for node in snapshot.walk():
+        if node.is_tree or node.renderer is None:
+            continue
+        cache_key = getattr(node.renderer, "cache_key", None)
+        key = f"{node.oid.hex}:{cache_key}" if cache_key else None
+        result = parsed.get(key) if parsed is not None and key else None
+        if result is None:
+            try:
+                rendered = render_page(repository, node, render_cache)
+            except RenderError:
+                # might work next time, the result is not cached
+                result = (None, ())
+            else:
+                result = parse_page(rendered)
+                if parsed is not None and key:
+                    parsed.set(key, result)
+        title, hrefs = result
+        folder_path = posixpath.dirname(node.path)
+        links, broken = [], []
+        for href in hrefs:
+            target = link_target(folder_path, href)
+            if target is None or target == node.path:
+                continue
+            try:
+                snapshot.find(target)
+            except KeyError:
+                broken.append(href)
+                continue
+            if target not in links:
+                links.append(target)
+        pages[node.path] = Page(node.path, title, tuple(links), tuple(broken))
+    return SiteMap(snapshot, pages)
+
+
+class SiteMapCache:
+    """keeps the site maps of the most recently used commits
+
+    A site map is built only once, even if requested by concurrent threads.
+    The parsed documents are kept by their blob id for the next commit.
+    """
+
+    def __init__(self, maxsize=2, parsed_size=4096):
+        self.site_maps = LRUCache(maxsize)
+        self.parsed = LRUCache(parsed_size)
+        self._lock = threading.Lock()
+
+    def get(self, repository, snapshot, render_cache=None):
+        """get the site map for a tree snapshot"""
+        site_map = self.site_maps.get(snapshot.commit_id)
+        if site_map is None:
+            with self._lock:
+                site_map = self.site_maps.get(snapshot.commit_id)
+                if site_map is None:
+                    site_map = build_site_map(
+                        repository, snapshot, render_cache, self.parsed
+                    )
+                    self.site_maps.set(snapshot.commit_id, site_map)
+        return site_map
+
+
+def request_site_map(request, revision):
+    """the site map of the revision of a request
+
+    The site maps of HEAD are shared between requests.
+    """
+    render_cache = getattr(request, "render_cache", None)
+    site_maps = getattr(request, "site_maps", None)
+    if site_maps is None:
+        site_maps = SiteMapCache()
+    return site_maps.get(request.repository, revision.snapshot, render_cache)
+
+
+def site_map_not_modified(context, request, name):
+    """check the conditional request headers, site maps change per commit
+
+    The name identifies the view in the entity tag, the views show
+    different representations of the same site map.
+    """
+    commit = context.revision.last_commit
+    return not_modified(request, f"{name}-{commit.hex}", commit_time(commit))
+
+
+def sitemap_view(context, request):
+    """the pages of a revision in the sitemap xml format, streamed"""
+    response = site_map_not_modified(context, request, "sitemap")
+    if response is not None:
+        return response
+    site_map = request_site_map(request, context)
+    history_index = context.history_index
+    repository = request.repository
+
+    def lastmod(path):
+        # without an index, looking up the dates would walk the history
+        if history_index is None:
+            return None
+        commit = history_index.last_commit(
+            repository, path, context.revision_id
+        )
+        if commit is None:
+            return None
+        return commit_time(commit).strftime("%Y-%m-%d")
+
+    base_url = request.resource_url(context)
+    response = request.response
+    response.content_type = "application/xml"
+    response.charset = "utf-8"
+    # the dates are looked up while the body is produced
+    app_iter = (
+        part.encode("utf-8")
+        for part in site_map.sitemap_xml(base_url, lastmod)
+    )
+    response.app_iter = hold_repository(request, app_iter)
+    return response
+
+
+def nav_view(context, request):
+    """the navigation tree of a revision as compact json"""
+    response = site_map_not_modified(context, request, "nav")
+    if response is not None:
+        return response
+    site_map = request_site_map(request, context)
+    base = json.dumps(request.resource_path(context))
+    response = request.response
+    response.content_type = "application/json"
+    response.charset = "utf-8"
+    response.text = (
+        f'{{"commit":"{site_map.commit_id.hex}","base":{base},'
+        f'"tree":{site_map.nav_json}}}'
+    )
+    return response
+
+
+def backlinks_view(context, request):
+    """the pages linking to a resource"""
+    # files with the same content share the object id, but not the links
+    digest = hashlib.sha1(context.git_path.encode("utf-8")).hexdigest()
+    name = f"backlinks-{context.oid.hex}-{digest[:16]}"
+    response = site_map_not_modified(context, request, name)
+    if response is not None:
+        return response
+    site_map = request_site_map(request, context.revision)
+    paths = site_map.backlinks.get(context.git_path, [])
+    return [
+        {"path": path, "title": site_map.pages[path].title} for path in paths
+    ]
+
+
+def includeme(config):
+    """
+    serves the site map, the navigation tree and the backlinks
+
+    Activate this setup using ``config.include('pyragit.sitemap')``, after
+    the resources and markup setups are included.
+    """
+    hosting = getattr(config.registry, "hosting", None)
+    if hosting is None:
+        site_maps = SiteMapCache()
+        config.registry.site_maps = site_maps
+        config.add_request_method(
+            lambda r: site_maps, "site_maps", reify=True
+        )
+    else:
+        config.add_request_method(
+            lambda r: r.site.site_maps, "site_maps", reify=True
+        )
+
+    config.add_view(
+        sitemap_view, context="pyragit.resources.Root", name="sitemap.xml"
+    )
+    config.add_view(
+        nav_view, context="pyragit.resources.Root", name="nav.json"
+    )
+    config.add_view(
+        backlinks_view,
+        context="pyragit.resources.BaseResource",
+        name="@backlinks",
+        renderer="json",
+    )
@@ -0,0 +1,145 @@
+""" Pyragit: in memory snapshot of the navigable tree of a commit """
+
+import threading
+
+import pygit2
+
+from .cache import LRUCache
+
+
+class Node:
+    """an entry in a tree snapshot
+
+    For folders, children maps the names of all accessible entries to their
+    nodes, listing contains the nodes shown in a folder listing in the order
+    they should be displayed and index is the node of the index document.
+    For files, renderer is the markup renderer to use or None.
+    """
+
+    __slots__ = (
+        "name",
+        "path",
+        "oid",
+        "is_tree",
+        "renderer",
+        "children",
+        "listing",
+        "index",
+    )
+
+    def __init__(self, name, path, oid, is_tree, renderer=None):
+        self.name = name
+        self.path = path
+        self.oid = oid
+        self.is_tree = is_tree
+        self.renderer = renderer
+        self.children = None
+        self.listing = ()
+        self.index = None
+
+    def __repr__(self):
+        return f"<Node {self.path or '/'} {self.oid}>"
+
+
+def build_node(repository, tree, name, path, get_markup_renderer):
+    """recursively build the node for a git tree"""
+    node = Node(name, path, tree.id, True)
+    prefix = f"{path}/" if path else ""
+    children = {}
+    for entry in tree:
+        # hidden files (starting with a dot) are not accessible
+        if entry.name.startswith("."):
+            continue
+        child_path = prefix + entry.name
+        if entry.type == pygit2.GIT_OBJ_TREE:
+            children[entry.name] = build_node(
+                repository,
+                repository[entry.oid],
+                entry.name,
+                child_path,
+                get_markup_renderer,
+            )
+        elif entry.type == pygit2.GIT_OBJ_BLOB:
+            renderer = get_markup_renderer(entry.name)
+            children[entry.name] = Node(
+                entry.name, child_path, entry.oid, False, renderer
+            )
+        # other entries, like git notes or submodules, are not accessible
+    node.children = children
+
+    # order by lower case name, first the folders and then the markup files
+    ordered = sorted(children.values(), key=lambda n: n.name.lower())
+    markup = [n for n in ordered if not n.is_tree and n.renderer]
+    index_files = (n for n in markup if n.name.lower().startswith("index."))
+    node.index = next(index_files, None)
+    folders = tuple(n for n in ordered if n.is_tree)
+    node.listing = folders + tuple(n for n in markup if n is not node.index)
+    return node
+
+
+class Snapshot:
+    """the navigable tree of a commit
+
+    The snapshot is built once and never changed afterwards, so it can be
+    shared between requests and threads.
+    """
+
+    __slots__ = ("commit_id", "root")
+
+    def __init__(self, repository, commit_id, get_markup_renderer):
+        self.commit_id = commit_id
+        tree = repository[commit_id].peel(pygit2.Tree)
+        self.root = build_node(repository, tree, "", "", get_markup_renderer)
+
+    def find(self, path):
+        """get the node for a path or raise a KeyError"""
+        node = self.root
+        for name in path.split("/"):
+            if name:
+                node = (node.children or {})[name]
+        return node
+
+    def walk(self):
+        """iterate over all nodes of the snapshot"""
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            yield node
+            if node.is_tree:
+                pending.extend(reversed(node.children.values()))
+
+
+class SnapshotCache:
+    """keeps the snapshots of the most recently used commits
+
+    Snapshots are built only once, even if requested by concurrent threads.
+    Only the threads waiting for the same commit are blocked while it is
+    built.
+    """
+
+    def __init__(self, maxsize=4):
+        self.snapshots = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def get(self, repository, commit_id, get_markup_renderer):
+        """get the snapshot for a commit id"""
+        snapshot = self.snapshots.get(commit_id)
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            lock = self._building.setdefault(commit_id, threading.Lock())
+        try:
+            with lock:
+                snapshot = self.snapshots.get(commit_id)
+                if snapshot is None:
+                    snapshot = Snapshot(
+                        repository, commit_id, get_markup_renderer
+                    )
+                    self.snapshots.set(commit_id, snapshot)
+        finally:
+            with self._lock:
+                # another thread might have started a new build already
+                if self._building.get(commit_id) is lock:
+                    del self._building[commit_id]
+        return snapshot
@@ -1,10 +1,131 @@
 """ The view functions, connecting a context to an output """
 
-import io
+import functools
 import mimetypes
+from datetime import datetime, timezone
 
+import pygit2
 from pyramid.view import view_config, notfound_view_config
-from pyramid.response import FileIter
+from pyramid.events import BeforeRender
+from pyramid_jinja2 import IJinja2Environment
+from pyramid.httpexceptions import (
+    HTTPNotFound,
+    HTTPNotModified,
+    HTTPRequestRangeNotSatisfiable,
+)
+
+from .markup import EXPENSIVE
+from .ranges import CHUNK_SIZE, MultipartByteranges, iter_chunks, parse_range
+from .history import HistoryIndex, path_diff, format_diff
+from .repository import hold_repository
+
+# pages of a commit addressed by its full id never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# documents larger than this are streamed while the page is rendered
+STREAM_THRESHOLD = 256 * 1024
+
+# number of commits on a page of the history view
+HISTORY_PAGE_SIZE = 50
+
+
+def commit_time(commit):
+    """the time of a commit as a timezone aware datetime in UTC"""
+    return datetime.fromtimestamp(commit.commit_time, timezone.utc)
+
+
+def not_modified(request, etag, last_modified):
+    """set the validators and check the conditional request headers
+
+    returns a "304 Not Modified" response if the client has a valid copy,
+    otherwise None. As defined in RFC 7232, "If-Modified-Since" is ignored
+    if the request also contains "If-None-Match".
+    """
+    response = request.response
+    response.etag = etag
+    response.last_modified = last_modified
+
+    if "If-None-Match" in request.headers:
+        is_valid = etag in request.if_none_match
+    elif request.if_modified_since is not None:
+        is_valid = last_modified <= request.if_modified_since
+    else:
+        is_valid = False
+
+    if not is_valid:
+        return None
+    headers = {
+        "ETag": response.headers["ETag"],
+        "Last-Modified": response.headers["Last-Modified"],
+    }
+    if "Cache-Control" in response.headers:
+        headers["Cache-Control"] = response.headers["Cache-Control"]
+    return HTTPNotModified(headers=headers)
+
+
+def set_cache_control(context, request):
+    """resources of a commit addressed by its full id may be cached forever"""
+    if context.revision.immutable:
+        request.response.headers["Cache-Control"] = IMMUTABLE
+
+
+def range_allowed(request, response):
+    """check the "If-Range" header against the validators of the response"""
+    if_range = request.headers.get("If-Range", None)
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', "W/")):
+        # weak entity tags must not be used for range requests
+        return if_range == response.headers["ETag"]
+    return if_range == response.headers["Last-Modified"]
+
+
+def encode_chunks(parts, chunk_size=CHUNK_SIZE):
+    """join the text parts of a template stream to utf-8 encoded chunks"""
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def stream_template(request, template_name):
+    """render a template in chunks as the body of the response"""
+    environment = request.registry.queryUtility(
+        IJinja2Environment, name=".jinja2"
+    )
+    template = environment.get_template(template_name)
+    system = {
+        "request": request,
+        "context": request.context,
+        "renderer_name": template_name,
+    }
+    request.registry.notify(BeforeRender(system))
+    response = request.response
+    response.content_type = "text/html"
+    response.charset = "utf-8"
+    # the template uses the repository while the body is produced
+    app_iter = encode_chunks(template.generate(system))
+    response.app_iter = hold_repository(request, app_iter)
+    return response
+
+
+def page_not_modified(context, request):
+    """check the conditional request headers for a rendered page
+
+    Rendered pages also show the surrounding folder structure, therefore the
+    commit of the revision is part of the entity tag.
+    """
+    set_cache_control(context, request)
+    head = context.revision.last_commit
+    etag = f"{head.hex}-{context.oid.hex}"
+    return not_modified(request, etag, commit_time(head))
 
 
 @view_config(
@@ -12,33 +133,208 @@ from pyramid.response import FileIter
 )
 def folder(context, request):
     """renders a Folder context"""
-    return {}
+    return page_not_modified(context, request) or {}
 
 
 @view_config(
     context="pyragit.resources.Markup", renderer="templates/markup.jinja2"
 )
 def markup(context, request):
-    """renders a markup context"""
+    """renders a markup context
+
+    Large documents are streamed, the beginning of the page is sent before
+    the document is rendered. Documents of expensive renderers are not
+    streamed, the headers must be changed if rendering fails.
+    """
+    response = page_not_modified(context, request)
+    if response is not None:
+        return response
+    settings = request.registry.settings or {}
+    threshold = int(settings.get("pyragit.stream_threshold", STREAM_THRESHOLD))
+    expensive = getattr(context.renderer, "cost", None) == EXPENSIVE
+    if context.size > threshold and not expensive:
+        return stream_template(request, "pyragit:templates/markup.jinja2")
     return {}
 
 
-@view_config(context="pyragit.resources.File")
-def blob(context, request):
-    """a unrendered, binary file"""
-    output = io.BytesIO(context.data)
-    output.seek(0)
+@functools.lru_cache(maxsize=1024)
+def guess_type(filename):
+    """the mime type for a file name"""
+    mime_type, _ = mimetypes.guess_type(filename)
+    return mime_type or "application/download"
+
+
+def serve_blob(request, filename, oid, get_buffer, last_modified):
+    """the response for the raw data of a git blob
+
+    Conditional and range requests are supported, the data is streamed in
+    chunks from the buffer of the blob. get_buffer is only called if the
+    data is sent, a "304 Not Modified" response does not load the blob.
+    """
+    not_modified_response = not_modified(request, oid.hex, last_modified)
+    if not_modified_response:
+        return not_modified_response
+
+    buffer = get_buffer()
+
     response = request.response
-    response.app_iter = FileIter(output)
-    headers = response.headers
-    mime_type, _ = mimetypes.guess_type(context.__name__)
-    if mime_type is None:
-        mime_type = "application/download"
-    headers["Content-Type"] = mime_type
-    headers["Accept-Ranges"] = "bite"
+    mime_type = guess_type(filename)
+    response.headers["Content-Type"] = mime_type
+    response.headers["Accept-Ranges"] = "bytes"
+
+    size = len(buffer)
+    ranges = None
+    if "Range" in request.headers and range_allowed(request, response):
+        ranges = parse_range(request.headers["Range"], size)
+
+    if ranges is None:
+        response.app_iter = iter_chunks(buffer, 0, size)
+        response.content_length = size
+    elif not ranges:
+        headers = {"Content-Range": f"bytes */{size}"}
+        return HTTPRequestRangeNotSatisfiable(headers=headers)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        response.app_iter = iter_chunks(buffer, start, stop)
+        response.content_length = stop - start
+    else:
+        body = MultipartByteranges(buffer, ranges, mime_type)
+        response.status_code = 206
+        response.headers["Content-Type"] = body.content_type
+        response.app_iter = body
+        response.content_length = body.content_length
     return response
 
 
+@view_config(context="pyragit.resources.File")
+def blob(context, request):
+    """a unrendered, binary file
+
+    Without a history index, the last commit of the file would be found by
+    walking the history on every request. The time of the commit of the
+    revision is used as last modification date then, the entity tag is
+    checked without any walk.
+    """
+    set_cache_control(context, request)
+    if context.revision.history_index is None:
+        last_modified = commit_time(context.revision.last_commit)
+    else:
+        last_modified = commit_time(context.last_commit)
+    return serve_blob(
+        request,
+        context.__name__,
+        context.oid,
+        lambda: context.buffer,
+        last_modified,
+    )
+
+
+@view_config(
+    name="@history",
+    context="pyragit.resources.BaseResource",
+    renderer="templates/history.jinja2",
+)
+def history(context, request):
+    """the commits that changed a resource, most recent first
+
+    The commits of merged branches are listed, not only the merges. Other
+    revisions than HEAD, or HEAD without a shared history index, use
+    the index of their commit from the history index cache.
+    """
+    try:
+        page = max(1, int(request.GET.get("page", 1)))
+    except ValueError:
+        page = 1
+    start = (page - 1) * HISTORY_PAGE_SIZE
+    repository = request.repository
+    history_index = context.revision.history_index
+    if history_index is None:
+        history_index = request_history_index(request, context.revision)
+    commit_ids, total = history_index.log(
+        repository,
+        context.git_path,
+        start,
+        start + HISTORY_PAGE_SIZE,
+        context.revision.commit_id,
+    )
+    commits = []
+    for commit_id in commit_ids:
+        commit = repository[commit_id]
+        date = datetime.fromtimestamp(float(commit.author.time))
+        commits.append((commit, date))
+    return {
+        "commits": commits,
+        "page": page,
+        "pages": max(1, -(-total // HISTORY_PAGE_SIZE)),
+        "total": total,
+    }
+
+
+def request_history_index(request, revision):
+    """the history index of a revision other than the shared one
+
+    If no history index cache is available, the index is built for this
+    request only.
+    """
+    history_indexes = getattr(request, "history_indexes", None)
+    if history_indexes is None:
+        return HistoryIndex()
+    return history_indexes.get(revision.commit_id)
+
+
+def find_commit(repository, ref):
+    """the commit for a reference or commit id, or None"""
+    try:
+        return repository.revparse_single(ref).peel(pygit2.Commit)
+    except (KeyError, ValueError, pygit2.GitError):
+        return None
+
+
+@view_config(
+    name="@diff",
+    context="pyragit.resources.BaseResource",
+    renderer="templates/diff.jinja2",
+)
+def diff(context, request):
+    """the changes of a resource introduced by a commit
+
+    "@diff/<commit>" compares a commit to its first parent, while
+    "@diff/<old commit>/<new commit>" compares two commits. The rendered
+    diff is cached by the commit ids and the path.
+    """
+    if len(request.subpath) not in (1, 2):
+        raise HTTPNotFound()
+    repository = request.repository
+    commits = [find_commit(repository, ref) for ref in request.subpath]
+    if None in commits:
+        raise HTTPNotFound()
+    if len(commits) == 1:
+        new_commit = commits[0]
+        old_commit = new_commit.parents[0] if new_commit.parents else None
+    else:
+        old_commit, new_commit = commits
+    path = context.git_path
+    old_hex = old_commit.hex if old_commit else ""
+
+    def render():
+        patch = path_diff(repository, old_commit, new_commit, path)
+        return format_diff(patch)
+
+    render_cache = getattr(request, "render_cache", None)
+    if render_cache is None:
+        output = render()
+    else:
+        key = f"diff:{old_hex}:{new_commit.hex}:{path}"
+        output = render_cache.get_or_render(key, render)
+    return {
+        "old_commit": old_commit,
+        "new_commit": new_commit,
+        "diff": output,
+    }
+
+
 @notfound_view_config(renderer="templates/not_found.jinja2")
 def notfound(context, request):
     """File not found view"""
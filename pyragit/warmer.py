@@ -0,0 +1,151 @@
+""" Pyragit: pre-render changed documents in the background """
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pygit2
+from pyramid.settings import asbool
+from pyramid.exceptions import ConfigurationError
+
+log = logging.getLogger(__name__)
+
+
+def changed_blobs(repository, old_id, new_id):
+    """the paths and object ids of the blobs added or changed between commits
+
+    If old_id is None, all blobs of the new commit are returned.
+    """
+    new_tree = repository[new_id].peel(pygit2.Tree)
+    if old_id is None:
+        diff = new_tree.diff_to_tree(swap=True)
+    else:
+        old_tree = repository[old_id].peel(pygit2.Tree)
+        diff = old_tree.diff_to_tree(new_tree)
+    for delta in diff.deltas:
+        if delta.status != pygit2.GIT_DELTA_DELETED:
+            yield delta.new_file.path, delta.new_file.id
+
+
+class Warmer:
+    """watches the HEAD of a repository and warms the caches on a change
+
+    The HEAD is polled in a background thread. If it has changed, the tree
+    snapshot and the history and search indexes are updated. The changed
+    markup documents are rendered into the render cache in a small thread
+    pool, before the first visitor requests them.
+    """
+
+    def __init__(self, registry, interval=5, workers=2):
+        self.registry = registry
+        self.interval = interval
+        self.workers = workers
+        self.head = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """start watching the repository in a daemon thread"""
+        with self.registry.repository_pool.repository() as repository:
+            self.head = repository.head.target
+        self._thread = threading.Thread(
+            target=self.run, name="pyragit-warmer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """stop watching the repository"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        """poll the HEAD of the repository until stopped"""
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                log.exception("Warming the caches failed")
+
+    def check(self):
+        """warm the caches if the HEAD of the repository has changed"""
+        with self.registry.repository_pool.repository() as repository:
+            head = repository.head.target
+            if head == self.head:
+                return
+            log.info("HEAD moved to %s, warming the caches", head)
+            self.warm(repository, self.head, head)
+            self.head = head
+
+    def warm(self, repository, old_id, new_id):
+        """update the shared indexes and pre-render changed documents"""
+        registry = self.registry
+        get_markup_renderer = registry.get_markup_renderer
+        snapshots = getattr(registry, "tree_snapshots", None)
+        snapshot = None
+        if snapshots is not None:
+            snapshot = snapshots.get(repository, new_id, get_markup_renderer)
+        history_index = getattr(registry, "history_index", None)
+        if history_index is not None:
+            history_index.update(repository, new_id)
+        search_index = getattr(registry, "search_index", None)
+        if search_index is not None:
+            search_index.update(repository, new_id)
+
+        documents = []
+        for path, oid in changed_blobs(repository, old_id, new_id):
+            names = path.split("/")
+            # hidden files and folders are not accessible
+            if any(name.startswith(".") for name in names):
+                continue
+            renderer = get_markup_renderer(names[-1])
+            if renderer is not None:
+                documents.append((path, oid, renderer))
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {
+                executor.submit(self.render, oid, renderer): path
+                for path, oid, renderer in documents
+            }
+        for future, path in futures.items():
+            error = future.exception()
+            if error is not None:
+                log.warning("Could not pre-render %s", path, exc_info=error)
+
+        # the site map uses the documents rendered above
+        site_maps = getattr(registry, "site_maps", None)
+        if site_maps is not None and snapshot is not None:
+            site_maps.get(repository, snapshot, registry.render_cache)
+        return len(documents)
+
+    def render(self, oid, renderer):
+        """render a document into the render cache"""
+        with self.registry.repository_pool.repository() as repository:
+            self.registry.render_cache.render(
+                oid,
+                renderer,
+                lambda: repository[oid].data.decode("utf-8"),
+            )
+
+
+def includeme(config):
+    """
+    starts the cache warmer if enabled in the settings
+
+    Activate this setup using ``config.include('pyragit.warmer')``, after the
+    resources and markup setups are included.
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("pyragit.warmer", False)):
+        return
+    if getattr(config.registry, "hosting", None) is not None:
+        raise ConfigurationError(
+            "The cache warmer only supports a single repository"
+        )
+    warmer = Warmer(
+        config.registry,
+        interval=float(settings.get("pyragit.warmer.interval", 5)),
+        workers=int(settings.get("pyragit.warmer.workers", 2)),
+    )
+    config.registry.warmer = warmer
+    warmer.start()
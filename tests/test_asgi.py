@@ -0,0 +1,221 @@
+""" Tests for pyragit.asgi module """
+
+import time
+import asyncio
+
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture(scope="module")
+def wsgi_app(repo_path):  # Noqa: F811
+    from pyragit import main
+
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.page_cache": "true",
+    }
+    yield main({}, **settings)
+
+
+def call(app, path="/", method="GET", headers=()):
+    """call an ASGI application, returns status, headers and body"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, *bodies = messages
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    body = b"".join(message["body"] for message in bodies)
+    return start["status"], headers, body
+
+
+def streaming_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    for number in range(5):
+        yield str(number).encode()
+        time.sleep(0.05)
+
+
+def slow_app(environ, start_response):
+    time.sleep(0.2)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"slow"]
+
+
+def test_build_environ():
+    from pyragit.asgi import build_environ
+
+    scope = {
+        "method": "GET",
+        "path": "/docs/down/",
+        "root_path": "/docs",
+        "query_string": b"q=1",
+        "server": ("example.com", 8080),
+        "headers": [
+            (b"accept", b"text/html"),
+            (b"accept", b"text/plain"),
+            (b"content-type", b"text/plain"),
+        ],
+    }
+    environ = build_environ(scope, b"body")
+
+    assert environ["SCRIPT_NAME"] == "/docs"
+    assert environ["PATH_INFO"] == "/down/"
+    assert environ["QUERY_STRING"] == "q=1"
+    assert environ["SERVER_PORT"] == "8080"
+    assert environ["HTTP_ACCEPT"] == "text/html,text/plain"
+    assert environ["CONTENT_TYPE"] == "text/plain"
+    assert environ["wsgi.input"].read() == b"body"
+
+
+def test_asgi_app(wsgi_app):
+    from pyragit.asgi import AsgiApp
+
+    status, headers, body = call(AsgiApp(wsgi_app), "/down/traversing.md")
+
+    assert status == 200
+    assert headers["content-type"].startswith("text/html")
+    assert b"Pyragit Traversing" in body
+
+
+def test_asgi_app_serves_cached_pages_on_event_loop(wsgi_app, mocker):
+    from pyragit.asgi import AsgiApp
+
+    app = AsgiApp(wsgi_app)
+    call(app, "/down/")
+    spy = mocker.spy(app.executor, "submit")
+    pool = mocker.spy(wsgi_app.registry.repository_pool, "acquire")
+
+    status, headers, body = call(app, "/down/")
+
+    assert status == 200
+    assert b"are a thing" in body
+    assert spy.call_count == 0
+    assert pool.call_count == 0
+
+
+def test_asgi_app_checks_head_in_thread_pool(wsgi_app, mocker):
+    from pyragit.asgi import AsgiApp
+
+    app = AsgiApp(wsgi_app, head_max_age=0)
+    call(app, "/down/")
+    spy = mocker.spy(app.executor, "submit")
+
+    status, headers, body = call(app, "/down/")
+
+    assert status == 200
+    assert spy.call_count > 0
+
+
+def test_asgi_app_rejects_too_many_requests(wsgi_app):
+    from pyragit.asgi import AsgiApp
+
+    status, headers, body = call(AsgiApp(wsgi_app, max_pending=0), "/x.md")
+
+    assert status == 503
+    assert headers["retry-after"] == "1"
+
+
+def test_asgi_app_timeout():
+    from pyragit.asgi import AsgiApp
+
+    status, headers, body = call(AsgiApp(slow_app, timeout=0.05))
+
+    assert status == 504
+
+
+def test_asgi_app_timeout_only_until_response_is_started():
+    from pyragit.asgi import AsgiApp
+
+    app = AsgiApp(streaming_app, timeout=0.1)
+    status, headers, body = call(app)
+
+    assert status == 200
+    assert body == b"01234"
+    assert app.pending == 0
+
+
+def test_asgi_app_timed_out_thread_is_pending():
+    from pyragit.asgi import AsgiApp
+
+    app = AsgiApp(slow_app, timeout=0.05)
+
+    async def run():
+        await app(
+            {"type": "http", "method": "GET", "path": "/"},
+            lambda: asyncio.sleep(0, {"type": "http.request"}),
+            lambda message: asyncio.sleep(0),
+        )
+        pending = app.pending
+        await asyncio.sleep(0.3)
+        return pending, app.pending
+
+    assert asyncio.run(run()) == (1, 0)
+
+
+def test_asgi_app_closes_body_after_timed_out_thread():
+    from pyragit.asgi import AsgiApp
+
+    events = []
+
+    class Body:
+        def __iter__(self):
+            time.sleep(0.2)
+            events.append("iterated")
+            yield b"late"
+
+        def close(self):
+            events.append("closed")
+
+    def late_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return Body()
+
+    app = AsgiApp(late_app, timeout=0.05)
+
+    async def run():
+        await app(
+            {"type": "http", "method": "GET", "path": "/"},
+            lambda: asyncio.sleep(0, {"type": "http.request"}),
+            lambda message: asyncio.sleep(0),
+        )
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run())
+    assert events == ["iterated", "closed"]
+    assert app.pending == 0
+
+
+def test_asgi_app_lifespan():
+    from pyragit.asgi import AsgiApp
+
+    app = AsgiApp(slow_app)
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+
+    assert sent == [
+        "lifespan.startup.complete",
+        "lifespan.shutdown.complete",
+    ]
@@ -0,0 +1,141 @@
+""" Tests for pyragit.cache module """
+
+
+def test_lru_cache_get_and_set():
+    from pyragit.cache import LRUCache
+
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("b", "default") == "default"
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_lru_cache_discards_least_recently_used():
+    from pyragit.cache import LRUCache
+
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_lru_cache_clear():
+    from pyragit.cache import LRUCache
+
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_blob_cache_get_and_set():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache(max_size=100, max_item_size=50)
+    assert cache.set("a", b"12345")
+    assert cache.get("a") == b"12345"
+    assert cache.get("b") is None
+    assert cache.size == 5
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_blob_cache_bypasses_large_items():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache(max_size=100, max_item_size=10)
+    assert not cache.set("large", b"x" * 11)
+    assert "large" not in cache
+    assert cache.size == 0
+
+
+def test_blob_cache_evicts_large_items_first():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache(max_size=100, max_item_size=100)
+    cache.set("small", b"s" * 10)
+    cache.set("large", b"l" * 60)
+    cache.set("other", b"o" * 40)
+    assert "small" in cache
+    assert "large" not in cache
+    assert "other" in cache
+    assert cache.size == 50
+    assert cache.evictions == 1
+
+
+def test_blob_cache_keeps_frequently_used_items():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache(max_size=100, max_item_size=100)
+    cache.set("hot", b"h" * 40)
+    for _ in range(10):
+        cache.get("hot")
+    cache.set("cold", b"c" * 40)
+    cache.set("new", b"n" * 40)
+    assert "hot" in cache
+    assert "cold" not in cache
+    assert "new" in cache
+
+
+def test_blob_cache_unused_items_age_out():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache(max_size=100, max_item_size=100)
+    cache.set("once popular", b"p" * 50)
+    for _ in range(3):
+        cache.get("once popular")
+    # each eviction raises the priority of new items
+    for number in range(200):
+        cache.set(number, b"n" * 50)
+        cache.get(number)
+    assert "once popular" not in cache
+    assert cache.size <= 100
+    assert len(cache._heap) <= 4 * len(cache) + 64
+
+
+def test_blob_cache_clear():
+    from pyragit.cache import BlobCache
+
+    cache = BlobCache()
+    cache.set("a", b"data")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_disk_cache(tmp_path):
+    from pyragit.cache import DiskCache
+
+    cache = DiskCache(str(tmp_path))
+    assert cache.get("some:key") is None
+    cache.set("some:key", "<p>rendered</p>")
+    assert cache.get("some:key") == "<p>rendered</p>"
+    # a new instance reads the same files
+    assert DiskCache(str(tmp_path)).get("some:key") == "<p>rendered</p>"
+
+
+def test_render_cache_without_disk_tier():
+    from pyragit.cache import RenderCache
+
+    cache = RenderCache(maxsize=2)
+    assert cache.disk is None
+    assert cache.get_or_render("key", lambda: "rendered") == "rendered"
+    assert cache.get_or_render("key", lambda: "other") == "rendered"
+
+
+def test_render_cache_promotes_from_disk_tier(tmp_path):
+    from pyragit.cache import RenderCache
+
+    RenderCache(directory=str(tmp_path)).set("key", "rendered")
+    cache = RenderCache(directory=str(tmp_path))
+    assert "key" not in cache.memory
+    assert cache.get("key") == "rendered"
+    assert "key" in cache.memory
@@ -0,0 +1,197 @@
+""" Tests for pyragit.compression module """
+
+import gzip
+
+import pytest
+from pyramid.request import Request
+from pyramid.response import Response
+
+from . import repo_path  # Noqa: F401
+
+
+def test_compress_gzip():
+    from pyragit.compression import compress
+
+    data = b"some data " * 100
+    compressed = compress(data, "gzip")
+    assert len(compressed) < len(data)
+    assert gzip.decompress(compressed) == data
+    # the output is reproducible
+    assert compress(data, "gzip") == compressed
+
+
+def test_compress_identity():
+    from pyragit.compression import compress
+
+    assert compress(b"some data", "identity") == b"some data"
+
+
+def test_compress_all():
+    from pyragit.compression import ENCODINGS, compress_all
+
+    result = compress_all(b"some data")
+    assert set(result) == set(ENCODINGS) | {"identity"}
+    assert result["identity"] == b"some data"
+    assert gzip.decompress(result["gzip"]) == b"some data"
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({}, "identity"),
+        ({"Accept-Encoding": "gzip, deflate"}, "gzip"),
+        ({"Accept-Encoding": "deflate"}, "identity"),
+        ({"Accept-Encoding": "gzip;q=0"}, "identity"),
+        ({"Accept-Encoding": "*"}, "gzip"),
+    ],
+)
+def test_negotiate(headers, expected):
+    from pyragit.compression import negotiate
+
+    request = Request.blank("/", headers=headers)
+    assert negotiate(request, ("gzip",)) == expected
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path):  # Noqa: F811
+    import webtest
+
+    from pyragit import main
+
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.stream_threshold": "0",
+    }
+    yield webtest.TestApp(main({}, **settings))
+
+
+def test_compress_stream_gzip():
+    from pyragit.compression import compress_stream
+
+    chunks = [b"first chunk " * 50, b"second chunk " * 50]
+    compressed = list(compress_stream(iter(chunks), "gzip"))
+    assert len(compressed) == 3
+    assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+
+
+def test_cache_stream():
+    from pyragit.cache import LRUCache
+    from pyragit.compression import cache_stream
+
+    cache = LRUCache()
+    stream = cache_stream(iter([b"a", b"b"]), cache, "key", Response())
+    assert next(stream) == b"a"
+    assert "key" not in cache
+    assert list(stream) == [b"b"]
+    assert cache.get("key") == b"ab"
+
+
+def test_cache_stream_no_store():
+    from pyragit.cache import LRUCache
+    from pyragit.compression import cache_stream
+
+    def chunks(response):
+        yield b"a"
+        # like a document failing to render while the page is streamed
+        response.cache_control = "no-store"
+        yield b"b"
+
+    cache = LRUCache()
+    response = Response()
+    stream = cache_stream(chunks(response), cache, "key", response)
+    assert list(stream) == [b"a", b"b"]
+    assert "key" not in cache
+
+
+def test_cache_stream_incomplete():
+    from pyragit.cache import LRUCache
+    from pyragit.compression import cache_stream
+
+    cache = LRUCache()
+    stream = cache_stream(iter([b"a", b"b"]), cache, "key", Response())
+    next(stream)
+    stream.close()
+    assert "key" not in cache
+
+
+@pytest.mark.parametrize(
+    "kwargs,expected",
+    [
+        ({"body": b"x" * 1000, "content_type": "text/html"}, True),
+        ({"body": b"x" * 1000, "content_type": "image/svg+xml"}, True),
+        ({"body": b"x" * 10, "content_type": "text/html"}, False),
+        ({"body": b"x" * 1000, "content_type": "image/png"}, False),
+        ({"body": b"x" * 1000, "status": 206}, False),
+        ({"body": b"x" * 1000, "content_encoding": "gzip"}, False),
+    ],
+)
+def test_is_compressible(kwargs, expected):
+    from pyramid.response import Response
+
+    from pyragit.compression import is_compressible
+
+    assert is_compressible(Response(**kwargs)) is expected
+
+
+def test_compression_tween_streamed_page(testapp):
+    headers = {"Accept-Encoding": "gzip"}
+    request = Request.blank("/down/traversing.md", headers=headers)
+    response = request.get_response(testapp.app)
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"].startswith('W/"')
+    body = gzip.decompress(response.body)
+    assert b"<h1>Pyragit Traversing</h1>" in body
+
+    cache = testapp.app.registry.compression_cache
+    etag = response.headers["ETag"][3:-1]
+    key = f"http://localhost/down/traversing.md:{etag}:gzip"
+    assert cache.get(key) == response.body
+
+
+def test_compression_tween_cache_key_contains_url(testapp):
+    headers = {"Accept-Encoding": "gzip"}
+    pool = testapp.app.registry.repository_pool
+    with pool.repository() as repository:
+        commit_id = repository.head.target.hex
+    bodies = {}
+    for url in ("/down/", f"/@{commit_id}/down/"):
+        request = Request.blank(url, headers=headers)
+        response = request.get_response(testapp.app)
+        bodies[url] = gzip.decompress(response.body).decode("utf-8")
+    link = f'href="/@{commit_id}/down/traversing.md/"'
+    assert link not in bodies["/down/"]
+    assert link in bodies[f"/@{commit_id}/down/"]
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "identity"])
+def test_streamed_page_holds_repository(testapp, encoding):
+    pool = testapp.app.registry.repository_pool
+    pool.clear()
+    testapp.app.registry.compression_cache.clear()
+    headers = {"Accept-Encoding": encoding}
+    environ = Request.blank("/down/traversing.md", headers=headers).environ
+    app_iter = testapp.app(environ, lambda status, headers: None)
+    assert pool._idle.qsize() == 0
+
+    b"".join(app_iter)
+    assert pool._idle.qsize() == 0
+    app_iter.close()
+    assert pool._idle.qsize() == 1
+
+
+def test_compression_tween_identity(testapp):
+    response = testapp.get("/down/traversing.md")
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "<h1>Pyragit Traversing</h1>" in response
+
+
+def test_compression_tween_not_modified(testapp):
+    headers = {"Accept-Encoding": "gzip"}
+    request = Request.blank("/down/traversing.md", headers=headers)
+    response = request.get_response(testapp.app)
+    headers["If-None-Match"] = response.headers["ETag"]
+    request = Request.blank("/down/traversing.md", headers=headers)
+    assert request.get_response(testapp.app).status_code == 304
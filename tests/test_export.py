@@ -0,0 +1,132 @@
+""" Tests for pyragit.export module """
+
+import os
+import json
+
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+OLD_COMMIT = "8b2b58560a73261789f8f1308378e537719d69d1"
+
+
+@pytest.fixture
+def settings(repo_path):  # Noqa: F811
+    yield {"pyragit.repository_path": repo_path}
+
+
+def get_snapshot(repo_path, commit_id="HEAD"):  # Noqa: F811
+    import pygit2
+
+    from pyragit.snapshot import Snapshot
+
+    def get_markup_renderer(name):
+        return str.upper if name.endswith(".md") else None
+
+    repository = pygit2.Repository(repo_path)
+    commit = repository.revparse_single(commit_id).peel(pygit2.Commit)
+    return Snapshot(repository, commit.id, get_markup_renderer)
+
+
+def test_export_entries(repo_path):  # Noqa: F811
+    from pyragit.export import export_entries
+
+    snapshot = get_snapshot(repo_path, OLD_COMMIT)
+    entries = list(export_entries(snapshot.root))
+
+    urls = {url: (path, key.split(":")[0]) for url, path, key in entries}
+    assert urls == {
+        "/": ("index.html", "tree"),
+        "/desrcription.md/": ("desrcription.md/index.html", "page"),
+        "/index.md/": ("index.md/index.html", "page"),
+        "/multi-commit.md/": ("multi-commit.md/index.html", "page"),
+        "/kitten.jpg": ("kitten.jpg", "blob"),
+        "/stream": ("stream", "blob"),
+    }
+    root_key = f"tree:{snapshot.root.oid.hex}"
+    assert ("/", "index.html", root_key) in entries
+
+
+def test_find_conflicts():
+    from pyragit.export import find_conflicts
+
+    entries = [
+        ("/docs/", "docs/index.html", "tree:1"),
+        ("/docs/index.html", "docs/index.html", "blob:2"),
+        ("/docs/a.md/", "docs/a.md/index.html", "page:1:3"),
+    ]
+    assert find_conflicts(entries) == [("/docs/", "/docs/index.html")]
+    assert find_conflicts(entries[1:]) == []
+
+
+def test_export_raises_error_on_conflict(settings, tmp_path, mocker):
+    from pyragit.export import ExportError, export
+
+    entries = [
+        ("/", "index.html", "tree:1"),
+        ("/index.html", "index.html", "blob:2"),
+    ]
+    mocker.patch("pyragit.export.export_entries", return_value=entries)
+    with pytest.raises(ExportError):
+        export(settings, str(tmp_path), workers=1)
+    assert not (tmp_path / "index.html").exists()
+
+
+def test_export(settings, tmp_path):
+    from pyragit.export import MANIFEST, export
+
+    written, removed = export(settings, str(tmp_path), workers=2)
+
+    assert removed == 0
+    assert written == 12
+    index = (tmp_path / "down" / "traversing.md" / "index.html").read_text()
+    assert 'href="/down/"' in index
+    assert (tmp_path / "kitten.jpg").stat().st_size == 110969
+    assert (tmp_path / "static" / "theme.css").exists()
+    manifest = json.loads((tmp_path / MANIFEST).read_text())
+    assert len(manifest["files"]) == written
+
+
+def test_export_incremental(settings, tmp_path):
+    from pyragit.export import export
+
+    output = str(tmp_path)
+    export(settings, output, ref=OLD_COMMIT, workers=1)
+    assert not (tmp_path / "down").exists()
+
+    written, removed = export(settings, output, workers=1, incremental=True)
+
+    assert removed == 0
+    # the root folder, its documents, the new folders and documents
+    assert written == 10
+    assert (tmp_path / "down" / "index.html").exists()
+
+    written, removed = export(
+        settings, output, ref=OLD_COMMIT, workers=1, incremental=True
+    )
+    assert (written, removed) == (4, 6)
+    assert not (tmp_path / "down").exists()
+
+
+def test_export_of_old_commit_shows_old_tree(settings, tmp_path):
+    from pyragit.export import export
+
+    export(settings, str(tmp_path), ref=OLD_COMMIT, workers=1)
+
+    index = (tmp_path / "index.html").read_text()
+    assert "/down/" not in index
+    assert "/desrcription.md/" in index
+
+
+def test_remove_file(tmp_path):
+    from pyragit.export import remove_file
+
+    folder = tmp_path / "a" / "b"
+    folder.mkdir(parents=True)
+    (folder / "index.html").write_text("page")
+    (tmp_path / "a" / "other").write_text("other")
+
+    remove_file(str(tmp_path), os.path.join("a", "b", "index.html"))
+
+    assert not (tmp_path / "a" / "b").exists()
+    assert (tmp_path / "a" / "other").exists()
@@ -0,0 +1,91 @@
+""" Tests for pyragit.fastpath module """
+
+import pytest
+import webtest
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path):  # Noqa: F811
+    from pyragit import main
+
+    settings = {"pyragit.repository_path": repo_path}
+    yield webtest.TestApp(main({}, **settings))
+
+
+@pytest.fixture
+def no_traversal(mocker):
+    from pyragit import resources
+
+    yield mocker.spy(resources.Root, "__getitem__")
+
+
+@pytest.mark.parametrize(
+    "path,method,expected",
+    [
+        ("/kitten.jpg", "GET", "kitten.jpg"),
+        ("/kitten.jpg/", "HEAD", "kitten.jpg"),
+        ("/kitten.jpg", "POST", None),
+        ("/", "GET", None),
+        ("/down/", "GET", None),
+        ("/down/traversing.md", "GET", None),
+        ("/unknown.jpg", "GET", None),
+        ("/@master/kitten.jpg", "GET", None),
+    ],
+)
+def test_find_blob(testapp, path, method, expected):
+    from pyramid.request import Request
+    from pyramid.scripting import prepare
+
+    from pyragit.fastpath import find_blob
+
+    request = Request.blank(path, method=method)
+    env = prepare(request=request, registry=testapp.app.registry)
+    try:
+        node = find_blob(request)
+    finally:
+        env["closer"]()
+    assert (node and node.path) == expected
+
+
+def test_find_blob_without_history_index(testapp):
+    from pyramid.request import Request
+    from pyramid.scripting import prepare
+
+    from pyragit.fastpath import find_blob
+
+    request = Request.blank("/kitten.jpg")
+    env = prepare(request=request, registry=testapp.app.registry)
+    request.history_index = None
+    try:
+        assert find_blob(request) is None
+    finally:
+        env["closer"]()
+
+
+def test_blob_fast_path(testapp, no_traversal):
+    response = testapp.get("/kitten.jpg")
+
+    assert response.content_type == "image/jpeg"
+    assert response.content_length == 110969
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Last-Modified"]
+    assert no_traversal.call_count == 0
+
+
+def test_blob_fast_path_conditional_and_range(testapp, no_traversal):
+    response = testapp.get("/kitten.jpg")
+    headers = {"If-None-Match": response.headers["ETag"]}
+    testapp.get("/kitten.jpg", headers=headers, status=304)
+
+    response = testapp.get("/kitten.jpg", headers={"Range": "bytes=0-9"})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 0-9/110969"
+    assert no_traversal.call_count == 0
+
+
+def test_blob_fast_path_falls_back_to_traversal(testapp, no_traversal):
+    testapp.get("/down/traversing.md")
+    assert no_traversal.call_count > 0
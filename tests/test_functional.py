@@ -50,6 +50,12 @@ def test_root(testapp):
         ("/multi-commit.md/", "f multi-commit.md"),
     ]
     check_explore_links(response, explore_links)
+    dates = response.html.find_all(class_="pyragit-resource-date")
+    assert [d.string for d in dates] == [
+        "2018-03-07",
+        "2018-03-07",
+        "2018-03-07",
+    ]
 
 
 def test_folder_with_index(testapp):
@@ -126,6 +132,28 @@ def test_download(testapp):
     assert response.body == expected_body
 
 
+def test_download_range(testapp):
+    headers = {"Range": "bytes=0-4"}
+    response = testapp.get("/stream/", headers=headers, status=206)
+    assert response.body == b"other"
+    assert response.headers["Content-Range"] == "bytes 0-4/53"
+
+
+def test_download_not_modified(testapp):
+    response = testapp.get("/stream/")
+    etag = response.headers["ETag"]
+    assert etag == '"6be71ccf9c70a63c0d6562096789f3faa59a0fd1"'
+    headers = {"If-None-Match": etag}
+    testapp.get("/stream/", headers=headers, status=304)
+
+
+def test_page_not_modified(testapp):
+    response = testapp.get("/down/traversing.md")
+    headers = {"If-Modified-Since": response.headers["Last-Modified"]}
+    response = testapp.get("/down/traversing.md", headers=headers, status=304)
+    assert response.body == b""
+
+
 def test_file_not_found(testapp):
     response = testapp.get("/unknown/")
     # renders index file
@@ -137,3 +165,162 @@ def test_file_not_found(testapp):
         ("/multi-commit.md/", "f multi-commit.md"),
     ]
     check_explore_links(response, explore_links)
+
+
+def test_revision_of_full_commit_id(testapp):
+    commit_id = "8b2b58560a73261789f8f1308378e537719d69d1"
+    response = testapp.get(f"/@{commit_id}/desrcription.md")
+    assert "immutable" in response.headers["Cache-Control"]
+    response = testapp.get(f"/@{commit_id}/down/")
+    assert "The thing you've been looking for is not here." in response
+
+
+def test_revision_of_branch(testapp):
+    response = testapp.get("/@master/down/")
+    assert "Cache-Control" not in response.headers
+    explore = response.html.find(class_="pyragit-explore")
+    hrefs = [link["href"] for link in explore.find_all("a")]
+    assert "/@master/down/traversing.md/" in hrefs
+
+
+def test_blob_of_revision_does_not_walk_history(testapp, mocker):
+    import pyragit.resources
+
+    spy = mocker.spy(pyragit.resources, "walk_last_commits")
+    response = testapp.get("/@master/kitten.jpg")
+    headers = {"If-None-Match": response.headers["ETag"]}
+    testapp.get("/@master/kitten.jpg", headers=headers, status=304)
+    assert response.content_length == 110969
+    assert response.headers["Last-Modified"]
+    assert spy.call_count == 0
+
+
+def test_history_of_markup(testapp):
+    response = testapp.get("/down/traversing.md/@history")
+    entries = response.html.find_all(class_="pyragit-history-entry")
+    assert len(entries) >= 1
+    link = entries[0].find("a")["href"]
+    assert link.startswith("/down/traversing.md/@diff/4b0328bd")
+
+
+def test_history_of_root_folder(testapp):
+    response = testapp.get("/@history")
+    entries = response.html.find_all(class_="pyragit-history-entry")
+    assert "ae046b24" in entries[0].text
+
+
+def test_revision_does_not_evict_head_snapshot(testapp):
+    import pygit2
+
+    commit_id = pygit2.Oid(hex="4b0328bd8730ab388d965116713c88d7d2a72ffe")
+    testapp.get(f"/@{commit_id.hex}/down/")
+    registry = testapp.app.registry
+    assert commit_id in registry.revision_snapshots.snapshots
+    assert commit_id not in registry.tree_snapshots.snapshots
+
+
+def test_history_index_is_stored(repo_path, tmp_path):  # Noqa: F811
+    from pyragit import main
+
+    path = str(tmp_path / "history.pickle")
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.history_index.path": path,
+    }
+    webtest.TestApp(main({}, **settings)).get("/down/@history")
+
+    history_index = main({}, **settings).registry.history_index
+    assert history_index.head.hex == "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
+
+
+def test_history_of_revision_keeps_index(testapp, mocker):
+    import pygit2
+
+    from pyragit.history import HistoryIndex
+
+    spy = mocker.spy(HistoryIndex, "update")
+    commit_id = "4b0328bd8730ab388d965116713c88d7d2a72ffe"
+    for page in (1, 2):
+        response = testapp.get(f"/@{commit_id}/@history?page={page}")
+    history_indexes = testapp.app.registry.history_indexes
+    history_index = history_indexes.get(pygit2.Oid(hex=commit_id))
+    assert history_index.head.hex == commit_id
+    assert len({id(call.args[0]) for call in spy.call_args_list}) == 1
+    assert response.status_code == 200
+
+
+def test_history_page_out_of_range(testapp):
+    response = testapp.get("/down/@history?page=99")
+    assert not response.html.find_all(class_="pyragit-history-entry")
+
+
+def test_diff_of_commit(testapp):
+    commit_id = "4b0328bd8730ab388d965116713c88d7d2a72ffe"
+    response = testapp.get(f"/down/traversing.md/@diff/{commit_id}")
+    diff = response.html.find(class_="pyragit-diff")
+    assert diff.find(class_="pyragit-diff-added")
+
+
+def test_diff_of_two_commits(testapp):
+    old = "8b2b58560a73261789f8f1308378e537719d69d1"
+    response = testapp.get(f"/@diff/{old}/master")
+    diff = response.html.find(class_="pyragit-diff")
+    assert "down/traversing.md" in diff.text
+
+
+def test_diff_of_unknown_commit(testapp):
+    response = testapp.get("/index.md/@diff/unknown")
+    assert "The thing you've been looking for is not here." in response
+
+
+def test_sitemap_xml(testapp):
+    response = testapp.get("/sitemap.xml")
+    assert response.content_type == "application/xml"
+    assert "<loc>http://localhost/down/traversing.md/</loc>" in response
+    assert "<lastmod>" in response.text
+
+
+def test_sitemap_xml_not_modified(testapp):
+    response = testapp.get("/sitemap.xml")
+    etag = response.headers["ETag"]
+    headers = {"If-None-Match": etag}
+    testapp.get("/sitemap.xml", headers=headers, status=304)
+
+
+def test_sitemap_xml_holds_repository(testapp):
+    from pyramid.request import Request
+
+    pool = testapp.app.registry.repository_pool
+    pool.clear()
+    environ = Request.blank("/sitemap.xml").environ
+    app_iter = testapp.app(environ, lambda status, headers: None)
+    assert pool._idle.qsize() == 0
+
+    assert b"<lastmod>" in b"".join(app_iter)
+    app_iter.close()
+    assert pool._idle.qsize() == 1
+
+
+def test_nav_json(testapp):
+    response = testapp.get("/nav.json")
+    assert response.json["base"] == "/"
+    down = response.json["tree"]["children"][0]
+    assert down["path"] == "down"
+    assert down["title"] == '"Folders" are a thing'
+
+
+def test_site_map_views_have_own_entity_tags(testapp):
+    urls = [
+        "/sitemap.xml",
+        "/nav.json",
+        "/@backlinks",
+        "/index.md/@backlinks",
+        "/down/traversing.md/@backlinks",
+    ]
+    etags = {testapp.get(url).headers["ETag"] for url in urls}
+    assert len(etags) == len(urls)
+
+
+def test_backlinks(testapp):
+    response = testapp.get("/down/traversing.md/@backlinks")
+    assert response.json == []
@@ -0,0 +1,258 @@
+""" Tests for pyragit.history module """
+
+import pygit2
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture
+def repository(repo_path):  # Noqa: F811
+    yield pygit2.Repository(repo_path)
+
+
+def test_changed_paths_root_commit(repository):
+    from pyragit.history import changed_paths
+
+    commit = repository["fb6f8e469934249d9c89d4190a1412f9a5573865"]
+    assert changed_paths(commit) == {"index.md"}
+
+
+def test_changed_paths_includes_parent_folders(repository):
+    from pyragit.history import changed_paths
+
+    commit = repository["ae046b24b643b7d6625f1e302a11e7b521f3d24c"]
+    expected = {"down", "down/under", "down/under/missing-index.md"}
+    assert changed_paths(commit) == expected
+
+
+def test_walk_last_commits(repository):
+    from pyragit.history import walk_last_commits
+
+    paths = {
+        "index.md": repository.head.peel().tree["index.md"].oid,
+        "multi-commit.md": repository.head.peel().tree["multi-commit.md"].oid,
+    }
+    result = walk_last_commits(repository, paths)
+    assert {path: commit.hex for path, commit in result.items()} == {
+        "index.md": "fb6f8e469934249d9c89d4190a1412f9a5573865",
+        "multi-commit.md": "616f5deb2ec226bebb31291576338cd951628810",
+    }
+
+
+@pytest.mark.parametrize(
+    "path,gitid",
+    [
+        ("down", "ae046b24b643b7d6625f1e302a11e7b521f3d24c"),
+        ("down/traversing.md", "4b0328bd8730ab388d965116713c88d7d2a72ffe"),
+        ("index.md", "fb6f8e469934249d9c89d4190a1412f9a5573865"),
+        ("desrcription.md", "8b2b58560a73261789f8f1308378e537719d69d1"),
+        ("multi-commit.md", "616f5deb2ec226bebb31291576338cd951628810"),
+    ],
+)
+def test_history_index_last_commit(repository, path, gitid):
+    from pyragit.history import HistoryIndex
+
+    history_index = HistoryIndex()
+    last_commit = history_index.last_commit(repository, path)
+    assert isinstance(last_commit, pygit2.Commit)
+    assert last_commit.hex == gitid
+    assert history_index.head == repository.head.target
+
+
+def test_history_index_unknown_path(repository):
+    from pyragit.history import HistoryIndex
+
+    history_index = HistoryIndex()
+    assert history_index.last_commit(repository, "unknown") is None
+
+
+def test_history_index_incremental_update(repository):
+    from pyragit.history import HistoryIndex
+
+    older = pygit2.Oid(hex="4b0328bd8730ab388d965116713c88d7d2a72ffe")
+    history_index = HistoryIndex()
+    history_index.update(repository, older)
+    assert history_index.head == older
+    assert "down/under" not in history_index._last_changed
+
+    history_index.update(repository)
+    full_index = HistoryIndex()
+    full_index.update(repository)
+    assert history_index._last_changed == full_index._last_changed
+
+
+def test_history_index_log(repository):
+    from pyragit.history import HistoryIndex
+
+    history_index = HistoryIndex()
+    commit_ids, total = history_index.log(repository, "multi-commit.md")
+    assert total == len(commit_ids) > 1
+    assert commit_ids[0].hex == "616f5deb2ec226bebb31291576338cd951628810"
+    times = [repository[oid].commit_time for oid in commit_ids]
+    assert times == sorted(times, reverse=True)
+
+
+def test_history_index_log_slice(repository):
+    from pyragit.history import HistoryIndex
+
+    history_index = HistoryIndex()
+    all_ids, total = history_index.log(repository, "")
+    commit_ids, sliced_total = history_index.log(repository, "", 1, 3)
+    assert sliced_total == total
+    assert commit_ids == all_ids[1:3]
+    assert all_ids[0] == repository.head.target
+
+
+def test_history_index_log_incremental_update(repository):
+    from pyragit.history import HistoryIndex
+
+    older = pygit2.Oid(hex="4b0328bd8730ab388d965116713c88d7d2a72ffe")
+    history_index = HistoryIndex()
+    old_ids, _ = history_index.log(repository, "down", target=older)
+    old_list = history_index._log["down"]
+
+    history_index.update(repository)
+    full_index = HistoryIndex()
+    full_index.update(repository)
+    assert history_index._log == full_index._log
+    # the lists of the previous index are not changed in place
+    assert history_index._log["down"] is not old_list
+    assert old_list == old_ids[::-1]
+    assert history_index._log["down"][: len(old_list)] == old_list
+
+
+def test_history_index_log_unknown_path(repository):
+    from pyragit.history import HistoryIndex
+
+    history_index = HistoryIndex()
+    assert history_index.log(repository, "unknown") == ([], 0)
+
+
+def merged_repository(path, merged_content):
+    """a repository with a merge of two branches changing x.md"""
+    repository = pygit2.init_repository(str(path), bare=True)
+
+    def commit(content, parents, name, ref=None):
+        signature = pygit2.Signature(name, f"{name}@example.com", 1000, 0)
+        builder = repository.TreeBuilder()
+        blob = repository.create_blob(content)
+        builder.insert("x.md", blob, pygit2.GIT_FILEMODE_BLOB)
+        return repository.create_commit(
+            ref, signature, signature, name, builder.write(), parents
+        )
+
+    commits = {"base": commit(b"base", [], "base")}
+    commits["side"] = commit(b"side", [commits["base"]], "side")
+    commits["main"] = commit(b"main", [commits["base"]], "main")
+    commits["merge"] = commit(
+        merged_content,
+        [commits["main"], commits["side"]],
+        "merge",
+        ref="refs/heads/master",
+    )
+    repository.set_head("refs/heads/master")
+    return repository, commits
+
+
+def test_history_index_ignores_changes_dropped_by_merge(tmp_path):
+    from pyragit.history import HistoryIndex
+
+    # the merge keeps the version of the main branch
+    repository, commits = merged_repository(tmp_path, b"main")
+
+    index = HistoryIndex()
+    assert index.last_commit(repository, "x.md").id == commits["main"]
+    ids, total = index.log(repository, "x.md")
+    assert total == 3
+    assert set(ids[:2]) == {commits["main"], commits["side"]}
+    assert ids[2] == commits["base"]
+    assert index.log(repository, "")[0][0] == commits["merge"]
+
+
+def test_history_index_log_lists_resolved_merge(tmp_path):
+    from pyragit.history import HistoryIndex
+
+    # the merge differs from both parents, like after a conflict
+    repository, commits = merged_repository(tmp_path, b"resolved")
+
+    index = HistoryIndex()
+    assert index.last_commit(repository, "x.md").id == commits["merge"]
+    ids, total = index.log(repository, "x.md")
+    assert total == 4
+    assert ids[0] == commits["merge"]
+
+
+def test_history_index_is_stored(tmp_path, mocker):
+    import pyragit.history
+    from pyragit.history import HistoryIndex
+
+    repository, commits = merged_repository(tmp_path / "repo", b"main")
+    path = str(tmp_path / "history.pickle")
+    expected = HistoryIndex(path).log(repository, "x.md")
+
+    spy = mocker.spy(pyragit.history, "changed_paths")
+    index = HistoryIndex(path)
+    assert index.head == commits["merge"]
+    assert index.log(repository, "x.md") == expected
+    assert index.last_commit(repository, "x.md").id == commits["main"]
+    assert spy.call_count == 0
+
+
+def test_history_index_stored_for_other_repository(tmp_path, repository):
+    from pyragit.history import HistoryIndex
+
+    other, _ = merged_repository(tmp_path / "repo", b"main")
+    path = str(tmp_path / "history.pickle")
+    HistoryIndex(path).update(other)
+
+    index = HistoryIndex(path)
+    commit = index.last_commit(repository, "multi-commit.md")
+    assert commit.hex == "616f5deb2ec226bebb31291576338cd951628810"
+
+
+def test_history_index_cache():
+    from pyragit.history import HistoryIndexCache
+
+    history_indexes = HistoryIndexCache(maxsize=1)
+    first = history_indexes.get("first")
+    assert history_indexes.get("first") is first
+    history_indexes.get("second")
+    assert history_indexes.get("first") is not first
+
+
+def test_path_diff_of_file(repository):
+    from pyragit.history import path_diff
+
+    new = repository["616f5deb2ec226bebb31291576338cd951628810"]
+    patch = path_diff(repository, new.parents[0], new, "multi-commit.md")
+    assert patch.startswith("diff --git a/multi-commit.md b/multi-commit.md")
+    assert "\n+" in patch
+
+
+def test_path_diff_of_added_folder(repository):
+    from pyragit.history import path_diff
+
+    new = repository["ae046b24b643b7d6625f1e302a11e7b521f3d24c"]
+    patch = path_diff(repository, new.parents[0], new, "down/under")
+    assert "+++ b/missing-index.md" in patch
+
+
+def test_path_diff_of_root_commit(repository):
+    from pyragit.history import path_diff
+
+    new = repository["fb6f8e469934249d9c89d4190a1412f9a5573865"]
+    patch = path_diff(repository, None, new, "index.md")
+    assert "new file mode" in patch
+
+
+def test_format_diff():
+    from pyragit.history import format_diff
+
+    patch = "--- a/x\n+++ b/x\n@@ -1 +1 @@\n-<old>\n+new\n same"
+    html = format_diff(patch)
+    assert html.startswith('<pre class="pyragit-diff">')
+    assert '<span class="pyragit-diff-removed">-&lt;old&gt;</span>' in html
+    assert '<span class="pyragit-diff-added">+new</span>' in html
+    assert '<span class="pyragit-diff-hunk">@@ -1 +1 @@</span>' in html
+    assert '<span class="pyragit-diff-context"> same</span>' in html
@@ -0,0 +1,156 @@
+""" Tests for pyragit.hosting module """
+
+import pytest
+import webtest
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path):  # Noqa: F811
+    from pyragit import main
+
+    repositories = f"""
+        /docs = {repo_path}
+        /more/docs = {repo_path}
+        docs.example.com = {repo_path}
+    """
+    settings = {
+        "pyragit.repositories": repositories,
+        "pyragit.repositories.max_active": "2",
+        "pyragit.page_cache": "true",
+    }
+    yield webtest.TestApp(main({}, **settings))
+
+
+@pytest.mark.parametrize(
+    "mount, expected",
+    [
+        ("docs.example.com", ("docs.example.com", ())),
+        ("/docs", ("", ("docs",))),
+        ("/more/docs/", ("", ("more", "docs"))),
+        ("Example.com/docs", ("example.com", ("docs",))),
+    ],
+)
+def test_parse_mount(mount, expected):
+    from pyragit.hosting import parse_mount
+
+    assert parse_mount(mount) == expected
+
+
+def test_parse_repositories():
+    from pyragit.hosting import parse_repositories
+
+    result = parse_repositories("\n/docs = /srv/docs.git\n a.com=/srv/a\n")
+    assert result == {
+        ("", ("docs",)): "/srv/docs.git",
+        ("a.com", ()): "/srv/a",
+    }
+
+
+def test_parse_repositories_raises_error():
+    from pyramid.exceptions import ConfigurationError
+
+    from pyragit.hosting import parse_repositories
+
+    with pytest.raises(ConfigurationError):
+        parse_repositories("/docs")
+
+
+def test_hosting_match():
+    from pyragit.hosting import Hosting
+
+    hosting = Hosting()
+    hosting.add(("", ("docs",)), "docs")
+    hosting.add(("", ("docs", "api")), "api")
+    hosting.add(("a.com", ()), "a")
+
+    assert hosting.match("b.com", ["docs", "x.md"]) == ("docs", 1)
+    assert hosting.match("b.com", ["docs", "api", "x"]) == ("api", 2)
+    assert hosting.match("a.com", ["docs", "x.md"]) == ("a", 0)
+    assert hosting.match("b.com", ["other"]) == (None, 0)
+
+
+def test_hosting_evicts_least_recently_used(repo_path):  # Noqa: F811
+    from pyragit.hosting import Site, Hosting
+
+    hosting = Hosting(max_active=2)
+    first, second, third = (Site(name, repo_path) for name in "abc")
+    snapshots = first.tree_snapshots
+
+    hosting.activate(first)
+    hosting.activate(second)
+    hosting.activate(first)
+    hosting.activate(third)
+
+    assert hosting.evictions == 1
+    assert first.tree_snapshots is snapshots
+    assert list(hosting._active) == ["a", "c"]
+
+
+def test_site_evict(repo_path):  # Noqa: F811
+    from pyragit.hosting import Site
+
+    site = Site("docs", repo_path)
+    history_index = site.history_index
+    site_maps = site.site_maps
+    with site.repository_pool.repository():
+        pass
+    assert site.repository_pool._idle.qsize() == 1
+
+    site.evict()
+
+    assert site.repository_pool._idle.qsize() == 0
+    assert site.history_index is not history_index
+    assert site.site_maps is not site_maps
+
+
+def test_app_path_prefix(testapp):
+    response = testapp.get("/docs/")
+    assert "<h1>Pyragit Test Repository</h1>" in response
+    explore = response.html.find(class_="pyragit-explore")
+    hrefs = [link["href"] for link in explore.find_all("a")]
+    assert "/docs/down/" in hrefs
+
+    response = testapp.get("/more/docs/down/traversing.md")
+    assert response.status_code == 200
+
+
+def test_app_host(testapp):
+    environ = {"HTTP_HOST": "docs.example.com"}
+    response = testapp.get("/", extra_environ=environ)
+    assert "<h1>Pyragit Test Repository</h1>" in response
+
+
+def test_app_static_files_below_prefix(testapp):
+    testapp.get("/docs/static/theme.css", status=200)
+
+
+def test_app_not_mounted(testapp):
+    testapp.get("/unknown/", status=404)
+
+
+def test_app_raises_error_with_warmer(repo_path):  # Noqa: F811
+    from pyramid.exceptions import ConfigurationError
+
+    from pyragit import main
+
+    settings = {
+        "pyragit.repositories": f"/docs = {repo_path}",
+        "pyragit.warmer": "true",
+    }
+    with pytest.raises(ConfigurationError):
+        main({}, **settings)
+
+
+def test_app_raises_error_with_stored_history_index(repo_path):  # Noqa: F811
+    from pyramid.exceptions import ConfigurationError
+
+    from pyragit import main
+
+    settings = {
+        "pyragit.repositories": f"/docs = {repo_path}",
+        "pyragit.history_index.path": "history.pickle",
+    }
+    with pytest.raises(ConfigurationError):
+        main({}, **settings)
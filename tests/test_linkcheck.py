@@ -0,0 +1,94 @@
+""" Tests for pyragit.linkcheck module """
+
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture
+def settings(repo_path):  # Noqa: F811
+    yield {"pyragit.repository_path": repo_path}
+
+
+def get_snapshot(repo_path):  # Noqa: F811
+    import pygit2
+
+    from pyragit.snapshot import Snapshot
+
+    def get_markup_renderer(name):
+        return str.upper if name.endswith(".md") else None
+
+    repository = pygit2.Repository(repo_path)
+    return Snapshot(repository, repository.head.target, get_markup_renderer)
+
+
+def test_find_problems(repo_path):  # Noqa: F811
+    from pyragit.linkcheck import find_problems
+
+    snapshot = get_snapshot(repo_path)
+    links = {
+        "down/traversing.md": ["../kitten.jpg", "missing.md", "#top"],
+        "index.md": ["down/", "https://example.com/stream", "/nothing"],
+    }
+    broken, unreferenced = find_problems(snapshot, links)
+    assert broken == [
+        ("down/traversing.md", "missing.md"),
+        ("index.md", "/nothing"),
+    ]
+    assert unreferenced == ["down/text-rendering.txt", "stream"]
+
+
+def test_check(settings, tmp_path):
+    from pyragit.linkcheck import check, load_cache
+
+    cache_path = str(tmp_path / "links.json")
+    report = check(settings, workers=2, cache_path=cache_path)
+    assert report.broken == []
+    assert report.failed == []
+    assert report.unreferenced == ["kitten.jpg", "stream"]
+    assert report.rendered == 7
+    assert len(load_cache(cache_path)) == 7
+
+    second = check(settings, workers=2, cache_path=cache_path)
+    assert second.rendered == 0
+    assert second.unreferenced == report.unreferenced
+
+
+def test_check_without_cache(settings):
+    from pyragit.linkcheck import check
+
+    commit_id = "8b2b58560a73261789f8f1308378e537719d69d1"
+    report = check(settings, ref=commit_id, workers=1)
+    assert report.rendered == 3
+    assert report.unreferenced == ["kitten.jpg", "stream"]
+
+
+def test_load_cache_of_other_version(tmp_path):
+    import json
+
+    from pyragit.linkcheck import load_cache, save_cache
+
+    cache_path = str(tmp_path / "links.json")
+    assert load_cache(cache_path) == {}
+    save_cache(cache_path, {"key": ["link"]})
+    assert load_cache(cache_path) == {"key": ["link"]}
+
+    with open(cache_path, "w") as cache_file:
+        json.dump({"version": "0.0", "documents": {"key": []}}, cache_file)
+    assert load_cache(cache_path) == {}
+
+
+def test_main(settings, mocker, capsys):
+    from pyragit.linkcheck import Report, main
+
+    report = Report([("index.md", "missing.md")], ["stream"], [], 3)
+    mocker.patch("pyragit.linkcheck.get_appsettings", return_value=settings)
+    check = mocker.patch("pyragit.linkcheck.check", return_value=report)
+
+    assert main(["app.ini", "--ref", "v1", "--cache", "links.json"]) == 1
+    check.assert_called_once_with(
+        settings, ref="v1", workers=None, cache_path="links.json"
+    )
+    output = capsys.readouterr().out
+    assert "broken link in index.md: missing.md" in output
+    assert "unreferenced file: stream" in output
@@ -23,3 +23,221 @@ def test_render_text_three_lines():
     with two
     line breaks"""
     assert render_text(text) == "some text<br>    with two<br>    line breaks"
+
+
+def test_highlight_renderer_fenced_code():
+    import mistune
+
+    from pyragit.markup import HighlightRenderer
+
+    render = mistune.Markdown(renderer=HighlightRenderer())
+    result = render("```python extra\nimport os\n```\n")
+    assert '<div class="highlight">' in result
+    assert '<span class="kn">import</span>' in result
+
+
+def test_highlight_renderer_code_without_language():
+    import mistune
+
+    from pyragit.markup import HighlightRenderer
+
+    render = mistune.Markdown(renderer=HighlightRenderer())
+    result = render("```\nimport os\n```\n")
+    assert result == "<pre><code>import os</code></pre>\n"
+
+
+def test_highlight_renderer_unknown_language():
+    import mistune
+
+    from pyragit.markup import HighlightRenderer
+
+    render = mistune.Markdown(renderer=HighlightRenderer())
+    result = render("```nolang\na < b\n```\n")
+    assert result == '<pre class="nolang"><code>a &lt; b\n</code></pre>\n'
+
+
+def test_highlight_renderer_memoizes_code_blocks(mocker):
+    import mistune
+
+    from pyragit.markup import HighlightRenderer
+
+    renderer = HighlightRenderer()
+    spy = mocker.spy(renderer, "highlight")
+    render = mistune.Markdown(renderer=renderer)
+    first = render("# one\n```python\nimport os\n```\n")
+    second = render("# two\n```python\nimport os\n```\n")
+    render("```python\nimport sys\n```\n")
+
+    assert first.split("</h1>")[1] == second.split("</h1>")[1]
+    assert spy.call_count == 2
+    assert renderer.highlighted.hits == 1
+
+
+def test_highlight_renderer_caches_lexers():
+    from pyragit.markup import HighlightRenderer
+
+    renderer = HighlightRenderer()
+    lexer = renderer.get_lexer("python")
+    assert renderer.get_lexer("python") is lexer
+    assert renderer.get_lexer("nolang") is None
+    assert renderer.formatter is renderer.formatter
+
+
+def test_pygments_is_imported_lazily():
+    import sys
+    import subprocess
+
+    code = "import sys, pyragit.markup; print('pygments' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def render_upper(text):
+    """an expensive renderer for the tests, must be picklable"""
+    return text.upper()
+
+
+render_upper.cost = "expensive"
+render_upper.cache_key = "upper:1"
+
+
+def render_slowly(text):
+    import time
+
+    time.sleep(2)
+    return text
+
+
+def test_renderer_registry_get():
+    from pyragit.markup import RendererRegistry, render_text
+
+    registry = RendererRegistry()
+    registry.add("txt", render_text)
+    assert registry.get("some.txt") is render_text
+    assert registry.get("some.md") is None
+    assert registry.get("txt") is None
+
+
+def test_renderer_registry_without_pool_renders_inline():
+    from pyragit.markup import RendererRegistry
+
+    registry = RendererRegistry()
+    registry.add(".up", render_upper)
+    assert registry.get("a.up") is render_upper
+
+
+def test_renderer_registry_wraps_expensive_renderers():
+    from pyragit.markup import RenderPool, PooledRenderer, RendererRegistry
+
+    pool = RenderPool(1)
+    registry = RendererRegistry(pool, timeout=30)
+    registry.add(".up", render_upper)
+    renderer = registry.get("a.up")
+    try:
+        assert isinstance(renderer, PooledRenderer)
+        assert renderer.cache_key == "upper:1"
+        assert renderer("text") == "TEXT"
+    finally:
+        pool.reset()
+
+
+def test_renderer_registry_explicit_cost():
+    from pyragit.markup import (
+        CHEAP,
+        RenderPool,
+        PooledRenderer,
+        RendererRegistry,
+    )
+
+    registry = RendererRegistry(RenderPool(1))
+    registry.add(".up", render_upper, cost=CHEAP)
+    registry.add(".txt", render_slowly, cost="expensive")
+    assert registry.get("a.up") is render_upper
+    assert isinstance(registry.get("a.txt"), PooledRenderer)
+
+
+def test_renderer_registry_entry_points(mocker):
+    from importlib.metadata import EntryPoint, EntryPoints
+
+    from pyragit.markup import ENTRY_POINT_GROUP, RendererRegistry
+
+    entry_point = EntryPoint(
+        ".up", "tests.test_markup:render_upper", ENTRY_POINT_GROUP
+    )
+    mocker.patch(
+        "importlib.metadata.entry_points",
+        return_value=EntryPoints([entry_point]),
+    )
+    registry = RendererRegistry()
+    registry.load_entry_points()
+    assert registry.get("a.up") is render_upper
+
+
+def test_pooled_renderer_size_limit():
+    import pytest
+
+    from pyragit.markup import RenderError, PooledRenderer
+
+    renderer = PooledRenderer(render_upper, pool=None, max_size=3)
+    with pytest.raises(RenderError):
+        renderer("text")
+
+
+def test_pooled_renderer_timeout():
+    import pytest
+
+    from pyragit.markup import RenderPool, RenderError, PooledRenderer
+
+    pool = RenderPool(1)
+    renderer = PooledRenderer(render_slowly, pool, timeout=0.1)
+    try:
+        with pytest.raises(RenderError):
+            renderer("text")
+    finally:
+        pool.reset()
+
+
+def test_pooled_renderer_timeout_frees_the_worker():
+    import pytest
+
+    from pyragit.markup import RenderPool, RenderError, PooledRenderer
+
+    pool = RenderPool(1)
+    renderer = PooledRenderer(render_slowly, pool, timeout=0.5)
+    try:
+        # start the worker process before measuring the timeout
+        assert pool.submit(render_upper, "warm").result(30) == "WARM"
+        with pytest.raises(RenderError):
+            renderer("text")
+        # the slow renderer would still occupy the only worker
+        assert PooledRenderer(render_upper, pool, timeout=1.5)("a") == "A"
+    finally:
+        pool.reset()
+
+
+def test_markdown_cache_key():
+    import importlib.metadata
+
+    import mistune
+
+    from pyragit import __version__
+    from pyragit.markup import markdown_cache_key
+
+    cache_key = markdown_cache_key()
+    assert __version__ in cache_key
+    assert mistune.__version__ in cache_key
+    assert importlib.metadata.version("pygments") in cache_key
+
+
+def test_add_markup_renderer_directive():
+    from pyramid.config import Configurator
+
+    settings = {"pyragit.renderers.workers": "0"}
+    with Configurator(settings=settings) as config:
+        config.include("pyragit.markup")
+        config.add_markup_renderer(".up", render_upper)
+    get_markup_renderer = config.registry.get_markup_renderer
+    assert get_markup_renderer("a.up") is render_upper
+    assert get_markup_renderer("a.md").cache_key.startswith("markdown:")
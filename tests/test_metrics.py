@@ -0,0 +1,99 @@
+""" Tests for pyragit.metrics module """
+
+import pytest
+import webtest
+from pyramid.testing import DummyRequest, DummyResource
+
+from . import repo_path  # Noqa: F401
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path):  # Noqa: F811
+    from pyragit import main
+
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.metrics": "true",
+    }
+    yield webtest.TestApp(main({}, **settings))
+
+
+def test_timed():
+    from pyragit.metrics import timed
+
+    request = DummyRequest(timings={})
+    with timed(request, "phase"):
+        pass
+    with timed(request, "phase"):
+        pass
+    assert list(request.timings) == ["phase"]
+    assert request.timings["phase"] > 0
+
+
+def test_timed_without_metrics():
+    from pyragit.metrics import timed
+
+    request = DummyRequest()
+    with timed(request, "phase"):
+        pass
+    assert not hasattr(request, "timings")
+
+
+def test_histogram():
+    from pyragit.metrics import Histogram
+
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert list(histogram.lines("name", 'a="b"')) == [
+        'name_bucket{a="b",le="1"} 2',
+        'name_bucket{a="b",le="10"} 3',
+        'name_bucket{a="b",le="+Inf"} 4',
+        'name_sum{a="b"} 56.5',
+        'name_count{a="b"} 4',
+    ]
+
+
+def test_metrics_render():
+    from pyragit.cache import LRUCache
+    from pyragit.metrics import Metrics
+
+    metrics = Metrics()
+    cache = metrics.caches["render"] = LRUCache()
+    cache.get("missing")
+    response = DummyResource(content_length=500, status_code=200)
+    metrics.observe({"render": 0.002}, response)
+    result = metrics.render()
+    expected = 'pyragit_phase_seconds_bucket{phase="render",le="0.005"} 1'
+    assert expected in result
+    assert 'pyragit_response_bytes_bucket{le="1000"} 1' in result
+    assert 'pyragit_requests_total{status="200"} 1' in result
+    expected = 'pyragit_cache_requests_total{cache="render",result="miss"} 1'
+    assert expected in result
+
+
+def test_server_timing():
+    from pyragit.metrics import server_timing
+
+    timings = {"render": 0.0012345, "total": 0.01}
+    assert server_timing(timings) == "render;dur=1.23, total;dur=10.00"
+
+
+def test_metrics_server_timing_header(testapp):
+    response = testapp.get("/down/traversing.md")
+    phases = [
+        part.split(";")[0]
+        for part in response.headers["Server-Timing"].split(", ")
+    ]
+    for phase in ("repository", "traversal", "render", "template", "total"):
+        assert phase in phases
+
+
+def test_metrics_view(testapp):
+    testapp.get("/down/")
+    response = testapp.get("/metrics")
+    assert response.content_type == "text/plain"
+    assert 'pyragit_phase_seconds_count{phase="total"}' in response
+    assert 'pyragit_cache_requests_total{cache="render",result="hit"}' in (
+        response
+    )
@@ -0,0 +1,260 @@
+""" Tests for pyragit.pagecache module """
+
+import gzip
+from datetime import datetime, timezone
+
+import pygit2
+import pytest
+import webtest
+from pyramid.request import Request
+
+from . import repo_path, app_config  # Noqa: F401
+
+HEAD_ID = pygit2.Oid(hex="ae046b24b643b7d6625f1e302a11e7b521f3d24c")
+OTHER_ID = pygit2.Oid(hex="dec341716b10a30e42aa9a39d56dcbccb96712b1")
+LAST_MODIFIED = datetime(2018, 3, 7, 8, 57, 14, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def page():
+    from pyragit.pagecache import CachedPage
+
+    bodies = {"identity": b"<p>page</p>", "gzip": b"compressed"}
+    yield CachedPage("text/html", "tag", LAST_MODIFIED, bodies)
+
+
+@pytest.fixture
+def request_for(app_config):  # Noqa: F811
+    def factory(**headers):
+        request = Request.blank("/", headers=headers)
+        request.registry = app_config.registry
+        return request
+
+    yield factory
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path):  # Noqa: F811
+    from pyragit import main
+
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.page_cache": "true",
+    }
+    yield webtest.TestApp(main({}, **settings))
+
+
+def test_cached_page_response(page, request_for):
+    response = page.response(request_for())
+    assert response.body == b"<p>page</p>"
+    assert response.headers["Content-Type"] == "text/html"
+    assert response.headers["ETag"] == '"tag"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "Content-Encoding" not in response.headers
+
+
+def test_cached_page_response_compressed(page, request_for):
+    response = page.response(request_for(**{"Accept-Encoding": "gzip"}))
+    assert response.body == b"compressed"
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == 'W/"tag"'
+
+
+def test_cached_page_response_not_modified(page, request_for):
+    response = page.response(request_for(**{"If-None-Match": '"tag"'}))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"tag"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_cached_page_response_compressed_not_modified(page, request_for):
+    headers = {"If-None-Match": 'W/"tag"', "Accept-Encoding": "gzip"}
+    response = page.response(request_for(**headers))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == 'W/"tag"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_file_page_store(tmp_path, page):
+    from pyragit.pagecache import FilePageStore
+
+    store = FilePageStore(str(tmp_path))
+    assert store.get("key") is None
+    store.set("key", page)
+    cached = FilePageStore(str(tmp_path)).get("key")
+    assert cached.etag == "tag"
+    assert cached.bodies == page.bodies
+    store.clear()
+    assert store.get("key") is None
+
+
+def test_file_page_store_max_age(tmp_path, page):
+    import os
+    import time
+
+    from pyragit.pagecache import FilePageStore
+
+    store = FilePageStore(str(tmp_path), max_age=100)
+    store.set("old", page)
+    store.set("new", page)
+    old = time.time() - 200
+    os.utime(store._path("old"), (old, old))
+    assert store.get("old") is None
+    assert store.get("new").etag == "tag"
+    assert os.path.exists(store._path("old"))
+
+    store.purged = old
+    store.set("other", page)
+    assert not os.path.exists(store._path("old"))
+    assert store.get("new").etag == "tag"
+
+
+def test_page_cache_clears_backend_on_new_head(page):
+    from pyragit.cache import LRUCache
+    from pyragit.pagecache import PageCache
+
+    page_cache = PageCache(LRUCache())
+    assert page_cache.get(HEAD_ID, "/") is None
+    page_cache.set(HEAD_ID, "/", page)
+    assert page_cache.get(HEAD_ID, "/") is page
+    assert page_cache.get(OTHER_ID, "/") is None
+    assert len(page_cache.backend) == 0
+
+
+def test_backend_from_settings(tmp_path):
+    from pyragit.cache import LRUCache
+    from pyragit.pagecache import FilePageStore, backend_from_settings
+
+    backend = backend_from_settings({"pyragit.page_cache.size": "3"})
+    assert isinstance(backend, LRUCache)
+    assert backend.maxsize == 3
+
+    settings = {
+        "pyragit.page_cache.backend": "file",
+        "pyragit.page_cache.directory": str(tmp_path),
+    }
+    backend = backend_from_settings(settings)
+    assert isinstance(backend, FilePageStore)
+    assert backend.max_age == 86400
+    settings["pyragit.page_cache.max_age"] = ""
+    assert backend_from_settings(settings).max_age is None
+
+    settings = {"pyragit.page_cache.backend": "tests.test_pagecache.Backend"}
+    assert isinstance(backend_from_settings(settings), Backend)
+
+
+class Backend(dict):
+    def __init__(self, settings):
+        self.settings = settings
+
+
+def test_page_cache_tween(testapp, mocker):
+    from pyragit.pagecache import CachedPage
+
+    spy = mocker.spy(CachedPage, "from_response")
+    first = testapp.get("/down/traversing.md")
+    second = testapp.get("/down/traversing.md")
+    assert spy.call_count == 1
+    assert first.body == second.body
+    assert "<h1>Pyragit Traversing</h1>" in second
+
+
+def test_page_cache_tween_compressed(testapp):
+    # webtest decodes the content, the raw response is needed
+    headers = {"Accept-Encoding": "gzip"}
+    request = Request.blank("/down/", headers=headers)
+    response = request.get_response(testapp.app)
+    assert response.headers["Content-Encoding"] == "gzip"
+    body = gzip.decompress(response.body)
+    assert b"<h1>&quot;Folders&quot; are a thing</h1>" in body
+
+
+def test_page_cache_tween_skips_files(testapp):
+    response = testapp.get("/stream/")
+    assert "Vary" not in response.headers
+
+
+def test_page_cache_tween_skips_unpinned_revisions(testapp, mocker):
+    from pyragit.pagecache import CachedPage
+
+    spy = mocker.spy(CachedPage, "from_response")
+    testapp.get("/@master/down/traversing.md")
+    assert spy.call_count == 0
+    commit_id = "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
+    testapp.get(f"/@{commit_id}/down/traversing.md")
+    assert spy.call_count == 1
+
+
+def test_page_cache_tween_skips_failed_streamed_page(repo_path):  # Noqa: F811
+    from pyragit import main
+    from pyragit.markup import RenderError
+
+    def failing_renderer(text):
+        raise RenderError("Rendering the document took too long.")
+
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.page_cache": "true",
+        "pyragit.stream_threshold": "0",
+    }
+    app = main({}, **settings)
+    app.registry.renderers.renderers[".md"] = failing_renderer
+    testapp = webtest.TestApp(app)
+
+    response = testapp.get("/down/traversing.md")
+
+    assert "took too long" in response
+    assert "ETag" not in response.headers
+    assert response.headers["Cache-Control"] == "no-store"
+    assert len(app.registry.page_cache.backend) == 0
+
+
+def test_page_cache_tracks_head_per_site(page):
+    from pyragit.cache import LRUCache
+    from pyragit.pagecache import PageCache
+
+    page_cache = PageCache(LRUCache())
+    assert page_cache.get(HEAD_ID, "/a/", "a") is None
+    page_cache.set(HEAD_ID, "/a/", page, "a")
+    assert page_cache.get(OTHER_ID, "/b/", "b") is None
+    page_cache.set(OTHER_ID, "/b/", page, "b")
+    assert page_cache.get(HEAD_ID, "/a/", "a") is page
+    # a push to one site keeps the pages of the others
+    assert page_cache.get(OTHER_ID, "/a/", "a") is None
+    assert page_cache.get(OTHER_ID, "/b/", "b") is page
+    assert page_cache.get(OTHER_ID, "/b/", "a") is None
+
+
+def test_page_cache_get_recent(page, mocker):
+    from pyragit.cache import LRUCache
+    from pyragit.pagecache import PageCache
+
+    page_cache = PageCache(LRUCache())
+    assert page_cache.get_recent("/a/") is None
+    page_cache.get(HEAD_ID, "/a/")
+    page_cache.set(HEAD_ID, "/a/", page)
+    assert page_cache.get_recent("/a/") is page
+    assert page_cache.get_recent("/a/", "other") is None
+    mocker.patch("time.monotonic", return_value=page_cache.checked[""] + 2)
+    assert page_cache.get_recent("/a/", max_age=1) is None
+
+
+def test_page_cache_get_recent_skips_other_backends(tmp_path, page):
+    from pyragit.pagecache import PageCache, FilePageStore
+
+    page_cache = PageCache(FilePageStore(str(tmp_path)))
+    page_cache.get(HEAD_ID, "/a/")
+    page_cache.set(HEAD_ID, "/a/", page)
+    assert page_cache.get_recent("/a/") is None
+
+
+def test_page_cache_keeps_immutable_pages(page):
+    from pyragit.cache import LRUCache
+    from pyragit.views import IMMUTABLE
+    from pyragit.pagecache import PageCache
+
+    page.cache_control = IMMUTABLE
+    page_cache = PageCache(LRUCache())
+    page_cache.set(HEAD_ID, "/@sha/", page)
+    assert page_cache.get(OTHER_ID, "/@sha/") is page
+    assert len(page_cache.backend) == 0
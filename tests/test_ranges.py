@@ -0,0 +1,61 @@
+""" Tests for pyragit.ranges module """
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-4", [(0, 5)]),
+        ("bytes=5-", [(5, 10)]),
+        ("bytes=-3", [(7, 10)]),
+        ("bytes=-30", [(0, 10)]),
+        ("bytes=8-20", [(8, 10)]),
+        ("bytes=0-1, 4-5,-1", [(0, 2), (4, 6), (9, 10)]),
+        ("bytes=10-", []),
+        ("bytes=-0", []),
+        ("bytes=5-2", None),
+        ("bytes=a-2", None),
+        ("bytes=-", None),
+        ("bytes=", None),
+        ("bytes=1", None),
+        ("items=0-4", None),
+    ],
+)
+def test_parse_range(header, expected):
+    from pyragit.ranges import parse_range
+
+    assert parse_range(header, 10) == expected
+
+
+def test_iter_chunks():
+    from pyragit.ranges import iter_chunks
+
+    buffer = memoryview(b"0123456789")
+    result = list(iter_chunks(buffer, 1, 9, chunk_size=3))
+    assert result == [b"123", b"456", b"78"]
+
+
+def test_multipart_byteranges():
+    from pyragit.ranges import MultipartByteranges
+
+    buffer = memoryview(b"0123456789")
+    body = MultipartByteranges(buffer, [(0, 2), (8, 10)], "image/jpeg")
+    boundary = body.boundary
+    assert body.content_type == (
+        f"multipart/byteranges; boundary={boundary}"
+    )
+    expected = (
+        f"--{boundary}\r\n"
+        "Content-Type: image/jpeg\r\n"
+        "Content-Range: bytes 0-1/10\r\n\r\n"
+        "01\r\n"
+        f"--{boundary}\r\n"
+        "Content-Type: image/jpeg\r\n"
+        "Content-Range: bytes 8-9/10\r\n\r\n"
+        "89\r\n"
+        f"--{boundary}--\r\n"
+    ).encode("ascii")
+    data = b"".join(body)
+    assert data == expected
+    assert body.content_length == len(expected)
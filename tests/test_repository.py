@@ -0,0 +1,94 @@
+""" Tests for pyragit.repository module """
+
+import pygit2
+import pytest
+from pyramid.testing import DummyRequest
+
+from . import repo_path  # Noqa: F401
+
+
+def test_repository_pool_init(repo_path):  # Noqa: F811
+    from pyragit.repository import RepositoryPool
+
+    pool = RepositoryPool(repo_path, 2)
+    assert pool.path.rstrip("/").endswith("pyragit-test-repo.git")
+    assert pool.size == 2
+
+
+def test_repository_pool_init_raises_error_on_missing_repo(tmp_path):
+    from pyramid.exceptions import ConfigurationError
+
+    from pyragit.repository import RepositoryPool
+
+    with pytest.raises(ConfigurationError):
+        RepositoryPool(str(tmp_path))
+
+
+def test_repository_pool_reuses_handles(repo_path):  # Noqa: F811
+    from pyragit.repository import RepositoryPool
+
+    pool = RepositoryPool(repo_path)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert isinstance(first, pygit2.Repository)
+    assert first is not second
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_repository_pool_keeps_only_size_handles(repo_path):  # Noqa: F811
+    from pyragit.repository import RepositoryPool
+
+    pool = RepositoryPool(repo_path, 1)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool._idle.qsize() == 1
+
+
+def test_repository_pool_context_manager(repo_path):  # Noqa: F811
+    from pyragit.repository import RepositoryPool
+
+    pool = RepositoryPool(repo_path)
+    with pool.repository() as repository:
+        assert pool._idle.qsize() == 0
+    assert pool.acquire() is repository
+
+
+def test_request_repository(repo_path):  # Noqa: F811
+    from pyragit.repository import RepositoryPool, request_repository
+
+    pool = RepositoryPool(repo_path)
+    request = DummyRequest()
+    repository = request_repository(request, pool)
+    assert pool._idle.qsize() == 0
+    request._process_finished_callbacks()
+    assert pool.acquire() is repository
+
+
+def test_hold_repository(repo_path):  # Noqa: F811
+    from pyragit.repository import (
+        RepositoryPool,
+        hold_repository,
+        request_repository,
+    )
+
+    pool = RepositoryPool(repo_path)
+    request = DummyRequest()
+    repository = request_repository(request, pool)
+    app_iter = hold_repository(request, iter([b"a", b"b"]))
+    request._process_finished_callbacks()
+    assert pool._idle.qsize() == 0
+
+    assert b"".join(app_iter) == b"ab"
+    app_iter.close()
+    assert pool.acquire() is repository
+    app_iter.close()
+    assert pool._idle.qsize() == 0
+
+
+def test_hold_repository_without_repository():
+    from pyragit.repository import hold_repository
+
+    app_iter = [b"a"]
+    assert hold_repository(DummyRequest(), app_iter) is app_iter
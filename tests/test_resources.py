@@ -49,6 +49,64 @@ def test_base_resource_last_commmit(root, name, gitid):
     assert last_commit.hex == gitid
 
 
+@pytest.mark.parametrize(
+    "name,gitid",
+    [
+        ("down", "ae046b24b643b7d6625f1e302a11e7b521f3d24c"),
+        ("index.md", "fb6f8e469934249d9c89d4190a1412f9a5573865"),
+        ("multi-commit.md", "616f5deb2ec226bebb31291576338cd951628810"),
+    ],
+)
+def test_base_resource_last_commmit_with_history_index(root, name, gitid):
+    from pyragit.history import HistoryIndex
+
+    root.request.history_index = HistoryIndex()
+    resource = root[name]
+    assert resource.last_commit.hex == gitid
+
+
+def test_base_resource_git_path(root):
+    resource = root["down"]["traversing.md"]
+    assert resource.git_path == "down/traversing.md"
+
+
+def test_base_resource_cached_attributes(root):
+    resource = root["down"]
+    assert resource.pygit2_object is resource.pygit2_object
+    assert resource.last_commit is resource.last_commit
+    assert resource.index is resource.index
+
+
+def test_base_resource_not_retained(root):
+    import gc
+    import weakref
+
+    resource = root["down"]
+    resource.last_commit
+    reference = weakref.ref(resource)
+    del resource
+    gc.collect()
+    assert reference() is None
+
+
+def test_load_object(request_object):
+    from pyragit.resources import load_object
+
+    oid = pygit2.Oid(hex="d167a846353b7c631f8ee42c992ba8c4b0dece68")
+    request_object.git_objects = {}
+    blob = load_object(request_object, oid)
+    assert isinstance(blob, pygit2.Blob)
+    assert request_object.git_objects == {oid: blob}
+    assert load_object(request_object, oid) is blob
+
+
+def test_load_object_without_object_map(request_object):
+    from pyragit.resources import load_object
+
+    oid = pygit2.Oid(hex="d167a846353b7c631f8ee42c992ba8c4b0dece68")
+    assert isinstance(load_object(request_object, oid), pygit2.Blob)
+
+
 def test_root_last_commit(root):
     assert isinstance(root.last_commit, pygit2.Commit)
     assert root.last_commit.hex == "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
@@ -95,6 +153,17 @@ def test_root_init(request_object):
     assert root.request == request_object
 
 
+def test_root_uses_snapshot_cache(request_object):
+    from pyragit.snapshot import SnapshotCache
+    from pyragit.resources import Root
+
+    request_object.tree_snapshots = SnapshotCache()
+    first = Root(request_object)
+    second = Root(request_object)
+    assert first.snapshot is second.snapshot
+    assert first.commit_id.hex == "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
+
+
 def test_root_pygit2_object(root):
     assert isinstance(root.pygit2_object, pygit2.Tree)
     assert root.pygit2_object.hex == "a41a8c8e1212a3a8955fe25c42c3e0a62744be70"
@@ -190,6 +259,39 @@ def test_folder_iter_folder(root):
     assert entry_3.__name__ == "traversing.md"
 
 
+def test_folder_listing(root, mocker):
+    from pyragit import resources
+
+    spy = mocker.spy(resources, "walk_last_commits")
+    result = root["down"].listing()
+    assert [r.__name__ for r in result] == [
+        "under",
+        "text-rendering.txt",
+        "traversing.md",
+    ]
+    assert [r.last_commit.hex for r in result] == [
+        "ae046b24b643b7d6625f1e302a11e7b521f3d24c",
+        "dec341716b10a30e42aa9a39d56dcbccb96712b1",
+        "4b0328bd8730ab388d965116713c88d7d2a72ffe",
+    ]
+    assert spy.call_count == 1
+
+
+def test_folder_listing_with_history_index(root, mocker):
+    from pyragit import resources
+    from pyragit.history import HistoryIndex
+
+    root.request.history_index = HistoryIndex()
+    spy = mocker.spy(resources, "walk_last_commits")
+    result = root.listing()
+    assert [r.last_commit.hex for r in result] == [
+        "ae046b24b643b7d6625f1e302a11e7b521f3d24c",
+        "8b2b58560a73261789f8f1308378e537719d69d1",
+        "616f5deb2ec226bebb31291576338cd951628810",
+    ]
+    assert spy.call_count == 0
+
+
 def test_file_data(root):
     fi = root["stream"]
     assert fi.data == b"other or unknown files should be delivered as binary."
@@ -201,6 +303,36 @@ def test_file_size(root):
     assert fi.size == expected
 
 
+def test_file_buffer(root):
+    fi = root["stream"]
+    assert isinstance(fi.buffer, memoryview)
+    assert fi.buffer.readonly
+    assert bytes(fi.buffer) == fi.data
+
+
+def test_file_buffer_uses_blob_cache(root):
+    from pyragit.cache import BlobCache
+
+    root.request.blob_cache = BlobCache()
+    first = root["stream"]
+    assert first.buffer.readonly
+    assert first.oid in root.request.blob_cache
+
+    second = root["stream"]
+    assert bytes(second.buffer) == bytes(first.buffer)
+    assert root.request.blob_cache.hits == 1
+
+
+def test_file_buffer_bypasses_blob_cache_for_large_files(root):
+    from pyragit.cache import BlobCache
+
+    root.request.blob_cache = BlobCache(max_item_size=1024)
+    fi = root["kitten.jpg"]
+    assert fi.size == 110969
+    assert fi.buffer.readonly
+    assert fi.oid not in root.request.blob_cache
+
+
 def test_markup_text(root):
     markup = root["index.md"]
     assert isinstance(markup.text, str)
@@ -213,3 +345,122 @@ def test_markup_render(root):
     rendered = markup.render()
     assert rendered.startswith(">>Pyragit Test Repository\n")
     assert rendered.endswith("project.<<")
+
+
+def test_markup_render_uses_render_cache(root):
+    from pyragit.cache import RenderCache
+
+    root.request.render_cache = RenderCache()
+    markup = root["index.md"]
+    markup.renderer = lambda x: "rendered"
+    markup.renderer.cache_key = "test"
+    assert markup.render() == "rendered"
+
+    markup.renderer = lambda x: "not used"
+    markup.renderer.cache_key = "test"
+    assert markup.render() == "rendered"
+
+
+def test_markup_render_error(root):
+    from pyragit.cache import RenderCache
+    from pyragit.markup import RenderError
+
+    def failing_renderer(text):
+        raise RenderError("too <large>")
+
+    failing_renderer.cache_key = "test"
+    root.request.render_cache = RenderCache()
+    root.request.response.etag = "some-etag"
+    markup = root["index.md"]
+    markup.renderer = failing_renderer
+    rendered = markup.render()
+    assert rendered == '<p class="pyragit-render-error">too &lt;large&gt;</p>'
+    assert root.request.response.etag is None
+    assert root.request.response.cache_control.no_store
+    assert len(root.request.render_cache.memory) == 0
+
+
+@pytest.mark.parametrize(
+    "key,commit_id,immutable",
+    [
+        ("@master", "ae046b24b643b7d6625f1e302a11e7b521f3d24c", False),
+        ("@8b2b585", "8b2b58560a73261789f8f1308378e537719d69d1", False),
+        (
+            "@8b2b58560a73261789f8f1308378e537719d69d1",
+            "8b2b58560a73261789f8f1308378e537719d69d1",
+            True,
+        ),
+    ],
+)
+def test_root_getitem_revision(root, key, commit_id, immutable):
+    from pyragit.resources import Revision
+
+    revision = root[key]
+
+    assert isinstance(revision, Revision)
+    assert revision.__name__ == key
+    assert revision.__parent__ is root
+    assert revision.commit_id.hex == commit_id
+    assert revision.immutable is immutable
+    assert revision.history_index is None
+
+
+@pytest.mark.parametrize("key", ["@unknown", "@master:down", "@"])
+def test_root_getitem_revision_raises_key_error(root, key):
+    with pytest.raises(KeyError):
+        root[key]
+
+
+def test_root_getitem_prefers_files_over_revisions(tmp_path):
+    from pyragit.resources import Root, Markup
+
+    repository = pygit2.init_repository(str(tmp_path), bare=True)
+    signature = pygit2.Signature("Jane Doe", "jane@example.com", 1000, 0)
+    builder = repository.TreeBuilder()
+    blob = repository.create_blob(b"# Team")
+    builder.insert("@master.md", blob, pygit2.GIT_FILEMODE_BLOB)
+    builder.insert("@master", blob, pygit2.GIT_FILEMODE_BLOB)
+    repository.create_commit(
+        "refs/heads/master", signature, signature, "m", builder.write(), []
+    )
+    repository.set_head("refs/heads/master")
+    request = DummyRequest(
+        repository=repository, get_markup_renderer=dummy_get_markup_renderer
+    )
+    root = Root(request)
+
+    assert isinstance(root["@master.md"], Markup)
+    assert root["@master"].__name__ == "@master"
+    assert root["@master"].node.path == "@master"
+
+
+def test_root_of_other_commit_uses_history_index_cache(request_object):
+    from pyragit.history import HistoryIndexCache
+    from pyragit.resources import Root
+
+    commit_id = pygit2.Oid(hex="8b2b58560a73261789f8f1308378e537719d69d1")
+    request_object.environ["pyragit.revision_id"] = commit_id
+    request_object.history_indexes = HistoryIndexCache()
+    root = Root(request_object)
+
+    assert root.history_index is request_object.history_indexes.get(commit_id)
+    markup = root["desrcription.md"]
+    assert markup.last_commit.id == commit_id
+    assert root.history_index.head == commit_id
+
+
+def test_revision_traversal(root):
+    revision = root["@8b2b58560a73261789f8f1308378e537719d69d1"]
+
+    markup = revision["desrcription.md"]
+
+    assert markup.revision is revision
+    assert markup.last_commit.hex == revision.commit_id.hex
+    assert [child.__name__ for child in revision] == [
+        "desrcription.md",
+        "multi-commit.md",
+    ]
+    with pytest.raises(KeyError):
+        revision["down"]
+    with pytest.raises(KeyError):
+        revision["@master"]
@@ -0,0 +1,115 @@
+""" Tests for pyragit.search module """
+
+import pygit2
+import pytest
+import webtest
+
+from . import repo_path  # Noqa: F401
+
+OLD_ID = pygit2.Oid(hex="4b0328bd8730ab388d965116713c88d7d2a72ffe")
+
+
+def dummy_get_markup_renderer(name):
+    if name.endswith((".md", ".txt")):
+        return "renderer"
+    return None
+
+
+@pytest.fixture
+def repository(repo_path):  # Noqa: F811
+    yield pygit2.Repository(repo_path)
+
+
+@pytest.fixture
+def search_index(tmp_path):
+    from pyragit.search import SearchIndex
+
+    index_path = str(tmp_path / "search.sqlite")
+    yield SearchIndex(index_path, dummy_get_markup_renderer)
+
+
+@pytest.fixture(scope="module")
+def testapp(repo_path, tmp_path_factory):  # Noqa: F811
+    from pyragit import main
+
+    index_path = tmp_path_factory.mktemp("search") / "search.sqlite"
+    settings = {
+        "pyragit.repository_path": repo_path,
+        "pyragit.search.index_path": str(index_path),
+    }
+    yield webtest.TestApp(main({}, **settings))
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("# Title\n\nbody", "Title"),
+        ("\n\n  Some Title  \n=====", "Some Title"),
+        ("", ""),
+    ],
+)
+def test_get_title(text, expected):
+    from pyragit.search import get_title
+
+    assert get_title(text) == expected
+
+
+def test_fts_query():
+    from pyragit.search import fts_query
+
+    assert fts_query(' some "query  OR ') == '"some" """query" "OR"'
+    assert fts_query("   ") == ""
+
+
+def test_format_snippet():
+    from pyragit.search import MARK_END, MARK_START, format_snippet
+
+    snippet = f"a <b> {MARK_START}word{MARK_END}"
+    assert format_snippet(snippet) == "a &lt;b&gt; <mark>word</mark>"
+
+
+def test_search_index_update(search_index, repository):
+    search_index.update(repository)
+    assert search_index.head == repository.head.target
+    results = search_index.search("traversing")
+    assert [path for path, title, snippet in results] == [
+        "down/traversing.md"
+    ]
+    path, title, snippet = results[0]
+    assert title == "Pyragit Traversing"
+    assert "<mark>Traversing</mark>" in snippet
+
+
+def test_search_index_ignores_other_files(search_index, repository):
+    search_index.update(repository)
+    assert search_index.search("binary") == []
+
+
+def test_search_index_incremental_update(search_index, repository, mocker):
+    search_index.update(repository, OLD_ID)
+    assert search_index.search("crivens") == []
+    spy = mocker.spy(search_index, "_add_document")
+    search_index.update(repository)
+    # only the two changed files are processed
+    assert spy.call_count == 2
+    assert search_index.search("rendered")
+
+
+def test_search_index_persists_head(search_index, repository):
+    from pyragit.search import SearchIndex
+
+    search_index.update(repository)
+    reopened = SearchIndex(search_index.path, dummy_get_markup_renderer)
+    assert reopened.head == repository.head.target
+
+
+def test_search_view(testapp):
+    response = testapp.get("/search", params={"q": "traversing"})
+    results = response.html.find_all(class_="pyragit-search-result")
+    assert len(results) == 1
+    assert results[0].a["href"] == "/down/traversing.md"
+
+
+def test_search_view_without_query(testapp):
+    response = testapp.get("/search")
+    assert not response.html.find_all(class_="pyragit-search-result")
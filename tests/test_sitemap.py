@@ -0,0 +1,158 @@
+""" Tests for pyragit.sitemap module """
+
+import pygit2
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+RENDERED = (
+    '<h1>Title <em>of</em> page</h1><h2>Sub</h2><p><a href="/index.md/">'
+    'home</a> <a href="missing.md">missing</a> <img src="/kitten.jpg">'
+    '<a href="https://example.com/">external</a></p>'
+)
+
+
+def dummy_renderer(text):
+    return RENDERED
+
+
+dummy_renderer.cache_key = "dummy"
+
+
+def dummy_get_markup_renderer(name):
+    if name.endswith((".md", ".txt")):
+        return dummy_renderer
+    return None
+
+
+@pytest.fixture
+def repository(repo_path):  # Noqa: F811
+    yield pygit2.Repository(repo_path)
+
+
+@pytest.fixture
+def snapshot(repository):
+    from pyragit.snapshot import Snapshot
+
+    commit_id = repository.head.target
+    yield Snapshot(repository, commit_id, dummy_get_markup_renderer)
+
+
+def test_parse_page():
+    from pyragit.sitemap import parse_page
+
+    title, links = parse_page(RENDERED)
+    assert title == "Title of page"
+    assert links == (
+        "/index.md/",
+        "missing.md",
+        "/kitten.jpg",
+        "https://example.com/",
+    )
+
+
+def test_parse_page_without_heading():
+    from pyragit.sitemap import parse_page
+
+    assert parse_page("<p>text</p>") == (None, ())
+
+
+@pytest.mark.parametrize(
+    "folder,href,expected",
+    [
+        ("down", "traversing.md", "down/traversing.md"),
+        ("down", "traversing.md/", "down/traversing.md"),
+        ("down", "../index.md/#anchor", "index.md"),
+        ("down", "/kitten.jpg?size=1", "kitten.jpg"),
+        ("down", "under/missing%2Dindex.md", "down/under/missing-index.md"),
+        ("", "../../index.md", "index.md"),
+        ("", "./", ""),
+        ("down", "https://example.com/index.md", None),
+        ("down", "mailto:mail@example.com", None),
+        ("down", "#anchor", None),
+        ("down", "/static/theme.css", None),
+        ("down", "traversing.md/@history", None),
+        ("down", "/@v1/index.md", None),
+    ],
+)
+def test_link_target(folder, href, expected):
+    from pyragit.sitemap import link_target
+
+    assert link_target(folder, href) == expected
+
+
+def test_build_site_map(repository, snapshot):
+    from pyragit.sitemap import build_site_map
+
+    site_map = build_site_map(repository, snapshot)
+    page = site_map.pages["down/traversing.md"]
+    assert page.title == "Title of page"
+    assert page.links == ("index.md", "kitten.jpg")
+    assert page.broken == ("missing.md",)
+    assert "kitten.jpg" not in site_map.pages
+    # a page does not link to itself
+    assert site_map.pages["index.md"].links == ("kitten.jpg",)
+    assert "index.md" not in site_map.backlinks["index.md"]
+    assert "down/traversing.md" in site_map.backlinks["index.md"]
+
+
+def test_build_site_map_uses_parsed_cache(repository, snapshot, mocker):
+    from pyragit.cache import LRUCache
+    from pyragit.sitemap import build_site_map
+
+    parsed = LRUCache()
+    build_site_map(repository, snapshot, parsed=parsed)
+    render_page = mocker.patch("pyragit.sitemap.render_page")
+    site_map = build_site_map(repository, snapshot, parsed=parsed)
+    assert render_page.call_count == 0
+    assert site_map.pages["index.md"].title == "Title of page"
+
+
+def test_build_site_map_render_error(repository, snapshot, mocker):
+    from pyragit.cache import LRUCache
+    from pyragit.markup import RenderError
+    from pyragit.sitemap import build_site_map
+
+    mocker.patch("pyragit.sitemap.render_page", side_effect=RenderError)
+    parsed = LRUCache()
+    site_map = build_site_map(repository, snapshot, parsed=parsed)
+    assert site_map.pages["index.md"].title is None
+    assert len(parsed) == 0
+
+
+def test_site_map_nav_json(repository, snapshot):
+    import json
+
+    from pyragit.sitemap import build_site_map
+
+    site_map = build_site_map(repository, snapshot)
+    tree = json.loads(site_map.nav_json)
+    assert tree["path"] == ""
+    assert tree["title"] == "Title of page"
+    names = [child["name"] for child in tree["children"]]
+    assert names == ["down", "desrcription.md", "multi-commit.md"]
+    down = tree["children"][0]
+    assert down["children"][0]["path"] == "down/under"
+
+
+def test_site_map_sitemap_xml(repository, snapshot):
+    from pyragit.sitemap import build_site_map
+
+    site_map = build_site_map(repository, snapshot)
+    parts = list(site_map.sitemap_xml("http://example.com/", lambda p: None))
+    assert parts[0].startswith("<?xml")
+    assert parts[-1] == "</urlset>\n"
+    assert "<url><loc>http://example.com/</loc></url>\n" in parts
+    urls = "".join(parts)
+    assert "http://example.com/down/under/missing-index.md/" in urls
+    assert "kitten.jpg" not in urls
+    assert "<lastmod>" not in urls
+
+
+def test_site_map_cache(repository, snapshot):
+    from pyragit.sitemap import SiteMapCache
+
+    cache = SiteMapCache()
+    site_map = cache.get(repository, snapshot)
+    assert cache.get(repository, snapshot) is site_map
+    assert len(cache.parsed) == len(site_map.pages)
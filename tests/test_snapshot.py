@@ -0,0 +1,125 @@
+""" Tests for pyragit.snapshot module """
+
+import pygit2
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+HEAD_ID = "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
+
+
+def dummy_get_markup_renderer(name):
+    if name.endswith(".md"):
+        return "markdown"
+    if name.endswith(".txt"):
+        return "text"
+    return None
+
+
+@pytest.fixture
+def repository(repo_path):  # Noqa: F811
+    yield pygit2.Repository(repo_path)
+
+
+@pytest.fixture
+def snapshot(repository):
+    from pyragit.snapshot import Snapshot
+
+    commit_id = repository.head.target
+    yield Snapshot(repository, commit_id, dummy_get_markup_renderer)
+
+
+def test_node_uses_slots():
+    from pyragit.snapshot import Node
+
+    node = Node("name", "some/name", None, False)
+    with pytest.raises(AttributeError):
+        node.something = "else"
+
+
+def test_snapshot_root(snapshot):
+    root = snapshot.root
+    assert snapshot.commit_id.hex == HEAD_ID
+    assert root.path == ""
+    assert root.is_tree
+    assert root.oid.hex == "a41a8c8e1212a3a8955fe25c42c3e0a62744be70"
+    assert sorted(root.children) == [
+        "desrcription.md",
+        "down",
+        "index.md",
+        "kitten.jpg",
+        "multi-commit.md",
+        "stream",
+    ]
+    assert [n.name for n in root.listing] == [
+        "down",
+        "desrcription.md",
+        "multi-commit.md",
+    ]
+    assert root.index.name == "index.md"
+
+
+def test_snapshot_renderer_assignment(snapshot):
+    assert snapshot.find("index.md").renderer == "markdown"
+    assert snapshot.find("down/text-rendering.txt").renderer == "text"
+    assert snapshot.find("kitten.jpg").renderer is None
+
+
+def test_snapshot_folder_without_index(snapshot):
+    node = snapshot.find("down/under")
+    assert node.path == "down/under"
+    assert node.index is None
+    assert [n.name for n in node.listing] == ["missing-index.md"]
+
+
+@pytest.mark.parametrize("path", ["unknown", "index.md/other", "down/x"])
+def test_snapshot_find_raises_key_error(snapshot, path):
+    with pytest.raises(KeyError):
+        snapshot.find(path)
+
+
+def test_snapshot_walk(snapshot):
+    paths = [node.path for node in snapshot.walk()]
+    assert paths[:3] == ["", "desrcription.md", "down"]
+    assert len(paths) == 12
+
+
+def test_snapshot_cache_builds_once(repository, mocker):
+    from pyragit import snapshot
+    from pyragit.snapshot import SnapshotCache
+
+    spy = mocker.spy(snapshot, "build_node")
+    cache = SnapshotCache()
+    commit_id = repository.head.target
+    first = cache.get(repository, commit_id, dummy_get_markup_renderer)
+    calls = spy.call_count
+    second = cache.get(repository, commit_id, dummy_get_markup_renderer)
+    assert first is second
+    assert spy.call_count == calls
+
+
+def test_snapshot_cache_builds_commits_concurrently(repository, mocker):
+    import threading
+
+    from pyragit import snapshot
+    from pyragit.snapshot import SnapshotCache
+
+    other_started = threading.Event()
+
+    class SlowSnapshot:
+        def __init__(self, repository, commit_id, get_markup_renderer):
+            if commit_id == "first":
+                # blocks, if the other commit can not be built meanwhile
+                assert other_started.wait(5)
+            else:
+                other_started.set()
+
+    mocker.patch.object(snapshot, "Snapshot", SlowSnapshot)
+    cache = SnapshotCache()
+    first = threading.Thread(
+        target=cache.get, args=(repository, "first", None)
+    )
+    first.start()
+    cache.get(repository, "other", None)
+    first.join(5)
+    assert "first" in cache.snapshots
@@ -1,19 +1,114 @@
 """ Tests for pyragit.views module """
 
+from datetime import datetime, timezone
+
+import pygit2
 import pytest
-from pyramid.testing import DummyRequest, DummyResource
+from pyramid.request import Request
+from pyramid.testing import DummyResource
 
+from . import app_config  # Noqa: F401
 
-def test_folder():
-    from pyragit.views import folder
+BLOB_ID = "d167a846353b7c631f8ee42c992ba8c4b0dece68"
+COMMIT_ID = "ae046b24b643b7d6625f1e302a11e7b521f3d24c"
+COMMIT_TIME = 1520413034
+LAST_MODIFIED = "Wed, 07 Mar 2018 08:57:14 GMT"
 
-    assert folder(None, None) == {}
 
+@pytest.fixture
+def context():
+    commit = DummyResource(hex=COMMIT_ID, commit_time=COMMIT_TIME)
+    yield DummyResource(
+        __name__="some.file",
+        data=b"some binary data",
+        buffer=memoryview(b"some binary data"),
+        size=16,
+        renderer=None,
+        oid=pygit2.Oid(hex=BLOB_ID),
+        last_commit=commit,
+        revision=DummyResource(
+            last_commit=commit, immutable=False, history_index=None
+        ),
+    )
 
-def test_markup():
-    from pyragit.views import markup
 
-    assert markup(None, None) == {}
+@pytest.fixture
+def request_for(app_config):  # Noqa: F811
+    def factory(**headers):
+        request = Request.blank("/", headers=headers)
+        request.registry = app_config.registry
+        return request
+
+    yield factory
+
+
+def test_commit_time():
+    from pyragit.views import commit_time
+
+    commit = DummyResource(commit_time=COMMIT_TIME)
+    expected = datetime(2018, 3, 7, 8, 57, 14, tzinfo=timezone.utc)
+    assert commit_time(commit) == expected
+
+
+def test_not_modified_without_conditional_headers(request_for):
+    from pyragit.views import not_modified
+
+    request = request_for()
+    last_modified = datetime(2018, 3, 7, 8, 57, 14, tzinfo=timezone.utc)
+    assert not_modified(request, "tag", last_modified) is None
+    assert request.response.headers["ETag"] == '"tag"'
+    assert request.response.headers["Last-Modified"] == LAST_MODIFIED
+
+
+@pytest.mark.parametrize(
+    "headers,expected_status",
+    [
+        ({"If-None-Match": '"tag"'}, 304),
+        ({"If-None-Match": '"other", "tag"'}, 304),
+        ({"If-None-Match": "*"}, 304),
+        ({"If-None-Match": '"other"'}, None),
+        ({"If-Modified-Since": LAST_MODIFIED}, 304),
+        ({"If-Modified-Since": "Wed, 07 Mar 2018 08:57:13 GMT"}, None),
+        (
+            {"If-None-Match": '"other"', "If-Modified-Since": LAST_MODIFIED},
+            None,
+        ),
+    ],
+)
+def test_not_modified_conditional_headers(
+    request_for, headers, expected_status
+):
+    from pyragit.views import not_modified
+
+    request = request_for(**headers)
+    last_modified = datetime(2018, 3, 7, 8, 57, 14, tzinfo=timezone.utc)
+    result = not_modified(request, "tag", last_modified)
+    if expected_status is None:
+        assert result is None
+    else:
+        assert result.status_code == expected_status
+        assert result.headers["ETag"] == '"tag"'
+        assert result.headers["Last-Modified"] == LAST_MODIFIED
+
+
+@pytest.mark.parametrize("view_name", ["folder", "markup"])
+def test_page_views(context, request_for, view_name):
+    from pyragit import views
+
+    view = getattr(views, view_name)
+    request = request_for()
+    assert view(context, request) == {}
+    expected = f'"{COMMIT_ID}-{BLOB_ID}"'
+    assert request.response.headers["ETag"] == expected
+
+
+@pytest.mark.parametrize("view_name", ["folder", "markup"])
+def test_page_views_not_modified(context, request_for, view_name):
+    from pyragit import views
+
+    view = getattr(views, view_name)
+    request = request_for(**{"If-None-Match": f'"{COMMIT_ID}-{BLOB_ID}"'})
+    assert view(context, request).status_code == 304
 
 
 def test_notfound():
@@ -30,13 +125,127 @@ def test_notfound():
         ("known extension.jpg", "image/jpeg"),
     ],
 )
-def test_blob(filename, content_type):
+def test_blob(context, request_for, filename, content_type):
     from pyragit.views import blob
 
-    data = b"some binary data"
-    context = DummyResource(__name__=filename, data=data)
-    request = DummyRequest()
+    context.__name__ = filename
+    request = request_for()
     result = blob(context, request)
     assert result.headers["Content-Type"] == content_type
-    assert result.headers["Accept-Ranges"] == "bite"
+    assert result.headers["Accept-Ranges"] == "bytes"
+    assert result.headers["Content-Length"] == "16"
     assert list(result.app_iter) == [b"some binary data"]
+    assert result.headers["ETag"] == f'"{BLOB_ID}"'
+
+
+def test_markup_of_expensive_renderer_is_not_streamed(context, request_for):
+    from pyragit.views import markup
+    from pyragit.markup import EXPENSIVE
+
+    def renderer(text):
+        return text
+
+    renderer.cost = EXPENSIVE
+    context.renderer = renderer
+    context.size = 10 * 1024 * 1024
+    assert markup(context, request_for()) == {}
+
+
+def test_blob_not_modified(context, request_for):
+    from pyragit.views import blob
+
+    request = request_for(**{"If-None-Match": f'"{BLOB_ID}"'})
+    result = blob(context, request)
+    assert result.status_code == 304
+
+
+def test_serve_blob_not_modified_does_not_load_buffer(request_for):
+    from pyragit.views import serve_blob
+
+    def get_buffer():
+        raise AssertionError("blob loaded for a 304 response")
+
+    request = request_for(**{"If-None-Match": f'"{BLOB_ID}"'})
+    last_modified = datetime(2018, 3, 7, 8, 57, 14, tzinfo=timezone.utc)
+    oid = pygit2.Oid(hex=BLOB_ID)
+    result = serve_blob(request, "some.file", oid, get_buffer, last_modified)
+    assert result.status_code == 304
+
+
+@pytest.mark.parametrize(
+    "headers,expected_body,content_range",
+    [
+        ({"Range": "bytes=5-10"}, b"binary", "bytes 5-10/16"),
+        ({"Range": "bytes=-4"}, b"data", "bytes 12-15/16"),
+        (
+            {"Range": "bytes=-4", "If-Range": f'"{BLOB_ID}"'},
+            b"data",
+            "bytes 12-15/16",
+        ),
+        (
+            {"Range": "bytes=-4", "If-Range": LAST_MODIFIED},
+            b"data",
+            "bytes 12-15/16",
+        ),
+    ],
+)
+def test_blob_single_range(
+    context, request_for, headers, expected_body, content_range
+):
+    from pyragit.views import blob
+
+    result = blob(context, request_for(**headers))
+    assert result.status_code == 206
+    assert result.headers["Content-Range"] == content_range
+    assert result.headers["Content-Length"] == str(len(expected_body))
+    assert b"".join(result.app_iter) == expected_body
+
+
+def test_blob_multiple_ranges(context, request_for):
+    from pyragit.views import blob
+
+    result = blob(context, request_for(Range="bytes=0-3,-4"))
+    assert result.status_code == 206
+    assert result.content_type == "multipart/byteranges"
+    body = b"".join(result.app_iter)
+    assert result.headers["Content-Length"] == str(len(body))
+    assert b"Content-Range: bytes 0-3/16\r\n\r\nsome\r\n" in body
+    assert b"Content-Range: bytes 12-15/16\r\n\r\ndata\r\n" in body
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"Range": "bytes=3-1"},
+        {"Range": "bytes=0-3", "If-Range": '"other"'},
+        {"Range": "bytes=0-3", "If-Range": "Wed, 07 Mar 2018 08:57:13 GMT"},
+    ],
+)
+def test_blob_range_ignored(context, request_for, headers):
+    from pyragit.views import blob
+
+    result = blob(context, request_for(**headers))
+    assert result.status_code == 200
+    assert b"".join(result.app_iter) == b"some binary data"
+
+
+def test_blob_range_not_satisfiable(context, request_for):
+    from pyragit.views import blob
+
+    result = blob(context, request_for(Range="bytes=16-"))
+    assert result.status_code == 416
+    assert result.headers["Content-Range"] == "bytes */16"
+
+
+def test_immutable_page_cache_control(context, request_for):
+    from pyragit.views import IMMUTABLE, markup
+
+    context.revision.immutable = True
+    request = request_for()
+    markup(context, request)
+    assert request.response.headers["Cache-Control"] == IMMUTABLE
+
+    request = request_for(**{"If-None-Match": f'"{COMMIT_ID}-{BLOB_ID}"'})
+    response = markup(context, request)
+    assert response.status_code == 304
+    assert response.headers["Cache-Control"] == IMMUTABLE
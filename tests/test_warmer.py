@@ -0,0 +1,99 @@
+""" Tests for pyragit.warmer module """
+
+from types import SimpleNamespace
+
+import pygit2
+import pytest
+
+from . import repo_path  # Noqa: F401
+
+OLD_ID = pygit2.Oid(hex="4b0328bd8730ab388d965116713c88d7d2a72ffe")
+
+
+def render_upper(text):
+    return text.upper()
+
+
+render_upper.cache_key = "upper"
+
+
+def dummy_get_markup_renderer(name):
+    if name.endswith((".md", ".txt")):
+        return render_upper
+    return None
+
+
+@pytest.fixture
+def registry(repo_path):  # Noqa: F811
+    from pyragit.cache import RenderCache
+    from pyragit.history import HistoryIndex
+    from pyragit.snapshot import SnapshotCache
+    from pyragit.repository import RepositoryPool
+
+    yield SimpleNamespace(
+        repository_pool=RepositoryPool(repo_path),
+        render_cache=RenderCache(),
+        history_index=HistoryIndex(),
+        tree_snapshots=SnapshotCache(),
+        get_markup_renderer=dummy_get_markup_renderer,
+    )
+
+
+@pytest.fixture
+def repository(registry):
+    with registry.repository_pool.repository() as repository:
+        yield repository
+
+
+def test_changed_blobs(repository):
+    from pyragit.warmer import changed_blobs
+
+    result = changed_blobs(repository, OLD_ID, repository.head.target)
+    assert sorted(path for path, oid in result) == [
+        "down/text-rendering.txt",
+        "down/under/missing-index.md",
+    ]
+
+
+def test_changed_blobs_without_old_commit(repository):
+    from pyragit.warmer import changed_blobs
+
+    result = list(changed_blobs(repository, None, repository.head.target))
+    assert len(result) == 9
+
+
+def test_warmer_warm(registry, repository):
+    from pyragit.warmer import Warmer
+
+    warmer = Warmer(registry)
+    head = repository.head.target
+    assert warmer.warm(repository, OLD_ID, head) == 2
+
+    oid = repository.revparse_single("HEAD:down/text-rendering.txt").id
+    expected = repository[oid].data.decode("utf-8").upper()
+    assert registry.render_cache.get(f"{oid.hex}:upper") == expected
+    assert len(registry.render_cache.memory) == 2
+    assert registry.history_index.head == head
+    assert head in registry.tree_snapshots.snapshots
+
+
+def test_warmer_check_only_warms_on_change(registry, mocker):
+    from pyragit.warmer import Warmer
+
+    warmer = Warmer(registry)
+    spy = mocker.spy(warmer, "warm")
+    warmer.check()
+    warmer.check()
+    assert spy.call_count == 1
+    assert warmer.head is not None
+
+
+def test_warmer_start_and_stop(registry):
+    from pyragit.warmer import Warmer
+
+    warmer = Warmer(registry, interval=0.01)
+    warmer.start()
+    assert warmer.head is not None
+    assert warmer._thread.is_alive()
+    warmer.stop()
+    assert not warmer._thread.is_alive()